@@ -569,6 +569,11 @@ class BotViewSet(viewsets.ModelViewSet):
                             'rerank_threshold': {'type': 'number', 'description': '重排文档阈值'},
                             'is_llm_rerank': {'type': 'boolean', 'description': '是否进行大模型重排操作'},
                             'namespace_list': {'type': 'array', 'items': {'type': 'string'}, 'description': '知识库ID列表'},
+                            'is_global_retrieve': {'type': 'boolean', 'description': '是否对多个知识库做全局统一排序检索'},
+                            'search_mode': {'type': 'string', 'enum': ['hybrid', 'vector'], 'description': '检索方式：hybrid(BM25+向量融合)/vector(纯向量)'},
+                            'hybrid_alpha': {'type': 'number', 'description': 'hybrid检索中向量的权重，0为纯BM25，1为纯向量'},
+                            'hybrid_fusion_type': {'type': 'string', 'enum': ['relative_score', 'ranked'], 'description': 'hybrid检索的融合方式'},
+                            'bm25_properties': {'type': 'array', 'items': {'type': 'string'}, 'description': '参与BM25的字段，如 title^2，为空时使用全部文本字段'},
                         }
                     },
                     'tool_config': {
@@ -583,6 +588,12 @@ class BotViewSet(viewsets.ModelViewSet):
                             'is_llm_rerank': {'type': 'boolean', 'description': '是否进行大模型重排操作'},
                             'max_iterations': {'type': 'integer', 'description': 'Agent的最大迭代次数'},
                             'namespace_list': {'type': 'array', 'items': {'type': 'string'}, 'description': '工具知识库ID列表'},
+                            'is_global_retrieve': {'type': 'boolean', 'description': '是否对多个工具知识库做全局统一排序检索'},
+                            'search_mode': {'type': 'string', 'enum': ['hybrid', 'vector'], 'description': '检索方式：hybrid(BM25+向量融合)/vector(纯向量)'},
+                            'hybrid_alpha': {'type': 'number', 'description': 'hybrid检索中向量的权重，0为纯BM25，1为纯向量'},
+                            'hybrid_fusion_type': {'type': 'string', 'enum': ['relative_score', 'ranked'], 'description': 'hybrid检索的融合方式'},
+                            'bm25_properties': {'type': 'array', 'items': {'type': 'string'}, 'description': '参与BM25的字段，如 title^2，为空时使用全部文本字段'},
+                            'is_local_index': {'type': 'boolean', 'description': '是否使用agent进程内的向量索引检索工具知识(纯向量)'},
                         }
                     }
                 }
@@ -728,6 +739,11 @@ class BotViewSet(viewsets.ModelViewSet):
                     "rerank_threshold": config_data.get('rag_config', {}).get('rerank_threshold', 0.4),
                     "is_llm_rerank": config_data.get('rag_config', {}).get('is_llm_rerank', True),
                     "namespace_list": config_data.get('rag_config', {}).get('namespace_list', []),
+                    "is_global_retrieve": config_data.get('rag_config', {}).get('is_global_retrieve', False),
+                    "search_mode": config_data.get('rag_config', {}).get('search_mode', 'hybrid'),
+                    "hybrid_alpha": config_data.get('rag_config', {}).get('hybrid_alpha', 0.75),
+                    "hybrid_fusion_type": config_data.get('rag_config', {}).get('hybrid_fusion_type', 'relative_score'),
+                    "bm25_properties": config_data.get('rag_config', {}).get('bm25_properties', []),
                     "is_structured_output": False
                 },
                 "tool_config": {
@@ -740,6 +756,12 @@ class BotViewSet(viewsets.ModelViewSet):
                     "is_llm_rerank": config_data.get('tool_config', {}).get('is_llm_rerank', True),
                     "max_iterations": config_data.get('tool_config', {}).get('max_iterations', 3),
                     "namespace_list": config_data.get('tool_config', {}).get('namespace_list', []),
+                    "is_global_retrieve": config_data.get('tool_config', {}).get('is_global_retrieve', False),
+                    "search_mode": config_data.get('tool_config', {}).get('search_mode', 'hybrid'),
+                    "hybrid_alpha": config_data.get('tool_config', {}).get('hybrid_alpha', 0.75),
+                    "hybrid_fusion_type": config_data.get('tool_config', {}).get('hybrid_fusion_type', 'relative_score'),
+                    "bm25_properties": config_data.get('tool_config', {}).get('bm25_properties', []),
+                    "is_local_index": config_data.get('tool_config', {}).get('is_local_index', False),
                 }
             }
         }
@@ -813,6 +835,11 @@ class BotViewSet(viewsets.ModelViewSet):
                     "rerank_threshold": 0.4,
                     "is_llm_rerank": False,
                     "namespace_list": [],
+                    "is_global_retrieve": False,
+                    "search_mode": "hybrid",
+                    "hybrid_alpha": 0.75,
+                    "hybrid_fusion_type": "relative_score",
+                    "bm25_properties": [],
                     "is_structured_output": False
                 },
                 "tool_config": {
@@ -825,6 +852,12 @@ class BotViewSet(viewsets.ModelViewSet):
                     "is_llm_rerank": False,
                     "max_iterations": 3,
                     "namespace_list": [],
+                    "is_global_retrieve": False,
+                    "search_mode": "hybrid",
+                    "hybrid_alpha": 0.75,
+                    "hybrid_fusion_type": "relative_score",
+                    "bm25_properties": [],
+                    "is_local_index": False,
                 },
                 "last_temperature": 0,
                 "last_max_tokens": 5120,
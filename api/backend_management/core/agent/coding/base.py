@@ -16,6 +16,7 @@ from langgraph.prebuilt import create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from pydantic import BaseModel, Field
 
+from core.models.compiled_code import bump_code_version
 from core.models.llm import llm as code_generation_llm
 
 
@@ -115,7 +116,7 @@ def extract_function_body(code_str: str, class_name: str, function_name: str) ->
     # 在类中查找目标函数
     target_function = None
     for item in target_class.body:
-        if isinstance(item, ast.FunctionDef) and item.name == function_name:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == function_name:
             target_function = item
             break
 
@@ -178,6 +179,8 @@ class CodeGeneration:
         function_code_mapping['__raw_code__'] = code_str
         # 把代码存储进入缓存。
         cache.set(key=redis_key, value=json.dumps(function_code_mapping), timeout=None)
+        # 各进程按版本号重新加载编译好的函数
+        bump_code_version(redis_key)
         return function_code_mapping
 
     def generation(self, user_demand, redis_key) -> tuple[bool, str]:
@@ -6,6 +6,13 @@ from langchain_core.embeddings import Embeddings
 # 如果有额外的导包需求不能在这里导入:比如requests等,在函数里面导入即可。
 
 class GlobalEmbedding(Embeddings):
+    def get_async_client(self):
+        \"""获取共享的httpx.AsyncClient连接池，运行时由系统提供，不要修改\"""
+        import httpx
+        if getattr(self, "_async_client", None) is None:
+            self._async_client = httpx.AsyncClient(timeout=60)
+        return self._async_client
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         \"""Embed search docs.
         返回内容示例：Response: [[0.5, 0.6, 0.7], [0.5, 0.6, 0.7], ...]
@@ -20,6 +27,18 @@ class GlobalEmbedding(Embeddings):
         # 如果要导包就在函数内部导包即可
         return self.embed_documents([text])[0]
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        \"""Asynchronous Embed search docs.
+        使用 client = self.get_async_client() 发送请求，不要自己创建或关闭客户端
+        \"""
+        # 如果要导包就在函数内部导包即可
+        return [[0.5, 0.6, 0.7] for _ in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        \"""Asynchronous Embed query text.\"""
+        # 如果要导包就在函数内部导包即可
+        return (await self.aembed_documents([text]))[0]
+
 
 embedding = GlobalEmbedding()
 
@@ -33,18 +52,30 @@ def test_case():
     # assert text_response is not None
     print("Status:", "ok")
     print("Response:", text_response)
+
+    async def _async_case():
+        async_texts_response = await embedding.aembed_documents(texts)
+        assert async_texts_response is not None
+        print("Async Response:", async_texts_response)
+        async_text_response = await embedding.aembed_query("What is Deep Learning?")
+        print("Async Response:", async_text_response)
+        await embedding.get_async_client().aclose()
+
+    import asyncio
+    asyncio.run(_async_case())
 """
 
 system_prompt_patch = """
 1.在这个案例中，单元测试用例直接使用代码模版里面的测试用例即可，没必要再去自己生成了。
-2.你只需要根据用户需求生成代码模版中的代码即可。你只需要在embed_documents，embed_query方法中实现对应的逻辑。其余内容不要去变更。不要加入__init__等方法。
+2.你只需要根据用户需求生成代码模版中的代码即可。你只需要在embed_documents，embed_query，aembed_documents，aembed_query方法中实现对应的逻辑。其余内容不要去变更(包括get_async_client)。不要加入__init__等方法。
 3.如果需要导包就在函数内部进行导包，而不是在最外侧去导包。因为我后续要通过反射的机制把里面的代码抽离出来存储在一个单独的地方，所以逻辑和环境的完整性需要保证，所以导包的信息要放在函数中。
 4.这是一个Embedding模型接入的场景，对接Embedding模型的方式的详细信息，你只需要帮忙实现对接的代码逻辑即可。
+5.aembed_documents，aembed_query是异步实现，HTTP请求必须使用 self.get_async_client() 返回的httpx.AsyncClient并await，不要使用requests等阻塞调用，也不要自己创建或关闭客户端。分批和并发由调用方处理，aembed_documents只需要一次请求处理传入的全部文本。
 """
 
 embedding_code_generator = CodeGeneration(
     code_template=code_template,
     system_prompt_patch=system_prompt_patch,
     to_extract_class_name="GlobalEmbedding",
-    to_extract_function_list=["embed_documents", "embed_query"]
+    to_extract_function_list=["embed_documents", "embed_query", "aembed_documents", "aembed_query"]
 )
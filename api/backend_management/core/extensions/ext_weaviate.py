@@ -1,15 +1,333 @@
+"""
+Weaviate客户端管理
+- 懒连接: 导入时不再握手，首次使用时才建立连接，进程/管理命令启动不依赖Weaviate
+- 连接池: 按并发数维护多个客户端(各自一个gRPC channel)，线程固定使用同一个客户端，
+  保证 batch / batch.failed_objects 等有状态的调用落在同一个连接上
+- 独占租用: 线程数多于客户端数时多个线程共用一个客户端，查询没有问题，但client.batch是客户端上的共享状态，
+  批量写入需要通过lease()独占一个客户端，租用期间当前线程的调用都落在该客户端上；
+  租用的客户端是单独的一组，不会分配给其他线程固定使用
+- 健康检查: 后台线程定期探活，失败的连接从池中换下，下次使用时透明重连；
+  换下的客户端等租用结束、且超过close_grace秒后才关闭，不会关闭正在使用的连接
+"""
+import itertools
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 import weaviate
+from weaviate import WeaviateClient
 
-weaviate_client = weaviate.connect_to_local(
-    host=os.getenv('WEAVIATE_HOST'),
-    port=int(os.getenv('WEAVIATE_PORT')),
-    grpc_port=int(os.getenv('WEAVIATE_GRPC_PORT')),
-    headers=None,
-    additional_config=None,
-    skip_init_checks=False,
-    auth_credentials=weaviate.auth.AuthApiKey(
-        api_key=os.getenv('WEAVIATE_API_KEY')
+from llm_api.settings.base import info_logger, warning_logger
+
+
+def _connect() -> WeaviateClient:
+    return weaviate.connect_to_local(
+        host=os.getenv('WEAVIATE_HOST'),
+        port=int(os.getenv('WEAVIATE_PORT')),
+        grpc_port=int(os.getenv('WEAVIATE_GRPC_PORT')),
+        headers=None,
+        additional_config=None,
+        skip_init_checks=True,
+        auth_credentials=weaviate.auth.AuthApiKey(
+            api_key=os.getenv('WEAVIATE_API_KEY')
+        )
     )
+
+
+class WeaviateClientManager:
+    """
+    Weaviate客户端连接池
+    """
+
+    def __init__(
+            self,
+            pool_size: int = 2,
+            health_check_interval: float = 30,
+            connect=_connect,
+            lease_pool_size: int = 2,
+            lease_timeout: float = 60,
+            close_grace: float = 30,
+    ):
+        """
+        :param pool_size: 线程固定使用的客户端数量，按进程内的并发线程数设置
+        :param health_check_interval: 健康检查间隔秒数，0表示不做后台检查
+        :param connect: 创建并连接客户端的函数
+        :param lease_pool_size: 供lease()独占租用的客户端数量，按并发批量写入数设置
+        :param lease_timeout: 等待空闲客户端的最长秒数，超时说明并发批量写入数超过了lease_pool_size
+        :param close_grace: 换下的客户端没有租用后再等待的秒数，留给其他线程正在进行的请求完成
+        """
+        self.pool_size = max(pool_size, 1)
+        self.lease_pool_size = max(lease_pool_size, 1)
+        self.health_check_interval = health_check_interval
+        self.lease_timeout = lease_timeout
+        self.close_grace = close_grace
+        self._connect = connect
+        # 前pool_size个槽位由线程固定使用，其余槽位只供租用
+        size = self.pool_size + self.lease_pool_size
+        self._clients: list[Optional[WeaviateClient]] = [None] * size
+        # 被健康检查换下、等待重连的槽位
+        self._dropped = [False] * size
+        self._slot_locks = [threading.Lock() for _ in range(size)]
+        self._slots = itertools.count()
+        self._free = self._new_free_slots()
+        # 换下待关闭的客户端 [(客户端, 换下时间)]，以及客户端id -> 租用数
+        self._retired: list[tuple[WeaviateClient, float]] = []
+        self._refs: dict[int, int] = {}
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._health_thread = None
+        self._health_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.connects = 0
+        self.reconnects = 0
+        self.connect_failures = 0
+        self.health_checks = 0
+        self.health_check_failures = 0
+        self.leases = 0
+        self.lease_timeouts = 0
+        self._latencies: list[Optional[float]] = [None] * size
+
+    def _check_fork(self):
+        # fork出的子进程不能复用父进程的gRPC channel，也没有父进程的健康检查线程
+        if self._pid == os.getpid():
+            return
+        with self._health_lock:
+            if self._pid == os.getpid():
+                return
+            self._clients = [None] * len(self._clients)
+            self._dropped = [False] * len(self._clients)
+            self._free = self._new_free_slots()
+            self._retired = []
+            self._refs = {}
+            self._local = threading.local()
+            self._health_thread = None
+            self._pid = os.getpid()
+
+    def _new_free_slots(self) -> queue.Queue:
+        free = queue.Queue()
+        for slot in range(self.pool_size, self.pool_size + self.lease_pool_size):
+            free.put(slot)
+        return free
+
+    def _slot(self) -> int:
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = next(self._slots) % self.pool_size
+            self._local.slot = slot
+        return slot
+
+    def _ensure_health_check(self):
+        if not self.health_check_interval:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        with self._health_lock:
+            if self._health_thread is not None and self._health_thread.is_alive():
+                return
+            self._stop.clear()
+            self._health_thread = threading.Thread(
+                target=self._run_health_check, name="weaviate-health-check", daemon=True
+            )
+            self._health_thread.start()
+
+    def get_client(self) -> WeaviateClient:
+        """获取当前线程绑定的客户端(租用期间为租用的客户端)，未连接或已断开时重新连接"""
+        self._check_fork()
+        leased = getattr(self._local, "leased", None)
+        if leased is not None:
+            return leased
+        return self._slot_client(self._slot())
+
+    def _slot_client(self, slot: int) -> WeaviateClient:
+        client = self._clients[slot]
+        if client is not None and client.is_connected():
+            return client
+        with self._slot_locks[slot]:
+            client = self._clients[slot]
+            if client is None or not client.is_connected():
+                client = self._reconnect(slot, client)
+        self._ensure_health_check()
+        return client
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[WeaviateClient]:
+        """
+        独占租用一个客户端，用于client.batch等有状态的批量操作
+        同一时刻每个客户端最多被一个线程租用；同一线程嵌套租用时复用已租用的客户端
+        租用期间固定使用同一个客户端对象，健康检查把它换下后也要等租用结束才关闭
+        :param timeout: 等待空闲客户端的秒数，默认lease_timeout
+        """
+        self._check_fork()
+        leased = getattr(self._local, "leased", None)
+        if leased is not None:
+            yield leased
+            return
+        free = self._free
+        try:
+            slot = free.get(timeout=self.lease_timeout if timeout is None else timeout)
+        except queue.Empty:
+            with self._stats_lock:
+                self.lease_timeouts += 1
+            raise RuntimeError(
+                f"等待空闲Weaviate客户端超时: {self.lease_pool_size}个客户端都在批量写入中，"
+                f"请调大WEAVIATE_LEASE_POOL_SIZE或减少并发写入线程"
+            )
+        try:
+            client = self._slot_client(slot)
+        except Exception:
+            free.put(slot)
+            raise
+        with self._stats_lock:
+            self.leases += 1
+            self._refs[id(client)] = self._refs.get(id(client), 0) + 1
+        self._local.leased = client
+        try:
+            yield client
+        finally:
+            self._local.leased = None
+            with self._stats_lock:
+                self._refs[id(client)] -= 1
+                if not self._refs[id(client)]:
+                    del self._refs[id(client)]
+            free.put(slot)
+            self._close_retired()
+
+    def _retire(self, client: WeaviateClient):
+        """换下客户端，等没有租用且超过close_grace后再关闭"""
+        with self._stats_lock:
+            self._retired.append((client, time.monotonic()))
+        self._close_retired()
+
+    def _close_retired(self, force: bool = False):
+        if not self._retired:
+            return
+        now = time.monotonic()
+        with self._stats_lock:
+            closable = [
+                client for client, retired_at in self._retired
+                if force or (id(client) not in self._refs and now - retired_at >= self.close_grace)
+            ]
+            closed = {id(client) for client in closable}
+            self._retired = [(client, retired_at) for client, retired_at in self._retired if id(client) not in closed]
+        for client in closable:
+            self._close(client)
+
+    def _reconnect(self, slot: int, old_client: Optional[WeaviateClient]) -> WeaviateClient:
+        if old_client is not None:
+            self._retire(old_client)
+        try:
+            client = self._connect()
+        except Exception:
+            with self._stats_lock:
+                self.connect_failures += 1
+            raise
+        reconnected = old_client is not None or self._dropped[slot]
+        with self._stats_lock:
+            self.connects += 1
+            if reconnected:
+                self.reconnects += 1
+        self._clients[slot] = client
+        self._dropped[slot] = False
+        if reconnected:
+            info_logger(f"Weaviate连接 {slot} 已重新建立")
+        return client
+
+    @staticmethod
+    def _close(client: WeaviateClient):
+        try:
+            client.close()
+        except Exception as e:
+            warning_logger(f"关闭Weaviate连接失败: {str(e)}")
+
+    def check_health(self) -> list[bool]:
+        """探活所有已建立的连接，失败的连接换下，下次使用时重连"""
+        self._check_fork()
+        results = []
+        for slot in range(len(self._clients)):
+            client = self._clients[slot]
+            if client is None:
+                results.append(False)
+                continue
+            start = time.perf_counter()
+            try:
+                live = client.is_live()
+            except Exception as e:
+                warning_logger(f"Weaviate连接 {slot} 健康检查失败: {str(e)}")
+                live = False
+            with self._stats_lock:
+                self.health_checks += 1
+                self._latencies[slot] = (time.perf_counter() - start) * 1000
+                if not live:
+                    self.health_check_failures += 1
+            if not live:
+                with self._slot_locks[slot]:
+                    if self._clients[slot] is client:
+                        self._clients[slot] = None
+                        self._dropped[slot] = True
+                        self._retire(client)
+            results.append(live)
+        self._close_retired()
+        return results
+
+    def _run_health_check(self):
+        while not self._stop.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                warning_logger(f"Weaviate健康检查异常: {str(e)}")
+
+    def close(self):
+        """关闭所有连接并停止健康检查"""
+        self._stop.set()
+        for slot in range(len(self._clients)):
+            with self._slot_locks[slot]:
+                client, self._clients[slot] = self._clients[slot], None
+            if client is not None:
+                self._close(client)
+        self._close_retired(force=True)
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            latencies = [round(latency, 2) if latency is not None else None for latency in self._latencies]
+            return {
+                "pool_size": self.pool_size,
+                "lease_pool_size": self.lease_pool_size,
+                "connected": sum(1 for client in self._clients if client is not None and client.is_connected()),
+                "connects": self.connects,
+                "reconnects": self.reconnects,
+                "connect_failures": self.connect_failures,
+                "health_checks": self.health_checks,
+                "health_check_failures": self.health_check_failures,
+                "leased": self.lease_pool_size - self._free.qsize(),
+                "retired": len(self._retired),
+                "leases": self.leases,
+                "lease_timeouts": self.lease_timeouts,
+                "health_check_latency_ms": latencies,
+            }
+
+
+class WeaviateClientProxy:
+    """
+    保持 `from core.extensions.ext_weaviate import weaviate_client` 的用法不变，
+    属性访问转发给当前线程绑定的客户端
+    """
+
+    def __init__(self, manager: WeaviateClientManager):
+        self._manager = manager
+
+    def __getattr__(self, item):
+        return getattr(self._manager.get_client(), item)
+
+
+weaviate_client_manager = WeaviateClientManager(
+    pool_size=int(os.getenv('WEAVIATE_POOL_SIZE', 2)),
+    health_check_interval=float(os.getenv('WEAVIATE_HEALTH_CHECK_INTERVAL', 30)),
+    lease_pool_size=int(os.getenv('WEAVIATE_LEASE_POOL_SIZE', 2)),
+    lease_timeout=float(os.getenv('WEAVIATE_LEASE_TIMEOUT', 60)),
+    close_grace=float(os.getenv('WEAVIATE_CLOSE_GRACE', 30)),
 )
+weaviate_client = WeaviateClientProxy(weaviate_client_manager)
@@ -0,0 +1,132 @@
+import threading
+
+import allure
+import pytest
+
+from core.extensions.ext_weaviate import WeaviateClientManager, WeaviateClientProxy
+
+
+def test_lazy_pool_and_reconnect():
+    manager = WeaviateClientManager(pool_size=2, health_check_interval=0)
+
+    with allure.step("创建时不建立连接"):
+        assert manager.get_stats()["connects"] == 0
+
+    with allure.step("同一线程固定使用同一个客户端"):
+        proxy = WeaviateClientProxy(manager)
+        assert proxy.is_ready()
+        client = manager.get_client()
+        assert manager.get_client() is client
+
+    with allure.step("不同线程分配到池中的不同客户端"):
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(manager.get_client()))
+        thread.start()
+        thread.join()
+        assert clients[0] is not client
+        assert manager.get_stats()["connects"] == 2
+
+    with allure.step("连接断开后透明重连"):
+        client.close()
+        assert proxy.collections.list_all() is not None
+        assert manager.get_client() is not client
+        assert manager.get_stats()["reconnects"] == 1
+
+    with allure.step("健康检查记录延迟"):
+        # 后两个供租用的客户端还没有连接
+        assert manager.check_health() == [True, True, False, False]
+        stats = manager.get_stats()
+        assert stats["health_checks"] == 2
+        assert all(latency is not None for latency in stats["health_check_latency_ms"])
+
+    manager.close()
+    assert manager.get_stats()["connected"] == 0
+
+
+class _FakeClient:
+    def __init__(self):
+        self.live = True
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    def is_live(self):
+        return self.live
+
+    def close(self):
+        self.closed = True
+
+
+def test_lease_is_exclusive():
+    manager = WeaviateClientManager(
+        pool_size=2, health_check_interval=0, connect=_FakeClient, lease_pool_size=2, lease_timeout=0.1
+    )
+
+    with allure.step("租用期间当前线程的调用都落在租用的客户端上，嵌套租用复用同一个"):
+        sticky = manager.get_client()
+        with manager.lease() as client:
+            assert manager.get_client() is client
+            assert client is not sticky
+            with manager.lease() as nested:
+                assert nested is client
+            assert manager.get_stats()["leased"] == 1
+
+    with allure.step("同一时刻每个客户端只被一个线程租用，全部租出后等待超时报错"):
+        leased, errors = [], []
+        holding = threading.Barrier(3)
+        release = threading.Event()
+
+        def hold():
+            with manager.lease() as client:
+                leased.append(client)
+                holding.wait()
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        holding.wait()
+        assert leased[0] is not leased[1]
+        # 租用的客户端不会分配给其他线程固定使用
+        sticky_clients = []
+        for _ in range(4):
+            thread = threading.Thread(target=lambda: sticky_clients.append(manager.get_client()))
+            thread.start()
+            thread.join()
+        assert not set(map(id, sticky_clients)) & set(map(id, leased))
+        with pytest.raises(RuntimeError):
+            with manager.lease():
+                pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        stats = manager.get_stats()
+        assert stats["leased"] == 0 and stats["leases"] == 3 and stats["lease_timeouts"] == 1
+
+    with allure.step("归还后可以再次租用"):
+        with manager.lease(timeout=0) as client:
+            assert client in leased
+    manager.close()
+
+
+def test_health_check_defers_closing_leased_client():
+    manager = WeaviateClientManager(
+        pool_size=1, health_check_interval=0, connect=_FakeClient, lease_pool_size=1, close_grace=0
+    )
+
+    with allure.step("租用中的客户端探活失败时只换下，租用结束后才关闭"):
+        with manager.lease() as client:
+            client.live = False
+            manager.check_health()
+            assert not client.closed
+            assert manager.get_client() is client
+            assert manager.get_stats()["retired"] == 1
+        assert client.closed
+        assert manager.get_stats()["retired"] == 0
+
+    with allure.step("再次租用时重新连接"):
+        with manager.lease() as new_client:
+            assert new_client is not client and not new_client.closed
+        assert manager.get_stats()["reconnects"] == 1
+    manager.close()
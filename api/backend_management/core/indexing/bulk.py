@@ -0,0 +1,263 @@
+"""
+命名空间级批量重建索引
+流水线: 流式读取文档 -> 进程池切块/哈希 -> 跨文档攒批Embedding -> 大批量写入Weaviate
+语义切分需要调用Embedding，改在主进程的线程池中切块，经过进程内的缓存和合并请求的批处理器，
+不在子进程里使用fork继承来的客户端
+每个阶段的在途任务数都有上限，写入成功后记录检查点，中断后可从检查点继续
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from langchain_core.documents import Document
+from langchain_core.indexing.api import _delete
+
+from core.indexing.de_duplication import de_duplicator
+from core.indexing.index import hash_documents, split_document
+from core.utils.vector_store import get_vector_store, notify_knowledge_changed
+
+
+def _split_and_hash(
+        document_id: str,
+        doc: Document,
+        knowledge_type: str,
+        chunk_strategy: str = "recursive",
+) -> tuple[str, list[tuple[str, Document]]]:
+    """
+    切块进程(语义切分时为主进程的线程)中执行: 切块并计算内容哈希
+    :return: (文章id, [(切块uid, 切块文档)])
+    """
+    hashed_docs = hash_documents(
+        split_document(doc, knowledge_type=knowledge_type, chunk_strategy=chunk_strategy)
+    )
+    return document_id, [(hashed_doc.uid, hashed_doc.to_document()) for hashed_doc in hashed_docs]
+
+
+@dataclass
+class BulkIndexStats:
+    """批量索引统计"""
+    docs: int = 0
+    chunks: int = 0
+    added: int = 0
+    deleted: int = 0
+    batches: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started_at, 1e-6)
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.docs / self.elapsed
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            "docs": self.docs,
+            "chunks": self.chunks,
+            "added": self.added,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "elapsed": round(self.elapsed, 3),
+            "docs_per_sec": round(self.docs_per_sec, 2),
+            "chunks_per_sec": round(self.chunks_per_sec, 2),
+        }
+
+    def __str__(self):
+        return (
+            f"docs={self.docs}, chunks={self.chunks}, added={self.added}, deleted={self.deleted}, "
+            f"{self.docs_per_sec:.1f} docs/s, {self.chunks_per_sec:.1f} chunks/s"
+        )
+
+
+@dataclass
+class _WriteBatch:
+    """一次写入Weaviate的批次，可跨多篇文章"""
+    docs: list[Document] = field(default_factory=list)
+    ids: list[str] = field(default_factory=list)
+    delete_ids: list[str] = field(default_factory=list)
+    # (文章id, 新增的切块uid, 删除的切块uid), 写入成功后再同步到去重集合
+    source_updates: list[tuple[str, list[str], list[str]]] = field(default_factory=list)
+    doc_count: int = 0
+    chunk_count: int = 0
+    last_document_id: Optional[str] = None
+
+    def __len__(self):
+        return len(self.ids) + len(self.delete_ids)
+
+
+class BulkIndexer:
+    """
+    命名空间级批量索引器
+    文档需按id升序输入，检查点记录最后一篇完整写入的文章id
+    """
+
+    def __init__(
+            self,
+            tenant: str,
+            namespace: str,
+            knowledge_type: str = "common",
+            chunk_strategy: str = "recursive",
+            split_workers: Optional[int] = None,
+            write_workers: int = 2,
+            write_batch_size: int = 256,
+            max_inflight_splits: int = 64,
+            report_every: int = 200,
+            progress_callback: Optional[Callable[[BulkIndexStats], None]] = None,
+    ):
+        """
+        :param tenant: 租户id
+        :param namespace: 命名空间id
+        :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+        :param chunk_strategy: 常规知识切分策略：recursive / semantic
+        :param split_workers: 切块进程数(语义切分时为线程数)，默认CPU核数
+        :param write_workers: 并发写入线程数
+        :param write_batch_size: 每批写入的切块数(同时是一次Embedding调用的文本数)
+        :param max_inflight_splits: 在途切块任务上限
+        :param report_every: 每处理多少篇文章回调一次进度
+        :param progress_callback: 进度回调
+        """
+        self.tenant = tenant
+        self.namespace = namespace
+        self.knowledge_type = knowledge_type
+        self.chunk_strategy = chunk_strategy
+        self.split_workers = split_workers or os.cpu_count() or 1
+        self.write_workers = max(write_workers, 1)
+        self.write_batch_size = write_batch_size
+        self.max_inflight_splits = max(max_inflight_splits, 1)
+        self.report_every = report_every
+        self.progress_callback = progress_callback
+        self.vector_store = get_vector_store(
+            tenant=tenant,
+            namespace=namespace,
+            knowledge_type=knowledge_type
+        )
+        self.stats = BulkIndexStats()
+
+    @property
+    def refs_key(self) -> str:
+        return de_duplicator.refs_key(self.namespace, self.knowledge_type)
+
+    @property
+    def checkpoint_key(self) -> str:
+        return f"bulk_index_checkpoint:{self.knowledge_type}:{self.namespace}"
+
+    def get_checkpoint(self) -> Optional[str]:
+        """获取最后一篇完整写入的文章id"""
+        return de_duplicator.redis_client.get(self.checkpoint_key)
+
+    def reset_checkpoint(self):
+        de_duplicator.redis_client.delete(self.checkpoint_key)
+
+    def _save_checkpoint(self, document_id: str):
+        de_duplicator.redis_client.set(self.checkpoint_key, document_id)
+
+    def _write(self, batch: _WriteBatch) -> _WriteBatch:
+        """写入线程中执行: add_documents对整批文本只调用一次embed_documents"""
+        if batch.docs:
+            self.vector_store.add_documents(
+                batch.docs,
+                ids=batch.ids,
+                batch_size=self.write_batch_size,
+            )
+        if batch.delete_ids:
+            _delete(self.vector_store, batch.delete_ids)
+        return batch
+
+    def _commit(self, batch: _WriteBatch):
+        """写入成功后同步去重集合和检查点，按提交顺序调用以保证检查点单调"""
+        for document_id, to_add_ids, to_delete_ids in batch.source_updates:
+            de_duplicator.update_source_ids(
+                document_id=document_id,
+                to_add_ids=to_add_ids,
+                to_delete_ids=to_delete_ids,
+                refs_key=self.refs_key,
+            )
+        if batch.last_document_id is not None:
+            self._save_checkpoint(batch.last_document_id)
+        self.stats.added += len(batch.ids)
+        self.stats.deleted += len(batch.delete_ids)
+        self.stats.batches += 1
+
+    def _report(self, force: bool = False):
+        if self.progress_callback and (force or self.stats.docs % self.report_every == 0):
+            self.progress_callback(self.stats)
+
+    def run(self, documents: Iterable[tuple[str, Document]]) -> BulkIndexStats:
+        """
+        执行批量索引
+        :param documents: 按文章id升序的 (文章id, 源文档) 流
+        :return: 统计信息
+        """
+        self.stats = BulkIndexStats()
+        pending_splits: deque[Future] = deque()
+        pending_writes: deque[Future] = deque()
+        batch = _WriteBatch()
+
+        # 语义切分是Embedding调用密集的IO任务，用线程在主进程执行，递归切分是纯CPU任务，用进程池
+        semantic = self.knowledge_type == "common" and self.chunk_strategy == "semantic"
+        split_executor = ThreadPoolExecutor if semantic else ProcessPoolExecutor
+        with split_executor(max_workers=self.split_workers) as split_pool, \
+                ThreadPoolExecutor(max_workers=self.write_workers) as write_pool:
+
+            def flush():
+                nonlocal batch
+                if batch.doc_count == 0:
+                    return
+                pending_writes.append(write_pool.submit(self._write, batch))
+                batch = _WriteBatch()
+                # 限制在途写入批次，避免内存无限增长
+                while len(pending_writes) > self.write_workers:
+                    self._commit(pending_writes.popleft().result())
+
+            def consume(split_future: Future):
+                document_id, hashed_chunks = split_future.result()
+                source_ids = [uid for uid, _ in hashed_chunks]
+                to_add_ids, to_delete_ids = de_duplicator.get_to_update_and_to_delete_doc_ids(
+                    document_id=document_id,
+                    source_ids=source_ids,
+                )
+                for uid, chunk in hashed_chunks:
+                    if uid in to_add_ids:
+                        batch.docs.append(chunk)
+                        batch.ids.append(uid)
+                # 仍被其他文章引用的切块不从向量库删除
+                batch.delete_ids.extend(set(to_delete_ids) - de_duplicator.get_shared_ids(to_delete_ids, self.refs_key))
+                batch.source_updates.append((document_id, list(to_add_ids), list(to_delete_ids)))
+                batch.doc_count += 1
+                batch.chunk_count += len(hashed_chunks)
+                batch.last_document_id = document_id
+                self.stats.docs += 1
+                self.stats.chunks += len(hashed_chunks)
+                if len(batch) >= self.write_batch_size:
+                    flush()
+                self._report()
+
+            for document_id, doc in documents:
+                pending_splits.append(
+                    split_pool.submit(
+                        _split_and_hash, str(document_id), doc, self.knowledge_type, self.chunk_strategy
+                    )
+                )
+                # 按提交顺序消费切块结果，保证检查点按文章id推进
+                while len(pending_splits) >= self.max_inflight_splits:
+                    consume(pending_splits.popleft())
+            while pending_splits:
+                consume(pending_splits.popleft())
+            flush()
+            while pending_writes:
+                self._commit(pending_writes.popleft().result())
+
+        # 全量完成后清理检查点，下次从头开始
+        self.reset_checkpoint()
+        if self.stats.added or self.stats.deleted:
+            notify_knowledge_changed(self.namespace, self.knowledge_type)
+        self._report(force=True)
+        return self.stats
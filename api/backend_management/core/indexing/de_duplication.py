@@ -2,6 +2,63 @@ import os
 
 import redis
 
+# 单次往返完成整篇文章的差异计算: KEYS[1]为文章的切块id集合, ARGV为本次全部切块id
+# 返回 {新增id列表, 删除id列表}
+_DIFF_SCRIPT = """
+local existing = redis.call('SMEMBERS', KEYS[1])
+local existing_set = {}
+for _, id in ipairs(existing) do
+    existing_set[id] = true
+end
+local incoming_set = {}
+local to_add = {}
+for _, id in ipairs(ARGV) do
+    if not incoming_set[id] then
+        incoming_set[id] = true
+        if not existing_set[id] then
+            table.insert(to_add, id)
+        end
+    end
+end
+local to_delete = {}
+for _, id in ipairs(existing) do
+    if not incoming_set[id] then
+        table.insert(to_delete, id)
+    end
+end
+return {to_add, to_delete}
+"""
+
+# 切块uid只由内容决定，同一collection中不同文章的相同切块是同一个对象
+# KEYS[2]为collection内 切块id -> 引用它的文章数 的hash，只对集合中实际增删的id计数
+# KEYS[1]为文章的切块id集合, ARGV[1]为新增id数量, 其后依次是新增id和删除id
+_UPDATE_SCRIPT = """
+local add_count = tonumber(ARGV[1])
+for i = 2, #ARGV do
+    local id = ARGV[i]
+    if i <= add_count + 1 then
+        if redis.call('SADD', KEYS[1], id) == 1 then
+            redis.call('HINCRBY', KEYS[2], id, 1)
+        end
+    elseif redis.call('SREM', KEYS[1], id) == 1 then
+        if redis.call('HINCRBY', KEYS[2], id, -1) <= 0 then
+            redis.call('HDEL', KEYS[2], id)
+        end
+    end
+end
+return 1
+"""
+
+# 删除文章的切块id集合，并释放它对每个切块的引用
+_DELETE_SCRIPT = """
+for _, id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    if redis.call('HINCRBY', KEYS[2], id, -1) <= 0 then
+        redis.call('HDEL', KEYS[2], id)
+    end
+end
+return redis.call('DEL', KEYS[1])
+"""
+
 
 class DeDuplication:
     _instance = None
@@ -26,38 +83,87 @@ class DeDuplication:
                 password=None,
                 decode_responses=True
             )
+            self._diff_script = self.redis_client.register_script(_DIFF_SCRIPT)
+            self._update_script = self.redis_client.register_script(_UPDATE_SCRIPT)
+            self._delete_script = self.redis_client.register_script(_DELETE_SCRIPT)
+
+    @staticmethod
+    def refs_key(namespace, knowledge_type):
+        """collection内切块引用计数的key"""
+        return f"source_refs:{knowledge_type}:{namespace}"
 
     def get_to_update_and_to_delete_doc_ids(
             self,
             document_id,
             source_ids
     ):
-        # 获取 Redis 中存储的集合
-        existing_ids = self.redis_client.smembers(document_id)
-        # 计算新增的 ID
-        to_add_ids = set(source_ids) - existing_ids
-        # 计算需要删除的 ID
-        to_delete_ids = existing_ids - set(source_ids)
-        return to_add_ids, to_delete_ids
+        """
+        计算文章的新增/删除切块id
+        source_ids必须是整篇文章的全部切块id，只传一个批次会把其余批次的切块误判为删除
+        """
+        if not source_ids:
+            # 文章切块为空时，已有切块全部删除
+            return set(), self.redis_client.smembers(document_id)
+        # 在Redis服务端一次完成差异计算，不再拉取整个集合到本地
+        to_add_ids, to_delete_ids = self._diff_script(keys=[document_id], args=list(source_ids))
+        return set(to_add_ids), set(to_delete_ids)
+
+    def get_existing_ids(
+            self,
+            document_id,
+            source_ids
+    ):
+        """一次SMISMEMBER判断一批切块id是否已存在，流式索引按批次调用"""
+        source_ids = list(source_ids)
+        if not source_ids:
+            return set()
+        flags = self.redis_client.smismember(document_id, source_ids)
+        return {source_id for source_id, flag in zip(source_ids, flags) if flag}
 
     def update_source_ids(
             self,
             document_id,
             to_add_ids,
-            to_delete_ids
+            to_delete_ids,
+            refs_key=None,
     ):
-        # 使用pipeline批量操作以优化IO
-        with self.redis_client.pipeline() as pipeline:
+        """
+        同步文章的切块id集合
+        :param refs_key: 传入时同时维护collection内的切块引用计数
+        """
+        if refs_key is not None:
+            to_add_ids, to_delete_ids = list(to_add_ids), list(to_delete_ids)
+            if to_add_ids or to_delete_ids:
+                self._update_script(
+                    keys=[document_id, refs_key], args=[len(to_add_ids), *to_add_ids, *to_delete_ids]
+                )
+            return
+        # 使用MULTI事务pipeline，新增和删除原子生效
+        with self.redis_client.pipeline(transaction=True) as pipeline:
             if to_add_ids:
                 pipeline.sadd(document_id, *to_add_ids)
             if to_delete_ids:
                 pipeline.srem(document_id, *to_delete_ids)
             pipeline.execute()
 
-    def delete(self, document_id):
-        # 删除指定的集合
+    def delete(self, document_id, refs_key=None):
+        # 删除指定的集合，传入refs_key时同时释放引用计数
+        if refs_key is not None:
+            self._delete_script(keys=[document_id, refs_key])
+            return
         self.redis_client.delete(document_id)
 
+    def get_shared_ids(self, source_ids, refs_key):
+        """
+        找出除当前文章外仍被其他文章引用的切块id，这些切块不能从向量库删除
+        当前文章自己计1次引用，计数大于1即被共享；没有计数的历史数据按未共享处理
+        """
+        source_ids = list(source_ids)
+        if not source_ids:
+            return set()
+        counts = self.redis_client.hmget(refs_key, source_ids)
+        return {source_id for source_id, count in zip(source_ids, counts) if count and int(count) > 1}
+
     def get_all_source_ids(self, document_id):
         # 获取所有的 source_ids
         return self.redis_client.smembers(document_id)
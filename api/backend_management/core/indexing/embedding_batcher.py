@@ -0,0 +1,191 @@
+"""
+跨请求合并的Embedding批处理器
+并发的index()调用各自只有几个切块，直接调用Embedding服务会产生大量小请求。
+这里把等待中的文本在max_wait_ms内(或达到max_batch_size时)合并成一次embed_documents调用，再把向量按调用方拆分返回。
+分发线程只负责凑批，凑好的批交给线程池发送，最多max_inflight个请求同时进行；在途请求已满时分发线程等待，
+期间到达的文本继续排队，下一批会更满。
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from langchain_core.embeddings import Embeddings
+
+from core.models.embedding import embedding
+
+
+@dataclass
+class _EmbeddingRequest:
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class CoalescingEmbeddingBatcher(Embeddings):
+    """
+    合并并发embed_documents调用的Embedding包装器
+    embed_query为检索链路的单条请求，直接透传不排队；异步接口也直接透传
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            max_batch_size: int = 256,
+            max_wait_ms: float = 10,
+            max_inflight: int = 4,
+    ):
+        """
+        :param embeddings: 实际执行Embedding的模型
+        :param max_batch_size: 单次合并的最大文本数
+        :param max_wait_ms: 首个请求入队后最多等待的毫秒数
+        :param max_inflight: 同时发往Embedding服务的最大请求数
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_inflight = max(max_inflight, 1)
+        self._executor = None
+        self._inflight = threading.BoundedSemaphore(self.max_inflight)
+        self._queue: queue.Queue[_EmbeddingRequest] = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def _ensure_worker(self):
+        # 懒启动；fork出的子进程没有父进程的线程，需要重新启动
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_inflight, thread_name_prefix="embedding-batcher-send"
+                )
+                self._inflight = threading.BoundedSemaphore(self.max_inflight)
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        self._ensure_worker()
+        request = _EmbeddingRequest(texts=list(texts))
+        self._queue.put(request)
+        return request.future.result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        # 异步调用方之间本身是并发的，直接使用模型的异步批处理，不经过分发线程
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.embeddings.aembed_query(text)
+
+    def _collect(self) -> list[_EmbeddingRequest]:
+        """阻塞等待首个请求，然后在时间窗口内尽量凑满一批"""
+        first = self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # 在途请求已满时在这里等待，不再凑新批
+            self._inflight.acquire()
+            try:
+                self._executor.submit(self._send, batch)
+            except Exception as e:
+                self._inflight.release()
+                for request in batch:
+                    request.future.set_exception(e)
+
+    def _send(self, batch: list[_EmbeddingRequest]):
+        """线程池中执行: 发送一批文本并把向量按调用方拆分"""
+        try:
+            dispatched_at = time.monotonic()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+            self._record(batch, len(texts), dispatched_at)
+        finally:
+            self._inflight.release()
+
+    def _record(self, batch: list[_EmbeddingRequest], size: int, dispatched_at: float):
+        waits = [dispatched_at - request.enqueued_at for request in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._texts += size
+            self._fill_sum += min(size / self.max_batch_size, 1.0)
+            self._wait_sum += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._batches = 0
+            self._requests = 0
+            self._texts = 0
+            self._fill_sum = 0.0
+            self._wait_sum = 0.0
+            self._wait_max = 0.0
+
+    def get_stats(self) -> dict:
+        """
+        批处理指标
+        fill_ratio: 平均每批文本数 / max_batch_size
+        queue_wait: 请求从入队到发往Embedding服务的等待时间
+        """
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "texts": self._texts,
+                "avg_batch_size": round(self._texts / batches, 2),
+                "avg_requests_per_batch": round(self._requests / batches, 2),
+                "avg_fill_ratio": round(self._fill_sum / batches, 4),
+                "avg_queue_wait_ms": round(self._wait_sum / requests * 1000, 3),
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_inflight": self.max_inflight,
+            }
+
+
+embedding_batcher = CoalescingEmbeddingBatcher(
+    embeddings=embedding,
+    max_batch_size=int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 256)),
+    max_wait_ms=float(os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 10)),
+    max_inflight=int(os.getenv('EMBEDDING_BATCH_MAX_INFLIGHT', 4)),
+)
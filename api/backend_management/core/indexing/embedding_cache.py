@@ -0,0 +1,214 @@
+"""
+按切块内容哈希缓存Embedding向量
+缓存键为 (Embedding配置指纹, 内容哈希)，与 _HashedDocument 使用相同的 _hash_string_to_uuid，
+不同文档/命名空间/重复导入中的相同切块只会请求一次Embedding服务。
+
+Redis结构:
+    embedding_cache:{fingerprint}        hash, field为 d:{content_hash}(文档) / q:{content_hash}(查询), value为float32字节
+    embedding_cache:{fingerprint}:lru    zset, 最近访问时间，超过max_entries时淘汰最久未访问的向量
+"""
+import asyncio
+import hashlib
+import os
+import time
+from array import array
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.indexing.api import _hash_string_to_uuid
+
+from core.extensions.ext_redis import redis_client
+from core.indexing.embedding_batcher import embedding_batcher
+from core.models.embedding import global_embedding_code
+from llm_api.settings.base import warning_logger
+
+CACHE_PREFIX = "embedding_cache"
+
+
+def global_embedding_fingerprint() -> str:
+    """
+    全局Embedding代码的指纹，代码变化后旧缓存自动失效
+    直接使用当前进程编译代码时的内容哈希，指纹与实际执行的代码一致，也不用每次读取缓存
+    """
+    try:
+        return global_embedding_code.get().content_hash
+    except ValueError:
+        return hashlib.sha1(b"").hexdigest()[:16]
+
+
+def _pack(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(data: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class CachedEmbedding(Embeddings):
+    """
+    带内容哈希缓存的Embedding包装器
+    缓存不可用时直接回退到实际的Embedding模型
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            client,
+            fingerprint: Callable[[], str],
+            max_entries: int = 500000,
+    ):
+        """
+        :param embeddings: 实际执行Embedding的模型
+        :param client: Redis客户端(decode_responses=False)
+        :param fingerprint: 返回当前Embedding配置指纹的函数
+        :param max_entries: 单个指纹下最多缓存的向量数
+        """
+        self.embeddings = embeddings
+        self.client = client
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _keys(fingerprint: str) -> tuple[str, str]:
+        data_key = f"{CACHE_PREFIX}:{fingerprint}"
+        return data_key, f"{data_key}:lru"
+
+    def _lookup(self, fields: list[str], fingerprint: str) -> list[Optional[bytes]]:
+        data_key, _ = self._keys(fingerprint)
+        try:
+            return self.client.hmget(data_key, fields)
+        except Exception as e:
+            warning_logger(f"读取Embedding缓存失败: {str(e)}")
+            return [None] * len(fields)
+
+    def _store(self, hit_fields: list[str], new_vectors: dict[str, list[float]], fingerprint: str):
+        data_key, lru_key = self._keys(fingerprint)
+        now = time.time()
+        try:
+            with self.client.pipeline(transaction=False) as pipeline:
+                if new_vectors:
+                    pipeline.hset(data_key, mapping={field: _pack(vector) for field, vector in new_vectors.items()})
+                touched = hit_fields + list(new_vectors)
+                if touched:
+                    pipeline.zadd(lru_key, {field: now for field in touched})
+                pipeline.zcard(lru_key)
+                size = pipeline.execute()[-1]
+            if size > self.max_entries:
+                self._evict(data_key, lru_key, size - self.max_entries)
+        except Exception as e:
+            warning_logger(f"写入Embedding缓存失败: {str(e)}")
+
+    def _evict(self, data_key: str, lru_key: str, count: int):
+        """淘汰最久未访问的向量"""
+        evicted = [member for member, _ in self.client.zpopmin(lru_key, count)]
+        if evicted:
+            self.client.hdel(data_key, *evicted)
+
+    @staticmethod
+    def _fields(texts: list[str], kind: str) -> list[str]:
+        return [f"{kind}:{_hash_string_to_uuid(text)}" for text in texts]
+
+    @staticmethod
+    def _partition(texts: list[str], fields: list[str], cached: list[Optional[bytes]]):
+        """
+        按缓存结果拆分
+        :return: (已命中的向量(未命中为None), 命中的字段, {未命中字段: 文本})
+        """
+        vectors: list[Optional[list[float]]] = [None] * len(texts)
+        hit_fields = []
+        missing: dict[str, str] = {}  # field -> text, 同一批次中重复的文本只请求一次
+        for i, (field, data) in enumerate(zip(fields, cached)):
+            if data is not None:
+                vectors[i] = _unpack(data)
+                hit_fields.append(field)
+            else:
+                missing.setdefault(field, texts[i])
+        return vectors, hit_fields, missing
+
+    def _fill(self, fields, vectors, hit_fields, missing, embedded) -> dict[str, list[float]]:
+        new_vectors = dict(zip(missing.keys(), embedded))
+        for i, field in enumerate(fields):
+            if vectors[i] is None:
+                vectors[i] = new_vectors[field]
+        self.hits += len(hit_fields)
+        self.misses += len(missing)
+        return new_vectors
+
+    def _embed(self, texts: list[str], kind: str, embed_fn: Callable[[list[str]], list[list[float]]]):
+        fingerprint = self.fingerprint()
+        fields = self._fields(texts, kind)
+        vectors, hit_fields, missing = self._partition(texts, fields, self._lookup(fields, fingerprint))
+        embedded = embed_fn(list(missing.values())) if missing else []
+        new_vectors = self._fill(fields, vectors, hit_fields, missing, embedded)
+        self._store(hit_fields, new_vectors, fingerprint)
+        return vectors
+
+    async def _aembed(
+            self,
+            texts: list[str],
+            kind: str,
+            embed_fn: Callable[[list[str]], Awaitable[list[list[float]]]],
+    ):
+        """异步版本，Redis读写放到线程中执行，不阻塞事件循环"""
+        fingerprint = self.fingerprint()
+        fields = self._fields(texts, kind)
+        cached = await asyncio.to_thread(self._lookup, fields, fingerprint)
+        vectors, hit_fields, missing = self._partition(texts, fields, cached)
+        embedded = await embed_fn(list(missing.values())) if missing else []
+        new_vectors = self._fill(fields, vectors, hit_fields, missing, embedded)
+        await asyncio.to_thread(self._store, hit_fields, new_vectors, fingerprint)
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self._embed(texts, "d", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], "q", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return await self._aembed(texts, "d", self.embeddings.aembed_documents)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        async def _embed(texts: list[str]) -> list[list[float]]:
+            return [await self.embeddings.aembed_query(texts[0])]
+
+        return (await self._aembed([text], "q", _embed))[0]
+
+    def invalidate(self, fingerprint: Optional[str] = None) -> int:
+        """
+        清空缓存
+        :param fingerprint: 只清空指定指纹，默认清空全部
+        :return: 删除的key数量
+        """
+        pattern = f"{CACHE_PREFIX}:{fingerprint}*" if fingerprint else f"{CACHE_PREFIX}:*"
+        keys = list(self.client.scan_iter(match=pattern, count=1000))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        _, lru_key = self._keys(self.fingerprint())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": self.client.zcard(lru_key),
+            "max_entries": self.max_entries,
+        }
+
+
+cached_embedding = CachedEmbedding(
+    embeddings=embedding_batcher,
+    client=redis_client,
+    fingerprint=global_embedding_fingerprint,
+    max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 500000)),
+)
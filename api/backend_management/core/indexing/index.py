@@ -1,14 +1,15 @@
+from functools import lru_cache
 from itertools import islice
 from typing import Iterable, Iterator, TypeVar, Optional, Any, cast
 
 from langchain_core.documents import Document
 from langchain_core.indexing.api import _hash_string_to_uuid, _delete
 from pydantic import model_validator
+from weaviate.classes.query import Filter
 
-from core.extensions.ext_weaviate import weaviate_client
 from core.indexing.de_duplication import de_duplicator
-from core.indexing.splitter import split_docs, split_tools
-from core.utils.vector_store import get_vector_store
+from core.indexing.splitter import iter_split_docs, split_docs, split_docs_semantic, split_tools
+from core.utils.vector_store import collection_exists, get_collection, get_vector_store, notify_knowledge_changed
 
 T = TypeVar("T")
 
@@ -37,6 +38,12 @@ def _deduplicate_in_order(
             yield hashed_doc
 
 
+@lru_cache(maxsize=65536)
+def _content_hash(content: str) -> str:
+    """切块内容哈希，未变化段落的切块直接命中缓存"""
+    return str(_hash_string_to_uuid(content))
+
+
 class _HashedDocument(Document):
     """A hashed document with a unique ID."""
 
@@ -69,7 +76,7 @@ class _HashedDocument(Document):
                 )
                 raise ValueError(msg)
 
-        content_hash = str(_hash_string_to_uuid(content))
+        content_hash = _content_hash(content)
 
         values["content_hash"] = content_hash
         values['metadata_hash'] = ''
@@ -102,6 +109,48 @@ class _HashedDocument(Document):
         )
 
 
+def split_document(
+        doc: Document,
+        knowledge_type: str = "common",
+        chunk_strategy: str = "recursive",
+) -> list[Document]:
+    """
+    按知识类型切分源文档
+    :param doc: 源markdown文档
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :param chunk_strategy: 常规知识切分策略：recursive固定窗口递归切分 / semantic语义切分
+    :return: 切块后的文档列表
+    """
+    if knowledge_type == "common" and chunk_strategy == "semantic":
+        from core.indexing.embedding_cache import cached_embedding
+        return split_docs_semantic(
+            markdown_documents=[doc],
+            embeddings=cached_embedding,
+        )
+    if knowledge_type == "common":
+        return split_docs(
+            markdown_documents=[doc]
+        )
+    elif knowledge_type == "tool":
+        return split_tools(
+            tool_doc=doc
+        )
+    raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+
+
+def hash_documents(docs: Iterable[Document]) -> list[_HashedDocument]:
+    """
+    计算切块的内容哈希并按顺序去重
+    :param docs: 切块后的文档
+    :return: 带uid的哈希文档列表
+    """
+    return list(
+        _deduplicate_in_order(
+            [_HashedDocument.from_document(doc) for doc in docs]
+        )
+    )
+
+
 def index(
         document_id: str,
         tenant: str,
@@ -109,6 +158,8 @@ def index(
         doc: Document,
         batch_size: int = 100,
         knowledge_type: str = "common",
+        streaming: bool = False,
+        chunk_strategy: str = "recursive",
 ):
     """
     内容新增+内容更新
@@ -118,67 +169,131 @@ def index(
     :param doc: 源markdown文档
     :param batch_size: 吞吐量
     :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :param streaming: 流式切分，超大文档的内存峰值只与batch_size相关(仅recursive策略)
+    :param chunk_strategy: 常规知识切分策略：recursive固定窗口递归切分 / semantic语义切分
     :return:
     """
-    if knowledge_type == "common":
-        docs_source = split_docs(
-            markdown_documents=[doc]
-        )
-    elif knowledge_type == "tool":
-        docs_source = split_tools(
-            tool_doc=doc
-        )
-    else:
-        raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
     vector_store = get_vector_store(
         tenant=tenant,
         namespace=namespace,
         knowledge_type=knowledge_type
     )
-
-    doc_iterator = iter(docs_source)
-    all_to_add_ids = []
-    all_to_delete_ids = []
-    for doc_batch in _batch(batch_size, doc_iterator):
-        hashed_docs = list(
-            _deduplicate_in_order(
-                [_HashedDocument.from_document(doc) for doc in doc_batch]
-            )
+    refs_key = de_duplicator.refs_key(namespace, knowledge_type)
+    if streaming and knowledge_type == "common" and chunk_strategy == "recursive":
+        all_to_add_ids, all_to_delete_ids = _index_streaming(document_id, doc, vector_store, batch_size, refs_key)
+    else:
+        all_to_add_ids, all_to_delete_ids = _index(
+            document_id, doc, vector_store, batch_size, knowledge_type, chunk_strategy, refs_key
         )
-        source_ids = [
-            doc.uid for doc in hashed_docs
-        ]
-        to_add_ids, to_delete_ids = de_duplicator.get_to_update_and_to_delete_doc_ids(
-            document_id=document_id,
-            source_ids=source_ids,
+    if all_to_add_ids or all_to_delete_ids:
+        notify_knowledge_changed(namespace, knowledge_type)
+    return all_to_add_ids, all_to_delete_ids
+
+
+def _index(
+        document_id: str,
+        doc: Document,
+        vector_store,
+        batch_size: int,
+        knowledge_type: str,
+        chunk_strategy: str,
+        refs_key: str,
+):
+    """整篇切分后与Redis中的切块集合做一次差异，写入新增切块并删除旧切块"""
+    docs_source = split_document(doc, knowledge_type=knowledge_type, chunk_strategy=chunk_strategy)
+
+    # 先计算整篇文章的切块哈希，再一次性与Redis中的集合做差异
+    hashed_docs = hash_documents(docs_source)
+    to_add_ids, to_delete_ids = de_duplicator.get_to_update_and_to_delete_doc_ids(
+        document_id=document_id,
+        source_ids=[doc.uid for doc in hashed_docs],
+    )
+    to_add_docs = [doc for doc in hashed_docs if doc.uid in to_add_ids]
+    for doc_batch in _batch(batch_size, to_add_docs):
+        vector_store.add_documents(
+            [doc.to_document() for doc in doc_batch],
+            ids=[doc.uid for doc in doc_batch],
+            batch_size=batch_size,
         )
-        to_add_docs = []
-        to_add_uids = []
-        for doc, source_id in zip(hashed_docs, source_ids):
-            if source_id in to_add_ids:
-                to_add_docs.append(doc.to_document())
-                to_add_uids.append(source_id)
+    _delete_unshared(vector_store, to_delete_ids, refs_key)
+    # 向量库写入成功后，新增和删除原子地同步到Redis
+    de_duplicator.update_source_ids(
+        document_id=document_id,
+        to_add_ids=list(to_add_ids),
+        to_delete_ids=list(to_delete_ids),
+        refs_key=refs_key,
+    )
+    all_to_add_ids = [doc.uid for doc in to_add_docs]
+    all_to_delete_ids = list(to_delete_ids)
+    return all_to_add_ids, all_to_delete_ids
+
 
+def _index_streaming(
+        document_id: str,
+        doc: Document,
+        vector_store,
+        batch_size: int,
+        refs_key: str,
+):
+    """
+    流式索引：边切分边按批次写入，只在内存中保留当前批次和已出现的切块id
+    每批用SMISMEMBER找出新增切块，全部写完后再一次性计算需要删除的旧切块
+    """
+    seen_ids: set[str] = set()
+    all_to_add_ids = []
+    chunks = iter_split_docs(doc.page_content, doc.metadata)
+    for doc_batch in _batch(batch_size, chunks):
+        hashed_docs = []
+        for hashed_doc in hash_documents(doc_batch):
+            # 跨批次去重
+            if hashed_doc.uid not in seen_ids:
+                seen_ids.add(hashed_doc.uid)
+                hashed_docs.append(hashed_doc)
+        existing_ids = de_duplicator.get_existing_ids(document_id, [d.uid for d in hashed_docs])
+        to_add_docs = [d for d in hashed_docs if d.uid not in existing_ids]
         if to_add_docs:
-            res = vector_store.add_documents(
-                to_add_docs,
-                ids=to_add_uids,
+            vector_store.add_documents(
+                [d.to_document() for d in to_add_docs],
+                ids=[d.uid for d in to_add_docs],
                 batch_size=batch_size,
             )
-        if to_delete_ids:
-            _delete(vector_store, list(to_delete_ids))
-        de_duplicator.update_source_ids(
-            document_id=document_id,
-            to_add_ids=list(to_add_ids),
-            to_delete_ids=list(to_delete_ids),
-        )
-        all_to_add_ids.extend(
-            to_add_ids
-        )
-        all_to_delete_ids.extend(
-            to_delete_ids
-        )
-    return all_to_add_ids, all_to_delete_ids
+            all_to_add_ids.extend(d.uid for d in to_add_docs)
+    _, to_delete_ids = de_duplicator.get_to_update_and_to_delete_doc_ids(
+        document_id=document_id,
+        source_ids=list(seen_ids),
+    )
+    _delete_unshared(vector_store, to_delete_ids, refs_key)
+    de_duplicator.update_source_ids(
+        document_id=document_id,
+        to_add_ids=all_to_add_ids,
+        to_delete_ids=list(to_delete_ids),
+        refs_key=refs_key,
+    )
+    return all_to_add_ids, list(to_delete_ids)
+
+
+def _delete_unshared(vector_store, to_delete_ids: Iterable[str], refs_key: str):
+    """删除文章不再包含的切块，仍被其他文章引用的切块保留"""
+    to_delete_ids = set(to_delete_ids)
+    to_delete_ids -= de_duplicator.get_shared_ids(to_delete_ids, refs_key)
+    if to_delete_ids:
+        _delete(vector_store, list(to_delete_ids))
+
+
+def _document_filter(document_id: str, source_ids: Iterable[str], keep_ids: Iterable[str] = ()):
+    """
+    文章切块过滤条件：document_id属性匹配，或切块id在去重集合中
+    切块uid只由内容决定，相同内容的切块可能被其他文章最后写入，所以同时按id匹配；
+    keep_ids是仍被其他文章引用的切块，即使最后由本文章写入也不删除
+    """
+    document_filter = Filter.by_property("document_id").equal(document_id)
+    keep_ids = list(keep_ids)
+    if keep_ids:
+        document_filter = Filter.all_of([document_filter, *(Filter.by_id().not_equal(i) for i in keep_ids)])
+    source_ids = list(source_ids)
+    if source_ids:
+        return Filter.any_of([document_filter, Filter.by_id().contains_any(source_ids)])
+    return document_filter
 
 
 def delete(
@@ -188,21 +303,30 @@ def delete(
         knowledge_type: str = "common",
 ):
     """
-    删除文章
+    删除文章，通过delete_many按过滤条件一次请求删除全部切块
+    去重集合中的切块只删除没有被其他文章引用的；去重集合为空(未同步或已清理)时仍按document_id清理残留切块
     :param document_id: 文章id
     :param tenant: 租户id
     :param namespace: 命名空间id
     :param knowledge_type: 知识类型：1.常规知识 2.工具知识
-    :return:
+    :return: 删除的切块数
     """
-    vector_store = get_vector_store(
-        tenant=tenant,
-        namespace=namespace,
-        knowledge_type=knowledge_type
-    )
-    source_ids = de_duplicator.redis_client.smembers(document_id)
-    _delete(vector_store, source_ids)
-    de_duplicator.delete(document_id)
+    refs_key = de_duplicator.refs_key(namespace, knowledge_type)
+    source_ids = de_duplicator.get_all_source_ids(document_id)
+    shared_ids = de_duplicator.get_shared_ids(source_ids, refs_key)
+    deleted = 0
+    if collection_exists(tenant, namespace, knowledge_type):
+        collection = get_collection(tenant, namespace, knowledge_type)
+        result = collection.data.delete_many(
+            where=_document_filter(document_id, set(source_ids) - shared_ids, shared_ids)
+        )
+        deleted = result.successful
+        if result.failed:
+            raise RuntimeError(f"删除文章{document_id}的切块失败: {result.failed}/{result.matches}")
+    de_duplicator.delete(document_id, refs_key=refs_key)
+    if deleted:
+        notify_knowledge_changed(namespace, knowledge_type)
+    return deleted
 
 
 def update_meta_data(
@@ -210,27 +334,44 @@ def update_meta_data(
         tenant: str,
         namespace: str,
         meta_data_map: dict,
-        knowledge_type: str = "common"
+        knowledge_type: str = "common",
+        batch_size: int = 500,
 ):
     """
     更新文章元数据
+    Weaviate没有批量局部更新接口，这里按id分批读取切块(含向量)，合并新元数据后通过gRPC批量接口整体写回
     :param document_id: 文章id
     :param tenant: 租户id
     :param namespace: 命名空间id
     :param meta_data_map: 文章元数据
     :param knowledge_type: 知识类型：1.常规知识 2.工具知识
-    :return:
+    :param batch_size: 每批读取/写回的切块数
+    :return: 更新的切块数
     """
-    source_ids = de_duplicator.get_all_source_ids(document_id)
-    if knowledge_type == "common":
-        jeopardy = weaviate_client.collections.get(f"common_knowledge_{tenant}_{namespace}")
-    elif knowledge_type == "tool":
-        jeopardy = weaviate_client.collections.get(f"tool_knowledge_{tenant}_{namespace}")
-    else:
-        raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
-    for source_id in source_ids:
-        # Update the object with the new properties
-        jeopardy.data.update(
-            uuid=source_id,
-            properties=meta_data_map
+    source_ids = list(de_duplicator.get_all_source_ids(document_id))
+    if not source_ids:
+        return 0
+    collection = get_collection(tenant, namespace, knowledge_type)
+    updated = 0
+    with collection.batch.fixed_size(batch_size=batch_size) as batch:
+        for id_batch in _batch(batch_size, source_ids):
+            response = collection.query.fetch_objects(
+                filters=Filter.by_id().contains_any(id_batch),
+                limit=len(id_batch),
+                include_vector=True,
+            )
+            for obj in response.objects:
+                vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+                batch.add_object(
+                    properties={**obj.properties, **meta_data_map},
+                    uuid=obj.uuid,
+                    vector=vector,
+                )
+                updated += 1
+    failed_objects = collection.batch.failed_objects
+    if failed_objects:
+        raise RuntimeError(
+            f"更新文章{document_id}的元数据失败: {len(failed_objects)}个切块, {failed_objects[0].message}"
         )
+    notify_knowledge_changed(namespace, knowledge_type)
+    return updated
@@ -0,0 +1,164 @@
+"""
+知识库向量数据的存放位置
+- dedicated: 独占collection common_knowledge_none_{namespace} / tool_knowledge_none_{namespace}
+- shared: 小知识库合并存放在共享collection中，使用Weaviate原生多租户，每个知识库是一个tenant，
+  避免大量小collection各自的分片和HNSW索引带来的内存开销和schema操作变慢
+
+VECTOR_STORAGE_MODE=consolidated 时，新知识库放在共享collection，数据量超过VECTOR_PROMOTION_THRESHOLD后
+由定时任务迁移到独占collection；已有独占collection的知识库不受影响。
+存放位置记录在去重Redis的 vector_placement:{knowledge_type} hash中，调用方通过get_vector_store/get_collection访问，无需感知
+"""
+import os
+import time
+
+from weaviate.classes.query import Filter
+
+from core.extensions.ext_weaviate import weaviate_client
+from core.indexing.de_duplication import de_duplicator
+from llm_api.settings.base import info_logger
+
+DEDICATED = "dedicated"
+SHARED = "shared"
+
+STORAGE_MODE = os.getenv('VECTOR_STORAGE_MODE', DEDICATED)
+PROMOTION_THRESHOLD = int(os.getenv('VECTOR_PROMOTION_THRESHOLD', 10000))
+
+SHARED_COLLECTION_NAMES = {
+    "common": "common_knowledge_shared",
+    "tool": "tool_knowledge_shared",
+}
+
+_PLACEMENT_KEY = "vector_placement:{}"
+
+
+def get_shared_collection_name(knowledge_type: str) -> str:
+    if knowledge_type not in SHARED_COLLECTION_NAMES:
+        raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+    return SHARED_COLLECTION_NAMES[knowledge_type]
+
+
+def get_placement(tenant: str, namespace: str, knowledge_type: str) -> str:
+    """
+    获取知识库的存放位置，首次访问时按存储模式决定并记录
+    :return: dedicated / shared
+    """
+    from core.utils.vector_store import get_collection_name
+
+    key = _PLACEMENT_KEY.format(knowledge_type)
+    placement = de_duplicator.redis_client.hget(key, namespace)
+    if placement:
+        return placement
+    if STORAGE_MODE == "consolidated" and not weaviate_client.collections.exists(
+            get_collection_name(tenant, namespace, knowledge_type)
+    ):
+        placement = SHARED
+    else:
+        placement = DEDICATED
+    # 多个进程同时首次访问时以先写入的为准
+    de_duplicator.redis_client.hsetnx(key, namespace, placement)
+    return de_duplicator.redis_client.hget(key, namespace)
+
+
+def set_placement(namespace: str, knowledge_type: str, placement: str):
+    de_duplicator.redis_client.hset(_PLACEMENT_KEY.format(knowledge_type), namespace, placement)
+
+
+def get_shared_namespaces(knowledge_type: str) -> dict[str, int]:
+    """
+    共享collection中各知识库的对象数
+    :return: {知识库id: 对象数}
+    """
+    name = get_shared_collection_name(knowledge_type)
+    if not weaviate_client.collections.exists(name):
+        return {}
+    shared = weaviate_client.collections.get(name)
+    return {
+        namespace: shared.with_tenant(namespace).aggregate.over_all(total_count=True).total_count
+        for namespace in shared.tenants.get()
+    }
+
+
+def _copy_objects(source, target, known: set = frozenset(), batch_size: int = 200) -> set:
+    """
+    把source中不在known里的对象复制到target
+    :return: source中全部对象的uuid
+    """
+    seen = set()
+    with target.batch.fixed_size(batch_size=batch_size) as batch:
+        for obj in source.iterator(include_vector=True):
+            seen.add(obj.uuid)
+            if obj.uuid in known:
+                continue
+            vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            batch.add_object(properties=obj.properties, uuid=obj.uuid, vector=vector)
+    failed_objects = target.batch.failed_objects
+    if failed_objects:
+        raise RuntimeError(f"复制向量数据失败: {len(failed_objects)}个对象, {failed_objects[0].message}")
+    return seen
+
+
+def _delete_objects(target, uuids: list, batch_size: int = 500) -> int:
+    deleted = 0
+    for i in range(0, len(uuids), batch_size):
+        result = target.data.delete_many(where=Filter.by_id().contains_any(uuids[i:i + batch_size]))
+        if result.failed:
+            raise RuntimeError(f"删除向量数据失败: {result.failed}/{result.matches}")
+        deleted += result.successful
+    return deleted
+
+
+def promote_namespace(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str,
+        settle_seconds: float = 5,
+        max_passes: int = 5,
+) -> int:
+    """
+    把共享collection中的知识库迁移到独占collection
+    复制 -> 切换存放位置并失效所有进程的向量库实例 -> 对账切换期间共享collection的变化 -> 删除tenant
+    对账只处理两次快照之间的差异: 新出现的对象补到独占collection，消失的对象(还未切换的进程删除的)
+    从独占collection删除；两次都存在的对象不再复制，切换后在独占collection中删除的对象不会被恢复
+    切换后共享向量库实例写入前会检查存放位置并改写独占collection，对账重复到一轮没有变化为止才删除tenant，
+    超过max_passes轮仍有变化时保留tenant并抛出异常，下次迁移时继续对账
+    :param tenant: 租户id
+    :param namespace: 命名空间id
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :param settle_seconds: 每轮对账前等待其他进程处理失效消息、完成写入的秒数
+    :param max_passes: 最多对账轮数
+    :return: 独占collection中复制的对象数
+    """
+    from core.indexing.schema import schema_manager, tier_for
+    from core.utils.vector_store import get_collection_name, vector_store_registry
+
+    shared = weaviate_client.collections.get(get_shared_collection_name(knowledge_type))
+    source = shared.with_tenant(namespace)
+    name = get_collection_name(tenant, namespace, knowledge_type)
+    if not weaviate_client.collections.exists(name):
+        object_count = source.aggregate.over_all(total_count=True).total_count
+        schema_manager.create_collection(name, knowledge_type, tier_for(object_count))
+    target = weaviate_client.collections.get(name)
+
+    copied = _copy_objects(source, target)
+    total = len(copied)
+    set_placement(namespace, knowledge_type, DEDICATED)
+    vector_store_registry.invalidate(namespace=namespace, knowledge_type=knowledge_type)
+    added = deleted = 0
+    for _ in range(max_passes):
+        if settle_seconds:
+            time.sleep(settle_seconds)
+        current = _copy_objects(source, target, known=copied)
+        if current == copied:
+            break
+        added += len(current - copied)
+        deleted += _delete_objects(target, list(copied - current))
+        total += len(current - copied)
+        copied = current
+    else:
+        raise RuntimeError(f"知识库 {namespace} 的共享tenant在{max_passes}轮对账后仍有写入，暂不删除")
+    shared.tenants.remove([namespace])
+    info_logger(
+        f"知识库 {namespace} 的{knowledge_type}向量数据已从共享collection迁移到 {name}，"
+        f"切换期间补齐 {added} 个、删除 {deleted} 个对象"
+    )
+    return total
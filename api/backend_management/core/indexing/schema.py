@@ -0,0 +1,293 @@
+"""
+向量库collection结构管理
+- 显式声明属性类型、是否参与过滤/BM25，不再依赖langchain-weaviate的默认结构和auto-schema
+- 按命名空间的数据量分档配置HNSW参数和向量压缩(PQ/BQ)
+- 已有collection在线迁移: ef、压缩方式等可变参数直接更新，maxConnections/efConstruction/分词方式等
+  创建后不可变的参数只报告差异，需要重建collection后才能生效
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from weaviate.classes.config import Configure, DataType, Property, Reconfigure, Tokenization, VectorDistances
+
+from core.extensions.ext_weaviate import weaviate_client
+from core.indexing.placement import get_shared_collection_name
+from core.utils.vector_store import get_collection_name, vector_store_registry
+from llm_api.settings.base import info_logger
+
+
+@dataclass(frozen=True)
+class IndexTier:
+    """按数据量划分的索引档位"""
+    name: str
+    # 对象数上限(不含)，None表示不设上限
+    max_objects: Optional[int]
+    max_connections: int
+    ef_construction: int
+    # -1 表示按limit动态调整ef
+    ef: int
+    # None / pq / bq
+    quantizer: Optional[str]
+
+
+INDEX_TIERS = [
+    IndexTier(
+        name="small",
+        max_objects=int(os.getenv('VECTOR_SCHEMA_MEDIUM_THRESHOLD', 20000)),
+        max_connections=32, ef_construction=128, ef=-1, quantizer=None,
+    ),
+    IndexTier(
+        name="medium",
+        max_objects=int(os.getenv('VECTOR_SCHEMA_LARGE_THRESHOLD', 500000)),
+        max_connections=32, ef_construction=128, ef=-1, quantizer="pq",
+    ),
+    IndexTier(
+        name="large",
+        max_objects=None,
+        max_connections=64, ef_construction=256, ef=-1, quantizer="bq",
+    ),
+]
+
+# PQ训练使用的最大对象数(Weaviate默认值)
+PQ_MAX_TRAINING_LIMIT = 100000
+# BQ检索时用原始向量重新打分的候选数，弥补二值化的精度损失
+BQ_RESCORE_LIMIT = 256
+
+# 不参与过滤和BM25的大字段
+_STORED_ONLY = dict(data_type=DataType.TEXT, index_filterable=False, index_searchable=False)
+# 精确匹配过滤的标识字段
+_KEYWORD = dict(data_type=DataType.TEXT, tokenization=Tokenization.FIELD, index_filterable=True, index_searchable=False)
+# 参与BM25的文本字段
+_SEARCHABLE = dict(data_type=DataType.TEXT, index_filterable=False, index_searchable=True)
+
+_COMMON_FIELDS = [
+    Property(name="text", **_SEARCHABLE),
+    Property(name="tenant", **_KEYWORD),
+    Property(name="owner", **_KEYWORD),
+    Property(name="namespace", **_KEYWORD),
+    Property(name="source", **_KEYWORD),
+    Property(name="document_id", **_KEYWORD),
+]
+
+COLLECTION_PROPERTIES = {
+    "common": _COMMON_FIELDS + [
+        Property(name="title", **_SEARCHABLE),
+        *[Property(name=f"H{level}", **_SEARCHABLE) for level in range(1, 7)],
+    ],
+    "tool": _COMMON_FIELDS + [
+        Property(name="name", **_SEARCHABLE),
+        Property(name="description", **_SEARCHABLE),
+        Property(name="tool_trigger_selected_examples", **_SEARCHABLE),
+        Property(name="tool_type", **_KEYWORD),
+        Property(name="input_schema", **_STORED_ONLY),
+        Property(name="output_schema", **_STORED_ONLY),
+        Property(name="output_schema_jinja2_template", **_STORED_ONLY),
+        Property(name="html_template", **_STORED_ONLY),
+        Property(name="few_shots", **_STORED_ONLY),
+        Property(name="extra_params", **_STORED_ONLY),
+    ],
+}
+
+_QUANTIZER_NAMES = {"_PQConfig": "pq", "_BQConfig": "bq", "_SQConfig": "sq"}
+
+
+def tier_for(object_count: int) -> IndexTier:
+    """根据对象数选择索引档位"""
+    for tier in INDEX_TIERS:
+        if tier.max_objects is None or object_count < tier.max_objects:
+            return tier
+    return INDEX_TIERS[-1]
+
+
+def pq_training_limit() -> int:
+    """
+    PQ训练使用的对象数，取PQ档位的对象数下限
+    Weaviate在对象数达到training_limit后才训练并压缩，大于下限时刚进入PQ档位的collection会一直不压缩
+    """
+    for previous, tier in zip(INDEX_TIERS, INDEX_TIERS[1:]):
+        if tier.quantizer == "pq":
+            return min(previous.max_objects, PQ_MAX_TRAINING_LIMIT)
+    return PQ_MAX_TRAINING_LIMIT
+
+
+def bytes_per_vector(dim: int, quantizer: Optional[str]) -> int:
+    """
+    估算内存中每个向量占用的字节数(不含HNSW邻接表)
+    PQ默认每4维一个segment、每个segment 1字节；BQ每维1比特
+    """
+    if quantizer == "pq":
+        return max(dim // 4, 1)
+    if quantizer == "bq":
+        return (dim + 7) // 8
+    if quantizer == "sq":
+        return dim
+    return dim * 4
+
+
+def _quantizer_create(quantizer: Optional[str]):
+    if quantizer == "pq":
+        return Configure.VectorIndex.Quantizer.pq(training_limit=pq_training_limit())
+    if quantizer == "bq":
+        return Configure.VectorIndex.Quantizer.bq(rescore_limit=BQ_RESCORE_LIMIT)
+    return None
+
+
+def _quantizer_update(quantizer: str):
+    if quantizer == "pq":
+        return Reconfigure.VectorIndex.Quantizer.pq(training_limit=pq_training_limit())
+    return Reconfigure.VectorIndex.Quantizer.bq(rescore_limit=BQ_RESCORE_LIMIT)
+
+
+@dataclass
+class SchemaPlan:
+    """单个collection的迁移计划"""
+    collection: str
+    exists: bool
+    object_count: int = 0
+    dim: Optional[int] = None
+    current_quantizer: Optional[str] = None
+    current_ef: Optional[int] = None
+    target: Optional[IndexTier] = None
+    # 可以在线更新的参数
+    updates: dict = field(default_factory=dict)
+    # 创建后不可变、需要重建collection的差异
+    drift: list[str] = field(default_factory=list)
+
+    @property
+    def memory_before(self) -> Optional[int]:
+        if self.dim is None:
+            return None
+        return bytes_per_vector(self.dim, self.current_quantizer) * self.object_count
+
+    @property
+    def memory_after(self) -> Optional[int]:
+        if self.dim is None:
+            return None
+        quantizer = self.updates.get("quantizer", self.current_quantizer)
+        return bytes_per_vector(self.dim, quantizer) * self.object_count
+
+
+class CollectionSchemaManager:
+    """collection结构管理"""
+
+    def __init__(self, client=weaviate_client):
+        self.client = client
+
+    def ensure_collection(self, tenant: str, namespace: str, knowledge_type: str) -> str:
+        """
+        collection不存在时按显式结构创建，新命名空间从最小档位开始
+        :return: collection名称
+        """
+        name = get_collection_name(tenant, namespace, knowledge_type)
+        if not self.client.collections.exists(name):
+            self.create_collection(name, knowledge_type, INDEX_TIERS[0])
+        return name
+
+    def ensure_shared_collection(self, knowledge_type: str) -> str:
+        """
+        小知识库合并存放的共享collection，每个知识库是一个tenant，写入时自动创建tenant
+        每个tenant有独立的HNSW索引，使用最小档位的参数
+        :return: collection名称
+        """
+        name = get_shared_collection_name(knowledge_type)
+        if not self.client.collections.exists(name):
+            self.create_collection(
+                name,
+                knowledge_type,
+                INDEX_TIERS[0],
+                multi_tenancy_config=Configure.multi_tenancy(
+                    enabled=True,
+                    auto_tenant_creation=True,
+                    auto_tenant_activation=True,
+                ),
+            )
+        return name
+
+    def create_collection(self, name: str, knowledge_type: str, tier: IndexTier, multi_tenancy_config=None):
+        self.client.collections.create(
+            name=name,
+            properties=COLLECTION_PROPERTIES[knowledge_type],
+            vectorizer_config=Configure.Vectorizer.none(),
+            vector_index_config=Configure.VectorIndex.hnsw(
+                distance_metric=VectorDistances.COSINE,
+                max_connections=tier.max_connections,
+                ef_construction=tier.ef_construction,
+                ef=tier.ef,
+                quantizer=_quantizer_create(tier.quantizer),
+            ),
+            multi_tenancy_config=multi_tenancy_config,
+        )
+        info_logger(f"创建向量库collection {name}，索引档位 {tier.name}")
+
+    def _dim(self, collection) -> Optional[int]:
+        for obj in collection.query.fetch_objects(limit=1, include_vector=True).objects:
+            vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            return len(vector) if vector else None
+        return None
+
+    def plan(self, tenant: str, namespace: str, knowledge_type: str) -> SchemaPlan:
+        """对比当前配置与数据量对应的目标档位，生成迁移计划"""
+        name = get_collection_name(tenant, namespace, knowledge_type)
+        if not self.client.collections.exists(name):
+            return SchemaPlan(collection=name, exists=False)
+
+        collection = self.client.collections.get(name)
+        config = collection.config.get().vector_index_config
+        object_count = collection.aggregate.over_all(total_count=True).total_count
+        target = tier_for(object_count)
+        current_quantizer = _QUANTIZER_NAMES.get(type(config.quantizer).__name__) if config.quantizer else None
+        plan = SchemaPlan(
+            collection=name,
+            exists=True,
+            object_count=object_count,
+            dim=self._dim(collection),
+            current_quantizer=current_quantizer,
+            current_ef=config.ef,
+            target=target,
+        )
+
+        if config.ef != target.ef:
+            plan.updates["ef"] = target.ef
+        if target.quantizer and current_quantizer is None:
+            plan.updates["quantizer"] = target.quantizer
+        elif target.quantizer and current_quantizer != target.quantizer:
+            # 已压缩的collection不能在线切换压缩方式
+            plan.drift.append(f"quantizer: {current_quantizer} -> {target.quantizer}")
+        elif current_quantizer == "pq" and config.quantizer.training_limit != pq_training_limit() \
+                and object_count < config.quantizer.training_limit:
+            # 按旧的training_limit开启、对象数还没达到而一直未训练的PQ，更新为当前的训练数量
+            plan.updates["quantizer"] = "pq"
+        if config.max_connections < target.max_connections:
+            plan.drift.append(f"maxConnections: {config.max_connections} -> {target.max_connections}")
+        if config.ef_construction < target.ef_construction:
+            plan.drift.append(f"efConstruction: {config.ef_construction} -> {target.ef_construction}")
+        return plan
+
+    def apply(self, plan: SchemaPlan):
+        """在线更新可变参数，压缩在Weaviate后台完成，期间检索不中断"""
+        if not plan.updates:
+            return
+        collection = self.client.collections.get(plan.collection)
+        collection.config.update(
+            vector_index_config=Reconfigure.VectorIndex.hnsw(
+                ef=plan.updates.get("ef"),
+                quantizer=_quantizer_update(plan.updates["quantizer"]) if "quantizer" in plan.updates else None,
+            )
+        )
+        info_logger(f"向量库collection {plan.collection} 已在线更新: {plan.updates}")
+
+    def sync(self, tenant: str, namespace: str, knowledge_type: str, dry_run: bool = False) -> SchemaPlan:
+        """
+        生成并执行迁移计划
+        :param dry_run: 只生成计划不执行
+        """
+        plan = self.plan(tenant, namespace, knowledge_type)
+        if plan.exists and plan.updates and not dry_run:
+            self.apply(plan)
+            # collection结构变化后失效所有进程中缓存的向量库实例
+            vector_store_registry.invalidate(namespace=namespace, knowledge_type=knowledge_type)
+        return plan
+
+
+schema_manager = CollectionSchemaManager()
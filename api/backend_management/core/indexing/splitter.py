@@ -1,5 +1,14 @@
+import hashlib
 import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+import numpy as np
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
 
@@ -19,6 +28,89 @@ markdown_splitter = MarkdownHeaderTextSplitter(
 )
 
 
+SectionCacheInfo = namedtuple("SectionCacheInfo", ["hits", "misses", "currsize", "bytes", "max_bytes"])
+
+
+class SectionSplitCache:
+    """
+    标题段落的递归切分结果缓存，保存文档时只有内容变化的段落会被重新切分
+    - 键为 sha1(标题路径 + 段落内容 + 切分参数)，不保存段落原文
+    - 按切块占用的字节数做LRU淘汰；超过单条上限的段落不缓存(超大段落很少原样重复出现)
+    - 每个进程(包括split_docs_parallel的子进程)各自一份，总量受max_bytes限制
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entry_bytes: int = 1024 * 1024):
+        """
+        :param max_bytes: 缓存的切块总字节数上限
+        :param max_entry_bytes: 单个段落的切块超过该字节数时不缓存
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, tuple[tuple[str, ...], int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(section_text, chunk_size, chunk_overlap, header_path) -> str:
+        digest = hashlib.sha1()
+        for part in (*header_path, str(chunk_size), str(chunk_overlap), section_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def __call__(self, section_text, chunk_size, chunk_overlap, header_path=()):
+        """
+        切分单个段落
+        :param header_path: 段落的多级标题，例如 ("第1章", "1.1节")
+        """
+        key = self._key(section_text, chunk_size, chunk_overlap, header_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+        chunks = tuple(text_splitter.split_text(section_text))
+        size = sum(sys.getsizeof(chunk) for chunk in chunks)
+        if size > self.max_entry_bytes:
+            return chunks
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (chunks, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return chunks
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self) -> SectionCacheInfo:
+        with self._lock:
+            return SectionCacheInfo(self.hits, self.misses, len(self._entries), self._bytes, self.max_bytes)
+
+
+_split_section = SectionSplitCache(
+    max_bytes=int(os.getenv('SPLIT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    max_entry_bytes=int(os.getenv('SPLIT_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)),
+)
+
+
+def _header_path(metadata) -> tuple:
+    return tuple(metadata[header] for header in ["H1", "H2", "H3", "H4", "H5", "H6"] if header in metadata)
+
+
 # 标准splitter:markdown + 递归 + header提升可解释性，可操控性
 # 两种splitter混合提升综合切分效果
 # TODO:元数据增强,header可以作为混合检索BM25依据。header可以作为Embedding增强依据。融合文章标题，文章树标题也能一定程度提升命中率
@@ -28,25 +120,336 @@ def split_docs(
         chunk_size=800,
         chunk_overlap=150
 ):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
-    )
     splits = []
     for markdown_document in markdown_documents:
         meta_data = markdown_document.metadata
         md_header_splits = markdown_splitter.split_text(markdown_document.page_content)
         title = markdown_document.metadata.get("title", "")
         # Split
-        res = text_splitter.split_documents(md_header_splits)
-        for _res in res:
-            _res.metadata.update(meta_data)
+        for section in md_header_splits:
+            for chunk in _split_section(
+                    section.page_content, chunk_size, chunk_overlap, _header_path(section.metadata)
+            ):
+                metadata = section.metadata | meta_data
+                multi_header = title
+                # 多级标题提取
+                for header in ["H1", "H2", "H3", "H4", "H5", "H6"]:
+                    if header in metadata:
+                        multi_header = f"{multi_header}-{metadata[header]}"
+                splits.append(
+                    Document(
+                        page_content=f"多级标题:{multi_header}\n\n{chunk}",
+                        metadata=metadata
+                    )
+                )
+    return splits
+
+
+def _split_one(markdown_document, chunk_size, chunk_overlap):
+    return split_docs([markdown_document], chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def split_docs_parallel(
+        markdown_documents,
+        chunk_size=800,
+        chunk_overlap=150,
+        max_workers=None,
+        chunksize=None,
+        executor=None,
+):
+    """
+    多进程并行切分多篇文档，结果顺序与split_docs一致
+    :param markdown_documents: 源markdown文档列表
+    :param max_workers: 进程数，默认CPU核数
+    :param chunksize: 每次投递给子进程的文档数，默认按进程数均分为若干份以减少IPC次数
+    :param executor: 复用已有的进程池，不传则临时创建
+    """
+    markdown_documents = list(markdown_documents)
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(markdown_documents) <= 1:
+        return split_docs(markdown_documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if chunksize is None:
+        chunksize = max(1, len(markdown_documents) // (max_workers * 4))
+    task = partial(_split_one, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    splits = []
+    if executor is not None:
+        for res in executor.map(task, markdown_documents, chunksize=chunksize):
+            splits.extend(res)
+        return splits
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for res in pool.map(task, markdown_documents, chunksize=chunksize):
+            splits.extend(res)
+    return splits
+
+
+def _iter_lines(markdown_source):
+    """逐行读取markdown，支持字符串或按行迭代的文件对象，不整体拷贝文本"""
+    if isinstance(markdown_source, str):
+        start = 0
+        while True:
+            end = markdown_source.find("\n", start)
+            if end == -1:
+                yield markdown_source[start:]
+                return
+            yield markdown_source[start:end]
+            start = end + 1
+    else:
+        # 与str.split("\n")保持一致：以换行结尾时最后还有一个空行
+        line = ""
+        for line in markdown_source:
+            yield line[:-1] if line.endswith("\n") else line
+        if not line or line.endswith("\n"):
+            yield ""
+
+
+def _iter_header_lines(lines):
+    """
+    与MarkdownHeaderTextSplitter.split_text相同的逐行解析，增量维护标题栈
+    逐行产出 (块开始时的标题元数据或None, 行)；空行结束当前块，块内的行不在这里累积
+    """
+    header_levels = sorted(headers_to_split_on, key=lambda split: len(split[0]), reverse=True)
+    block_started = False
+    header_stack = []
+    initial_metadata = {}
+    in_code_block = False
+    opening_fence = ""
+
+    for line in lines:
+        stripped_line = "".join(filter(str.isprintable, line.strip()))
+        if not in_code_block:
+            if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                in_code_block = True
+                opening_fence = "```"
+            elif stripped_line.startswith("~~~"):
+                in_code_block = True
+                opening_fence = "~~~"
+        elif stripped_line.startswith(opening_fence):
+            in_code_block = False
+            opening_fence = ""
+
+        if in_code_block:
+            yield (None if block_started else initial_metadata.copy()), stripped_line
+            block_started = True
+            continue
+
+        for sep, name in header_levels:
+            if stripped_line.startswith(sep) and (
+                    len(stripped_line) == len(sep) or stripped_line[len(sep)] == " "
+            ):
+                level = sep.count("#")
+                while header_stack and header_stack[-1][0] >= level:
+                    _, popped_name = header_stack.pop()
+                    initial_metadata.pop(popped_name, None)
+                header_stack.append((level, name))
+                initial_metadata[name] = stripped_line[len(sep):].strip()
+                # 标题开始新的块，与markdown_splitter一致，保留标题行
+                yield initial_metadata.copy(), stripped_line
+                block_started = True
+                break
+        else:
+            if stripped_line:
+                yield (None if block_started else initial_metadata.copy()), stripped_line
+                block_started = True
+            else:
+                block_started = False
+
+
+def _iter_section_parts(markdown_source):
+    """
+    流式版 markdown_splitter.split_text: 相同标题路径的相邻块合并为一个段落
+    产出 (段落元数据, 文本片段, 是否为新段落)，按片段顺序拼接即为段落内容
+    上一段只有更浅层级的标题行时与当前块合并，段落元数据随之变为当前块的元数据(以最后产出的为准)
+    """
+    section_metadata = None
+    last_line = ""
+    for block_metadata, line in _iter_header_lines(_iter_lines(markdown_source)):
+        if block_metadata is None:
+            yield section_metadata, "\n" + line, False
+        elif section_metadata is None or (
+                block_metadata != section_metadata
+                and not (len(section_metadata) < len(block_metadata) and last_line.startswith("#"))
+        ):
+            section_metadata = block_metadata
+            yield section_metadata, line, True
+        else:
+            section_metadata = block_metadata
+            yield section_metadata, "  \n" + line, False
+        last_line = line
+
+
+def iter_markdown_sections(markdown_source):
+    """
+    流式版 markdown_splitter.split_text，逐个产出段落，内存只保留当前段落
+    """
+    parts, metadata = [], None
+    for section_metadata, part, new_section in _iter_section_parts(markdown_source):
+        if new_section and parts:
+            yield Document(page_content="".join(parts), metadata=metadata)
+            parts = []
+        parts.append(part)
+        metadata = section_metadata
+    if parts:
+        yield Document(page_content="".join(parts), metadata=metadata)
+
+
+def iter_split_docs(
+        markdown_source,
+        metadata,
+        chunk_size=800,
+        chunk_overlap=150,
+        buffer_size=None,
+):
+    """
+    流式切分超大markdown文档，逐个产出切块，内存中只保留不超过buffer_size的待切分文本
+    段落不超过buffer_size时切块与split_docs完全相同(切块id不变，小文档和大文档走不同路径也不会重复写入)；
+    超过时切分缓冲区，产出除最后一块以外的切块，最后一块的原文留在缓冲区与后续文本一起切分
+    不使用_split_section的缓存: 超大文档的段落很少重复切分，缓存只会让已处理的段落和切块一直留在内存中
+    :param markdown_source: markdown字符串或按行迭代的文件对象
+    :param metadata: 源文档元数据
+    :param buffer_size: 缓冲区字符数上限，默认chunk_size的32倍，不小于chunk_size + chunk_overlap
+    """
+    title = metadata.get("title", "")
+    buffer_size = max(buffer_size or chunk_size * 32, chunk_size + chunk_overlap)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+    def to_documents(chunks, section_metadata):
+        chunk_metadata = section_metadata | metadata
+        multi_header = title
+        # 多级标题提取
+        for header in ["H1", "H2", "H3", "H4", "H5", "H6"]:
+            if header in chunk_metadata:
+                multi_header = f"{multi_header}-{chunk_metadata[header]}"
+        for chunk in chunks:
+            yield Document(
+                page_content=f"多级标题:{multi_header}\n\n{chunk}",
+                metadata=chunk_metadata
+            )
+
+    parts, size, section_metadata = [], 0, None
+    for part_metadata, part, new_section in _iter_section_parts(markdown_source):
+        if new_section and parts:
+            yield from to_documents(text_splitter.split_text("".join(parts)), section_metadata)
+            parts, size = [], 0
+        parts.append(part)
+        size += len(part)
+        section_metadata = part_metadata
+        if size > buffer_size:
+            text = "".join(parts)
+            chunks = text_splitter.split_text(text)
+            if len(chunks) > 1:
+                yield from to_documents(chunks[:-1], section_metadata)
+                # 最后一块可能还不完整，保留它在原文中的位置之后的全部文本(含被strip掉的前导分隔符)
+                start = text.rfind(chunks[-1])
+                while start > 0 and text[start - 1].isspace():
+                    start -= 1
+                tail = text[start:]
+                parts, size = [tail], len(tail)
+    if parts:
+        yield from to_documents(text_splitter.split_text("".join(parts)), section_metadata)
+
+
+# 句子结尾：中英文句末标点(含其后的空白)，或换行
+_SENTENCE_END = re.compile(r"[。！？!?；;]+\s*|\.\s+|\n+")
+
+
+def _split_sentences(text):
+    """按句切分并保留原始分隔符，拼接后还原原文"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if text[start:match.end()].strip():
+            sentences.append(text[start:match.end()])
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:])
+    return sentences
+
+
+def split_docs_semantic(
+        markdown_documents,
+        embeddings,
+        buffer_size=1,
+        breakpoint_percentile_threshold=90,
+        max_chunk_size=1500,
+        embedding_batch_size=64,
+):
+    """
+    语义切分：在相邻句子语义距离的高分位处断开，不做重叠，切块更少更紧凑
+    标题段落仍作为硬边界，多级标题前缀与split_docs一致
+    :param markdown_documents: 源markdown文档列表
+    :param embeddings: 用于计算句子向量的Embedding模型
+    :param buffer_size: 计算句子向量时前后各拼接的句子数，越大越平滑
+    :param breakpoint_percentile_threshold: 语义距离超过该百分位时断开，越大切块越少
+    :param max_chunk_size: 单个切块的最大字符数，超过后强制断开
+    :param embedding_batch_size: 每次请求Embedding的句子数
+    """
+    splits = []
+    for markdown_document in markdown_documents:
+        meta_data = markdown_document.metadata
+        title = meta_data.get("title", "")
+        sections = [
+            (section.metadata, _split_sentences(section.page_content))
+            for section in markdown_splitter.split_text(markdown_document.page_content)
+        ]
+        # 整篇文档的句子窗口一起分批向量化
+        windows = []
+        for _, sentences in sections:
+            for i in range(len(sentences)):
+                windows.append("".join(sentences[max(0, i - buffer_size):i + buffer_size + 1]).strip())
+        if not windows:
+            continue
+        vectors = []
+        for start in range(0, len(windows), embedding_batch_size):
+            vectors.extend(embeddings.embed_documents(windows[start:start + embedding_batch_size]))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        # 相邻句子的余弦距离，段落边界处置为nan不参与阈值计算
+        distances = 1 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+        offset = 0
+        for _, sentences in sections[:-1]:
+            offset += len(sentences)
+            if 0 < offset <= len(distances):
+                distances[offset - 1] = np.nan
+        valid = distances[~np.isnan(distances)]
+        threshold = np.percentile(valid, breakpoint_percentile_threshold) if valid.size else np.inf
+
+        offset = 0
+        for section_metadata, sentences in sections:
+            metadata = section_metadata | meta_data
             multi_header = title
             # 多级标题提取
             for header in ["H1", "H2", "H3", "H4", "H5", "H6"]:
-                if header in _res.metadata:
-                    multi_header = f"{multi_header}-{_res.metadata[header]}"
-            _res.page_content = f"多级标题:{multi_header}\n\n{_res.page_content}"
-        splits.extend(res)
+                if header in metadata:
+                    multi_header = f"{multi_header}-{metadata[header]}"
+            chunks = []
+            current = []
+            current_size = 0
+            for i, sentence in enumerate(sentences):
+                if current and current_size + len(sentence) > max_chunk_size:
+                    chunks.append(current)
+                    current, current_size = [], 0
+                current.append(sentence)
+                current_size += len(sentence)
+                global_index = offset + i
+                if i < len(sentences) - 1 and distances[global_index] > threshold:
+                    chunks.append(current)
+                    current, current_size = [], 0
+            if current:
+                chunks.append(current)
+            offset += len(sentences)
+            for chunk in chunks:
+                text = "".join(chunk).strip()
+                # 超长单句退回递归切分
+                for piece in (_split_section(text, max_chunk_size, 0) if len(text) > max_chunk_size else (text,)):
+                    splits.append(
+                        Document(
+                            page_content=f"多级标题:{multi_header}\n\n{piece}",
+                            metadata=dict(metadata)
+                        )
+                    )
     return splits
 
 
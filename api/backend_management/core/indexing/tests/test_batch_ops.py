@@ -0,0 +1,98 @@
+"""
+批量元数据更新/删除与逐条操作的吞吐量对比
+"""
+import random
+import time
+import uuid
+
+import allure
+from weaviate.classes.config import Configure, DataType, Property
+
+from core.extensions.ext_weaviate import weaviate_client
+from core.indexing.de_duplication import de_duplicator
+from core.indexing.index import delete, update_meta_data
+from core.utils.vector_store import get_collection_name
+
+TENANT = "tenant1"
+NAMESPACE = "batch_ops_benchmark"
+CHUNKS = 500
+DIM = 768
+
+
+def _prepare(document_id):
+    """直接写入CHUNKS个切块，绕过Embedding服务"""
+    name = get_collection_name(TENANT, NAMESPACE, "common")
+    if weaviate_client.collections.exists(name):
+        weaviate_client.collections.delete(name)
+    collection = weaviate_client.collections.create(
+        name=name,
+        vectorizer_config=Configure.Vectorizer.none(),
+        properties=[
+            Property(name="text", data_type=DataType.TEXT),
+            Property(name="document_id", data_type=DataType.TEXT),
+            Property(name="title", data_type=DataType.TEXT),
+        ],
+    )
+    ids = [str(uuid.uuid4()) for _ in range(CHUNKS)]
+    with collection.batch.fixed_size(batch_size=200) as batch:
+        for i, object_id in enumerate(ids):
+            batch.add_object(
+                properties={"text": f"chunk {i}", "document_id": document_id, "title": "旧标题"},
+                uuid=object_id,
+                vector=[random.random() for _ in range(DIM)],
+            )
+    de_duplicator.delete(document_id)
+    de_duplicator.update_source_ids(document_id=document_id, to_add_ids=ids, to_delete_ids=[])
+    return collection, ids
+
+
+def test_batch_update_and_delete_throughput():
+    document_id = "batch_ops_doc"
+
+    with allure.step("逐条更新元数据(旧实现)"):
+        collection, ids = _prepare(document_id)
+        start = time.perf_counter()
+        for object_id in ids:
+            collection.data.update(uuid=object_id, properties={"title": "逐条标题"})
+        loop_update = time.perf_counter() - start
+
+    with allure.step("批量更新元数据"):
+        start = time.perf_counter()
+        updated = update_meta_data(
+            document_id=document_id,
+            tenant=TENANT,
+            namespace=NAMESPACE,
+            meta_data_map={"title": "批量标题"},
+        )
+        batch_update = time.perf_counter() - start
+        assert updated == CHUNKS
+        obj = collection.query.fetch_object_by_id(ids[0], include_vector=True)
+        assert obj.properties["title"] == "批量标题"
+        assert obj.properties["text"] == "chunk 0"
+        # 向量随对象一起写回
+        assert obj.vector
+
+    with allure.step("逐条删除(旧实现)"):
+        start = time.perf_counter()
+        for object_id in ids:
+            collection.data.delete_by_id(object_id)
+        loop_delete = time.perf_counter() - start
+
+    with allure.step("按document_id批量删除"):
+        collection, ids = _prepare(document_id)
+        start = time.perf_counter()
+        deleted = delete(document_id=document_id, tenant=TENANT, namespace=NAMESPACE)
+        batch_delete = time.perf_counter() - start
+        assert deleted == CHUNKS
+        assert collection.aggregate.over_all(total_count=True).total_count == 0
+        assert de_duplicator.get_all_source_ids(document_id) == set()
+
+    print(
+        f"\n{CHUNKS}个切块: "
+        f"更新 逐条{CHUNKS / loop_update:.0f}/s vs 批量{CHUNKS / batch_update:.0f}/s; "
+        f"删除 逐条{CHUNKS / loop_delete:.0f}/s vs 批量{CHUNKS / batch_delete:.0f}/s"
+    )
+    assert batch_update < loop_update
+    assert batch_delete < loop_delete
+
+    weaviate_client.collections.delete(get_collection_name(TENANT, NAMESPACE, "common"))
@@ -0,0 +1,114 @@
+import os
+
+import allure
+from langchain_core.documents import Document
+
+from core.indexing import bulk
+from core.indexing.bulk import BulkIndexer
+from core.indexing.de_duplication import de_duplicator
+from core.indexing.index import delete
+
+
+def _build_doc(document_id, tenant, namespace, answer):
+    return Document(
+        page_content=f'''
+    # 会议室号码 \n\n
+    ## 第{document_id}号会议室号码是多少？ \n\n {answer} \n\n''',
+        metadata={
+            "tenant": tenant,
+            "owner": tenant,
+            "namespace": namespace,
+            "source": f"document_{document_id}",
+            "document_id": document_id,
+            "title": f"会议室记录{document_id}",
+            "H1": "",
+            "H2": "",
+            "H3": "",
+            "H4": "",
+            "H5": "",
+            "H6": "",
+        }
+    )
+
+
+def test_bulk_index_namespace():
+    tenant = "tenant1"
+    namespace = "bulk_namespace1"
+    document_ids = [str(i) for i in range(900001, 900021)]
+
+    with allure.step("恢复测试失败的状态"):
+        for document_id in document_ids:
+            if de_duplicator.get_all_source_ids(document_id=document_id):
+                delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+    indexer = BulkIndexer(
+        tenant=tenant,
+        namespace=namespace,
+        split_workers=2,
+        write_batch_size=8,
+        max_inflight_splits=4,
+    )
+    indexer.reset_checkpoint()
+
+    with allure.step("首次批量索引"):
+        stats = indexer.run(
+            (document_id, _build_doc(document_id, tenant, namespace, "123456789"))
+            for document_id in document_ids
+        )
+        assert stats.docs == len(document_ids)
+        assert stats.added == stats.chunks == len(document_ids)
+        assert stats.docs_per_sec > 0 and stats.chunks_per_sec > 0
+        for document_id in document_ids:
+            assert len(de_duplicator.get_all_source_ids(document_id=document_id)) == 1
+        # 完整跑完后清理检查点
+        assert indexer.get_checkpoint() is None
+
+    with allure.step("重复索引不产生写入"):
+        stats = indexer.run(
+            (document_id, _build_doc(document_id, tenant, namespace, "123456789"))
+            for document_id in document_ids
+        )
+        assert stats.added == 0 and stats.deleted == 0
+
+    with allure.step("内容变化时替换旧切块"):
+        stats = indexer.run(
+            (document_id, _build_doc(document_id, tenant, namespace, "987654321"))
+            for document_id in document_ids
+        )
+        assert stats.added == len(document_ids) and stats.deleted == len(document_ids)
+
+    with allure.step("清理"):
+        for document_id in document_ids:
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+
+def test_bulk_semantic_split_in_main_process(monkeypatch):
+    tenant = "tenant1"
+    namespace = "bulk_namespace2"
+    document_ids = [str(i) for i in range(900101, 900105)]
+    split_pids = []
+    split_and_hash = bulk._split_and_hash
+
+    def record_pid(*args):
+        split_pids.append(os.getpid())
+        return split_and_hash(*args)
+
+    monkeypatch.setattr(bulk, "_split_and_hash", record_pid)
+
+    with allure.step("恢复测试失败的状态"):
+        for document_id in document_ids:
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+    with allure.step("语义切分在主进程中执行，Embedding经过进程内的缓存和批处理器"):
+        indexer = BulkIndexer(tenant=tenant, namespace=namespace, chunk_strategy="semantic", split_workers=2)
+        indexer.reset_checkpoint()
+        stats = indexer.run(
+            (document_id, _build_doc(document_id, tenant, namespace, "123456789"))
+            for document_id in document_ids
+        )
+        assert stats.docs == len(document_ids) and stats.added > 0
+        assert split_pids == [os.getpid()] * len(document_ids)
+
+    with allure.step("清理"):
+        for document_id in document_ids:
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
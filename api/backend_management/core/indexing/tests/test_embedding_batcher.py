@@ -0,0 +1,124 @@
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from core.indexing.embedding_batcher import CoalescingEmbeddingBatcher
+
+
+class RecordingEmbeddings(Embeddings):
+    """记录每次调用的批大小，向量为文本长度"""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        time.sleep(self.latency)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def test_concurrent_callers_coalesce_into_one_call():
+    inner = RecordingEmbeddings()
+    batcher = CoalescingEmbeddingBatcher(inner, max_batch_size=64, max_wait_ms=50)
+    results = {}
+
+    def worker(i):
+        texts = ["x" * (i + 1)] * 5
+        results[i] = batcher.embed_documents(texts)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 每个调用方拿回的是自己的向量
+    for i in range(8):
+        assert results[i] == [[float(i + 1)]] * 5
+    # 8个调用方共40条文本，远少于8次请求
+    assert sum(inner.calls) == 40
+    assert len(inner.calls) < 8
+    stats = batcher.get_stats()
+    assert stats["requests"] == 8
+    assert 0 < stats["avg_fill_ratio"] <= 1
+    assert stats["max_queue_wait_ms"] >= stats["avg_queue_wait_ms"] >= 0
+
+
+def test_size_cap_and_query_passthrough():
+    inner = RecordingEmbeddings(latency=0)
+    batcher = CoalescingEmbeddingBatcher(inner, max_batch_size=4, max_wait_ms=1000)
+    start = time.monotonic()
+    assert len(batcher.embed_documents(["a"] * 4)) == 4
+    # 达到上限立即发送，不等待整个时间窗口
+    assert time.monotonic() - start < 0.5
+    assert batcher.embed_query("abc") == [3.0]
+    assert inner.calls == [4]
+
+
+def test_errors_propagate_to_callers():
+    class FailingEmbeddings(RecordingEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("embedding service down")
+
+    batcher = CoalescingEmbeddingBatcher(FailingEmbeddings(), max_wait_ms=1)
+    try:
+        batcher.embed_documents(["a"])
+        assert False, "应当抛出异常"
+    except RuntimeError as e:
+        assert "embedding service down" in str(e)
+
+
+def test_batches_are_sent_in_parallel():
+    class ConcurrencyEmbeddings(RecordingEmbeddings):
+        def __init__(self):
+            super().__init__(latency=0.2)
+            self.active = 0
+            self.max_active = 0
+            self.lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                return super().embed_documents(texts)
+            finally:
+                with self.lock:
+                    self.active -= 1
+
+    inner = ConcurrencyEmbeddings()
+    # 每个调用方刚好凑满一批，4批应同时在途
+    batcher = CoalescingEmbeddingBatcher(inner, max_batch_size=4, max_wait_ms=1, max_inflight=4)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.embed_documents(["x" * (i + 1)] * 4)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    for i in range(4):
+        assert results[i] == [[float(i + 1)]] * 4
+    assert inner.calls == [4, 4, 4, 4]
+    assert inner.max_active > 1
+    # 串行发送需要0.8秒
+    assert elapsed < 0.6
+
+    with_limit = ConcurrencyEmbeddings()
+    batcher = CoalescingEmbeddingBatcher(with_limit, max_batch_size=4, max_wait_ms=1, max_inflight=2)
+    threads = [threading.Thread(target=batcher.embed_documents, args=(["x"] * 4,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert with_limit.max_active == 2
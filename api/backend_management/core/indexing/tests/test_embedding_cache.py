@@ -0,0 +1,61 @@
+from langchain_core.embeddings import Embeddings
+
+from core.extensions.ext_redis import redis_client
+from core.indexing.embedding_cache import CachedEmbedding
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.document_texts = []
+        self.query_texts = []
+
+    def embed_documents(self, texts):
+        self.document_texts.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        self.query_texts.append(text)
+        return [float(len(text)), 1.5]
+
+
+def _build(max_entries=100):
+    inner = CountingEmbeddings()
+    cached = CachedEmbedding(
+        inner, client=redis_client, fingerprint=lambda: "test_fingerprint", max_entries=max_entries
+    )
+    cached.invalidate("test_fingerprint")
+    return inner, cached
+
+
+def test_identical_chunks_are_embedded_once():
+    inner, cached = _build()
+    assert cached.embed_documents(["abc", "abcd", "abc"]) == [[3.0, 0.5], [4.0, 0.5], [3.0, 0.5]]
+    # 其他文档中的相同切块直接命中缓存
+    assert cached.embed_documents(["abcd", "abcde"]) == [[4.0, 0.5], [5.0, 0.5]]
+    assert inner.document_texts == ["abc", "abcd", "abcde"]
+    assert cached.hits == 1 and cached.misses == 3
+    cached.invalidate("test_fingerprint")
+
+
+def test_query_cache_is_separate_from_documents():
+    inner, cached = _build()
+    cached.embed_documents(["abc"])
+    assert cached.embed_query("abc") == [3.0, 1.5]
+    assert cached.embed_query("abc") == [3.0, 1.5]
+    assert inner.query_texts == ["abc"]
+    cached.invalidate("test_fingerprint")
+
+
+def test_lru_eviction_and_invalidate():
+    inner, cached = _build(max_entries=2)
+    cached.embed_documents(["a"])
+    cached.embed_documents(["bb"])
+    cached.embed_documents(["a"])  # 刷新a的访问时间
+    cached.embed_documents(["ccc"])  # 淘汰bb
+    assert cached.get_stats()["entries"] == 2
+    cached.embed_documents(["a", "bb"])
+    assert inner.document_texts == ["a", "bb", "ccc", "bb"]
+    assert cached.invalidate("test_fingerprint") == 2
+    cached.embed_documents(["a"])
+    assert inner.document_texts[-1] == "a"
+    cached.invalidate("test_fingerprint")
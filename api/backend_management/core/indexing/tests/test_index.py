@@ -4,6 +4,7 @@ from langchain_core.documents import Document
 from core.extensions.ext_weaviate import weaviate_client
 from core.indexing.de_duplication import de_duplicator
 from core.indexing.index import index, update_meta_data, delete
+from core.utils.vector_store import get_collection_name
 
 
 def test_create_update_delete_common_knowledge():
@@ -92,20 +93,19 @@ def test_create_update_delete_common_knowledge():
         res = de_duplicator.get_all_source_ids(document_id=document_id)
         assert res == set(all_to_add_ids)
 
-    # TODO:异常
     with allure.step("修改文章元数据"):
         new_doc_id = all_to_add_ids[0]
-        # update_meta_data(
-        #     document_id=document_id,
-        #     tenant=tenant,
-        #     namespace=namespace,
-        #     meta_data_map={
-        #         "owner": "owner2",
-        #     }
-        # )
-        # jeopardy = weaviate_client.collections.get(f"common_knowledge_{tenant}_{namespace}")
-        # data_object = jeopardy.query.fetch_object_by_id(new_doc_id)
-        # assert data_object.properties["owner"] == "owner2"
+        update_meta_data(
+            document_id=document_id,
+            tenant=tenant,
+            namespace=namespace,
+            meta_data_map={
+                "owner": "owner2",
+            }
+        )
+        jeopardy = weaviate_client.collections.get(get_collection_name(tenant, namespace, "common"))
+        data_object = jeopardy.query.fetch_object_by_id(new_doc_id)
+        assert data_object.properties["owner"] == "owner2"
 
     with allure.step("删除这篇文章"):
         delete(
@@ -114,9 +114,137 @@ def test_create_update_delete_common_knowledge():
             namespace=namespace,
         )
         # 验证文章是否删除
-        jeopardy = weaviate_client.collections.get(f"common_knowledge_{tenant}_{namespace}")
+        jeopardy = weaviate_client.collections.get(get_collection_name(tenant, namespace, "common"))
         data_object = jeopardy.query.fetch_object_by_id(new_doc_id)
         assert data_object is None
         # 验证redis中是否删除
         res = de_duplicator.get_all_source_ids(document_id=document_id)
         assert res == set()
+
+
+def test_multi_batch_document_diff():
+    """切块数超过batch_size时，重复索引不应产生新增/删除"""
+    document_id = "123456790"
+    tenant = "tenant1"
+    namespace = "namespace1"
+    sections = "\n\n".join(
+        f"# 会议室{i}\n\n## 第{i}会议室号码是多少？\n\n {100000 + i} \n\n" for i in range(6)
+    )
+    doc = Document(
+        page_content=sections,
+        metadata={
+            "tenant": tenant,
+            "owner": "owner1",
+            "namespace": namespace,
+            "source": f"document_{document_id}",
+            "document_id": document_id,
+            "title": "会议室记录",
+            "H1": "",
+            "H2": "",
+            "H3": "",
+            "H4": "",
+            "H5": "",
+            "H6": "",
+        }
+    )
+
+    with allure.step("恢复测试失败的状态"):
+        if de_duplicator.get_all_source_ids(document_id=document_id):
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+    with allure.step("首次索引"):
+        all_to_add_ids, all_to_delete_ids = index(
+            document_id=document_id, tenant=tenant, namespace=namespace, doc=doc, batch_size=2
+        )
+        assert len(all_to_add_ids) == 6 and len(all_to_delete_ids) == 0
+
+    with allure.step("内容不变时重复索引"):
+        all_to_add_ids, all_to_delete_ids = index(
+            document_id=document_id, tenant=tenant, namespace=namespace, doc=doc, batch_size=2
+        )
+        assert len(all_to_add_ids) == 0 and len(all_to_delete_ids) == 0
+        assert len(de_duplicator.get_all_source_ids(document_id=document_id)) == 6
+
+    with allure.step("删除这篇文章"):
+        delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+
+def test_streaming_index_matches_index():
+    """流式索引与普通索引写入相同的切块"""
+    document_id = "123456791"
+    tenant = "tenant1"
+    namespace = "namespace1"
+    markdown = "\n\n".join(f"# 第{i}章\n\n" + f"第{i}章正文。" * 200 for i in range(5))
+    doc = Document(
+        page_content=markdown,
+        metadata={"tenant": tenant, "owner": "owner1", "namespace": namespace, "source": f"document_{document_id}",
+                  "document_id": document_id, "title": "手册", "H1": "", "H2": "", "H3": "", "H4": "", "H5": "",
+                  "H6": ""}
+    )
+
+    with allure.step("恢复测试失败的状态"):
+        if de_duplicator.get_all_source_ids(document_id=document_id):
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+    with allure.step("流式索引"):
+        streaming_add_ids, _ = index(
+            document_id=document_id, tenant=tenant, namespace=namespace, doc=doc, batch_size=2, streaming=True
+        )
+        source_ids = de_duplicator.get_all_source_ids(document_id=document_id)
+        assert source_ids == set(streaming_add_ids)
+
+    with allure.step("普通索引不再产生变更"):
+        all_to_add_ids, all_to_delete_ids = index(
+            document_id=document_id, tenant=tenant, namespace=namespace, doc=doc, batch_size=2
+        )
+        assert len(all_to_add_ids) == 0 and len(all_to_delete_ids) == 0
+
+    with allure.step("流式索引删除旧切块"):
+        doc.page_content = markdown.replace("第4章正文。", "第4章新正文。")
+        to_add_ids, to_delete_ids = index(
+            document_id=document_id, tenant=tenant, namespace=namespace, doc=doc, batch_size=2, streaming=True
+        )
+        assert to_add_ids and to_delete_ids
+        assert de_duplicator.get_all_source_ids(document_id=document_id) == source_ids - set(to_delete_ids) | set(to_add_ids)
+
+    with allure.step("删除这篇文章"):
+        delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+
+def test_delete_keeps_chunks_shared_with_other_documents():
+    """相同内容的切块被多篇文章共享，删除其中一篇不影响其他文章"""
+    tenant = "tenant1"
+    namespace = "namespace1"
+    document_ids = ["123456792", "123456793"]
+    markdown = "# 公共章节\n\n公共正文。\n\n"
+
+    def make_doc(document_id, extra):
+        return Document(
+            page_content=markdown + extra,
+            metadata={"tenant": tenant, "owner": "owner1", "namespace": namespace,
+                      "source": f"document_{document_id}", "document_id": document_id, "title": "手册",
+                      "H1": "", "H2": "", "H3": "", "H4": "", "H5": "", "H6": ""}
+        )
+
+    with allure.step("恢复测试失败的状态"):
+        for document_id in document_ids:
+            delete(document_id=document_id, tenant=tenant, namespace=namespace)
+
+    with allure.step("两篇文章包含相同的切块"):
+        first, second = document_ids
+        index(document_id=first, tenant=tenant, namespace=namespace, doc=make_doc(first, "# 第一篇\n\n独有内容一。"))
+        index(document_id=second, tenant=tenant, namespace=namespace, doc=make_doc(second, "# 第二篇\n\n独有内容二。"))
+        shared_ids = de_duplicator.get_all_source_ids(first) & de_duplicator.get_all_source_ids(second)
+        assert shared_ids
+
+    with allure.step("删除第一篇，共享切块保留"):
+        delete(document_id=first, tenant=tenant, namespace=namespace)
+        collection = weaviate_client.collections.get(get_collection_name(tenant, namespace, "common"))
+        for shared_id in shared_ids:
+            assert collection.query.fetch_object_by_id(shared_id) is not None
+        assert de_duplicator.get_shared_ids(shared_ids, de_duplicator.refs_key(namespace, "common")) == set()
+
+    with allure.step("删除第二篇后全部清理"):
+        delete(document_id=second, tenant=tenant, namespace=namespace)
+        for shared_id in shared_ids:
+            assert collection.query.fetch_object_by_id(shared_id) is None
@@ -0,0 +1,100 @@
+"""
+小知识库合并到共享collection(多租户)与超过阈值后迁移到独占collection
+"""
+import random
+import uuid
+
+import allure
+
+from core.extensions.ext_weaviate import weaviate_client
+from core.indexing import placement
+from core.indexing.de_duplication import de_duplicator
+from core.utils.vector_store import get_collection, get_collection_name, get_vector_store, vector_store_registry
+
+TENANT = "tenant1"
+NAMESPACE = "880001"
+CHUNKS = 300
+DIM = 768
+
+
+def _reset():
+    de_duplicator.redis_client.hdel("vector_placement:common", NAMESPACE)
+    vector_store_registry.invalidate(namespace=NAMESPACE)
+    name = get_collection_name(TENANT, NAMESPACE, "common")
+    if weaviate_client.collections.exists(name):
+        weaviate_client.collections.delete(name)
+    shared_name = placement.get_shared_collection_name("common")
+    if weaviate_client.collections.exists(shared_name):
+        shared = weaviate_client.collections.get(shared_name)
+        if NAMESPACE in shared.tenants.get():
+            shared.tenants.remove([NAMESPACE])
+
+
+def test_consolidated_storage_and_promotion(monkeypatch):
+    monkeypatch.setattr(placement, "STORAGE_MODE", "consolidated")
+    _reset()
+    vectors = [[random.random() for _ in range(DIM)] for _ in range(CHUNKS)]
+
+    with allure.step("新知识库写入共享collection中的tenant"):
+        vector_store = get_vector_store(TENANT, NAMESPACE, "common")
+        assert vector_store._index_name == placement.get_shared_collection_name("common")
+        assert vector_store.weaviate_tenant == NAMESPACE
+        assert not weaviate_client.collections.exists(get_collection_name(TENANT, NAMESPACE, "common"))
+        collection = get_collection(TENANT, NAMESPACE, "common")
+        with collection.batch.fixed_size(batch_size=100) as batch:
+            for i, vector in enumerate(vectors):
+                batch.add_object(
+                    properties={"text": f"chunk {i}", "document_id": "placement_doc", "namespace": NAMESPACE},
+                    uuid=str(uuid.uuid4()),
+                    vector=vector,
+                )
+        assert collection.aggregate.over_all(total_count=True).total_count == CHUNKS
+
+    with allure.step("检索只返回本tenant的数据"):
+        docs = vector_store.similarity_search_by_vector(vectors[0], k=3)
+        assert docs[0].page_content == "chunk 0"
+        assert all(doc.metadata["namespace"] == NAMESPACE for doc in docs)
+
+    with allure.step("超过阈值后迁移到独占collection，切换期间的写入和删除都被对账"):
+        assert placement.get_shared_namespaces("common")[NAMESPACE] == CHUNKS
+        source = collection
+        stale_ids = [
+            obj.uuid for obj in source.query.fetch_objects(limit=3).objects if obj.properties["text"] != "chunk 0"
+        ][:2]
+
+        shared_store = vector_store
+        passes = []
+
+        def stale_writes(_):
+            # 第一轮对账前 还未切换的进程: 在共享collection中删除1个、写入1个；
+            # 持有旧实例的进程删除1个，检查存放位置后改为在独占collection中删除
+            passes.append(_)
+            if len(passes) > 1:
+                return
+            source.data.delete_by_id(stale_ids[0])
+            source.data.insert(
+                properties={"text": "stale insert", "document_id": "placement_doc", "namespace": NAMESPACE},
+                vector=vectors[-1],
+            )
+            shared_store.delete([str(stale_ids[1])])
+
+        monkeypatch.setattr(placement.time, "sleep", stale_writes)
+        copied = placement.promote_namespace(TENANT, NAMESPACE, "common", settle_seconds=1)
+        assert copied == CHUNKS + 1
+        # 第二轮没有变化后才删除tenant
+        assert len(passes) == 2
+        assert placement.get_placement(TENANT, NAMESPACE, "common") == placement.DEDICATED
+        assert NAMESPACE not in placement.get_shared_namespaces("common")
+
+    with allure.step("调用方无感知地切换到独占collection"):
+        vector_store = get_vector_store(TENANT, NAMESPACE, "common")
+        assert vector_store._index_name == get_collection_name(TENANT, NAMESPACE, "common")
+        assert vector_store.weaviate_tenant is None
+        dedicated = get_collection(TENANT, NAMESPACE, "common")
+        assert dedicated.aggregate.over_all(total_count=True).total_count == CHUNKS - 1
+        assert dedicated.query.fetch_object_by_id(stale_ids[0]) is None
+        assert dedicated.query.fetch_object_by_id(stale_ids[1]) is None
+        docs = vector_store.similarity_search_by_vector(vectors[0], k=3)
+        assert docs[0].page_content == "chunk 0"
+
+    _reset()
@@ -0,0 +1,73 @@
+"""
+collection结构管理与在线压缩迁移
+"""
+import random
+
+import allure
+from weaviate.classes.config import Tokenization
+
+from core.extensions.ext_weaviate import weaviate_client
+from core.indexing import schema
+from core.indexing.schema import IndexTier, bytes_per_vector, schema_manager, tier_for
+
+TENANT = "tenant1"
+NAMESPACE = "schema_benchmark"
+DIM = 768
+
+
+def test_tiers_and_memory_estimate():
+    assert tier_for(0).name == "small"
+    assert tier_for(schema.INDEX_TIERS[0].max_objects).name == "medium"
+    assert tier_for(10 ** 9).name == "large"
+    # 刚进入PQ档位的collection已经达到训练数量
+    assert schema.pq_training_limit() == schema.INDEX_TIERS[0].max_objects
+    assert bytes_per_vector(DIM, None) == 3072
+    assert bytes_per_vector(DIM, "pq") == 192
+    assert bytes_per_vector(DIM, "bq") == 96
+
+
+def test_explicit_schema_and_online_migration(monkeypatch):
+    name = schema.get_collection_name(TENANT, NAMESPACE, "common")
+    if weaviate_client.collections.exists(name):
+        weaviate_client.collections.delete(name)
+
+    with allure.step("按显式结构创建collection"):
+        schema_manager.ensure_collection(TENANT, NAMESPACE, "common")
+        collection = weaviate_client.collections.get(name)
+        config = collection.config.get()
+        properties = {prop.name: prop for prop in config.properties}
+        assert properties["document_id"].tokenization == Tokenization.FIELD
+        assert properties["document_id"].index_filterable
+        assert properties["title"].index_searchable
+        assert config.vector_index_config.max_connections == schema.INDEX_TIERS[0].max_connections
+        assert config.vector_index_config.quantizer is None
+
+    with allure.step("写入数据"):
+        with collection.batch.fixed_size(batch_size=200) as batch:
+            for i in range(1000):
+                batch.add_object(
+                    properties={"text": f"chunk {i}", "document_id": str(i % 10)},
+                    vector=[random.random() for _ in range(DIM)],
+                )
+
+    with allure.step("数据量超过阈值后在线开启PQ"):
+        monkeypatch.setattr(schema, "INDEX_TIERS", [
+            IndexTier(name="small", max_objects=500, max_connections=32, ef_construction=128, ef=-1, quantizer=None),
+            IndexTier(name="medium", max_objects=None, max_connections=32, ef_construction=128, ef=-1, quantizer="pq"),
+        ])
+        plan = schema_manager.plan(TENANT, NAMESPACE, "common")
+        assert plan.object_count == 1000
+        assert plan.target.name == "medium"
+        assert plan.updates == {"quantizer": "pq"}
+        assert plan.memory_after * 16 == plan.memory_before
+        print(f"\n向量内存 {plan.memory_before} -> {plan.memory_after} 字节")
+
+        schema_manager.sync(TENANT, NAMESPACE, "common")
+        quantizer = collection.config.get().vector_index_config.quantizer
+        assert quantizer is not None
+        assert quantizer.training_limit == 500
+        # 迁移过程中检索不中断
+        assert len(collection.query.near_vector([random.random() for _ in range(DIM)], limit=5).objects) == 5
+        assert schema_manager.plan(TENANT, NAMESPACE, "common").updates == {}
+
+    weaviate_client.collections.delete(name)
@@ -28,3 +28,170 @@ def test_splitter():
             }
         )
     ]))
+
+
+def test_incremental_split_only_resplits_changed_sections():
+    from core.indexing.splitter import _split_section, split_docs as core_split_docs
+
+    sections = [f"# 章节{i}\n\n" + f"第{i}章的内容。" * 200 for i in range(20)]
+    metadata = {"title": "手册", "document_id": "manual"}
+    first = core_split_docs([Document(page_content="\n\n".join(sections), metadata=metadata)])
+
+    # 只修改一个章节
+    sections[7] = sections[7] + "新增的一句话。"
+    _split_section.cache_clear()
+    core_split_docs([Document(page_content="\n\n".join(sections[:7] + sections[8:]), metadata=metadata)])
+    before = _split_section.cache_info()
+    second = core_split_docs([Document(page_content="\n\n".join(sections), metadata=metadata)])
+    after = _split_section.cache_info()
+    # 未变化的19个章节命中缓存，只有修改的章节重新切分
+    assert after.hits - before.hits == 19
+    assert after.misses - before.misses == 1
+    changed = {d.page_content for d in second} - {d.page_content for d in first}
+    assert changed and all("章节7" in content for content in changed)
+
+
+def test_section_cache_is_bounded_by_bytes():
+    from core.indexing.splitter import SectionSplitCache
+
+    cache = SectionSplitCache(max_bytes=5000, max_entry_bytes=3000)
+    sections = [f"第{i}节的内容。" * 100 for i in range(10)]
+    for section in sections:
+        cache(section, 800, 150, ("手册", "第一章"))
+    info = cache.cache_info()
+    assert info.misses == 10 and info.bytes <= 5000 and info.currsize == 3
+    # 最近使用的段落仍在缓存中；标题路径不同视为不同段落
+    cache(sections[-1], 800, 150, ("手册", "第一章"))
+    cache(sections[-1], 800, 150, ("手册", "第二章"))
+    assert cache.cache_info().hits == 1 and cache.cache_info().misses == 11
+    # 超过单条上限的段落不缓存
+    before = cache.cache_info().currsize
+    huge = "超长段落。" * 5000
+    assert cache(huge, 800, 150) == cache(huge, 800, 150)
+    assert cache.cache_info().currsize == before and cache.cache_info().misses == 13
+
+
+def test_streaming_split_matches_split_docs():
+    import io
+
+    from core.indexing.splitter import _split_section, iter_split_docs, split_docs as core_split_docs
+
+    markdown = "\n\n".join(
+        f"# 第{i}章\n\n## 第{i}.1节\n\n" + "正文内容。" * 300 + "\n\n```python\n# 不是标题\nprint(1)\n```"
+        for i in range(10)
+    )
+    metadata = {"title": "手册", "document_id": "manual", "H1": "", "H2": ""}
+    expected = [(d.page_content, d.metadata) for d in core_split_docs([Document(page_content=markdown, metadata=metadata)])]
+    _split_section.cache_clear()
+    assert [(d.page_content, d.metadata) for d in iter_split_docs(markdown, metadata)] == expected
+    # 流式切分不占用段落缓存
+    assert _split_section.cache_info().currsize == 0
+    # 惰性产出: 取第一个切块时不会读完整个文件
+    source = io.StringIO(markdown)
+    first = next(iter_split_docs(source, metadata))
+    assert (first.page_content, first.metadata) == expected[0]
+    assert source.tell() < len(markdown)
+    # 文件对象按行读取
+    assert [(d.page_content, d.metadata) for d in iter_split_docs(io.StringIO(markdown), metadata)] == expected
+
+
+def test_streaming_split_bounds_buffer():
+    """没有标题的超大文档: 缓冲区超过buffer_size后就产出切块，不会整段读入"""
+    import time
+
+    from core.indexing.splitter import iter_split_docs
+
+    consumed = []
+
+    def lines(paragraphs):
+        for i in range(paragraphs):
+            line = f"第{i}段" + "正文内容，" * 30 + "\n"
+            consumed.append(len(line))
+            yield line
+            yield "\n"
+
+    chunks = iter_split_docs(lines(100000), {"title": "无标题"}, chunk_size=800, chunk_overlap=150, buffer_size=2000)
+    first = next(chunks)
+    assert first.page_content.startswith("多级标题:无标题\n\n第0段")
+    assert sum(consumed) <= 2000 + max(consumed)
+
+    start = time.perf_counter()
+    sizes = [len(first.page_content)] + [len(chunk.page_content) for chunk in chunks]
+    elapsed = time.perf_counter() - start
+    print(f"\n10万段无标题文档: {len(sizes)}个切块, {elapsed:.2f}s")
+    assert len(consumed) == 100000
+    assert max(sizes) <= 800 + len("多级标题:无标题\n\n")
+    assert len(sizes) > sum(consumed) // 800
+    # 段落按列表累积，耗时随文档大小线性增长
+    assert elapsed < 30
+
+
+def _generate_corpus(documents=400, sections=12):
+    import random
+
+    rng = random.Random(42)
+    vocabulary = ["向量", "检索", "索引", "知识库", "模型", "切块", "embedding", "weaviate", "。", "，", "\n"]
+    corpus = []
+    for i in range(documents):
+        body = "\n\n".join(
+            f"{'#' * rng.randint(1, 3)} 第{j}节\n\n" + "".join(rng.choice(vocabulary) for _ in range(rng.randint(200, 1500)))
+            for j in range(sections)
+        )
+        corpus.append(Document(page_content=body, metadata={"title": f"文档{i}", "document_id": str(i)}))
+    return corpus
+
+
+def test_parallel_split_benchmark():
+    import os
+    import time
+
+    from core.indexing.splitter import _split_section, split_docs as core_split_docs, split_docs_parallel
+
+    corpus = _generate_corpus()
+
+    _split_section.cache_clear()
+    start = time.perf_counter()
+    serial = core_split_docs(corpus)
+    serial_elapsed = time.perf_counter() - start
+
+    _split_section.cache_clear()
+    start = time.perf_counter()
+    parallel = split_docs_parallel(corpus)
+    parallel_elapsed = time.perf_counter() - start
+
+    # 结果与串行完全一致且保持顺序
+    assert [(d.page_content, d.metadata) for d in parallel] == [(d.page_content, d.metadata) for d in serial]
+    print(
+        f"\n{len(corpus)}篇文档/{len(serial)}个切块: 串行{serial_elapsed:.2f}s, "
+        f"并行({os.cpu_count()}进程){parallel_elapsed:.2f}s, 加速比{serial_elapsed / parallel_elapsed:.2f}x"
+    )
+
+
+def test_semantic_split_cuts_on_topic_change():
+    from langchain_core.embeddings import Embeddings
+
+    from core.indexing.splitter import split_docs as core_split_docs, split_docs_semantic
+
+    topics = ["猫", "股票", "火山"]
+
+    class TopicEmbeddings(Embeddings):
+        """按句子里出现的主题词生成向量，模拟主题切换"""
+
+        def embed_documents(self, texts):
+            return [[float(text.count(topic)) + 0.01 for topic in topics] for text in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    content = "# 杂谈\n\n" + "".join(f"{topic}的第{i}句话。" for topic in topics for i in range(6))
+    doc = Document(page_content=content, metadata={"title": "杂谈", "document_id": "semantic"})
+    chunks = split_docs_semantic([doc], embeddings=TopicEmbeddings(), breakpoint_percentile_threshold=80)
+    pprint(chunks)
+
+    assert len(chunks) == len(topics)
+    for topic, chunk in zip(topics, chunks):
+        assert chunk.page_content.startswith("多级标题:")
+        assert chunk.page_content.count(topic) == 6
+        assert chunk.metadata["document_id"] == "semantic"
+    # 与递归切分对比
+    print(f"\n语义切分 {len(chunks)} 块 vs 递归切分 {len(core_split_docs([doc]))} 块")
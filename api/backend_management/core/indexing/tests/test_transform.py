@@ -0,0 +1,123 @@
+"""
+按知识库配置的Embedding降维/量化: 召回率、编码体积与配置读写
+"""
+import uuid
+
+import allure
+import numpy as np
+import pytest
+
+from core.models.embedding import embedding
+
+from core.indexing.transform import EmbeddingTransform, TransformedEmbeddings, get_transform, set_transform
+from core.utils.vector_store import get_vector_store, vector_store_registry
+
+TENANT = "tenant1"
+NAMESPACE = "880002"
+DIM = 256
+K = 10
+
+
+def _low_rank(count, rank=32, seed=0):
+    # 真实Embedding的方差集中在少数方向上，用低秩数据加少量噪声模拟
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(42).normal(size=(rank, DIM))
+    return (rng.normal(size=(count, rank)) @ basis + 0.05 * rng.normal(size=(count, DIM))).astype(np.float32)
+
+
+def _recall(transform, base, queries):
+    def top_k(b, q):
+        b = b / np.linalg.norm(b, axis=1, keepdims=True)
+        q = q / np.linalg.norm(q, axis=1, keepdims=True)
+        return np.argsort(-(q @ b.T), axis=1)[:, :K]
+
+    truth = top_k(base, queries)
+    result = top_k(transform.apply(base), transform.apply(queries))
+    return np.mean([len(set(row) & set(expected)) / K for row, expected in zip(result, truth)])
+
+
+def test_transform_recall_and_size():
+    base = _low_rank(2000)
+    queries = _low_rank(100, seed=1)
+
+    with allure.step("量化与PCA的召回率和编码体积"):
+        rows = {}
+        for spec in ("none", "float16", "int8", "truncate:64", "pca:64", "pca:64,int8"):
+            transform = EmbeddingTransform.from_spec(spec, sample_vectors=base)
+            rows[spec] = (_recall(transform, base, queries), transform.bytes_per_vector(DIM))
+            print(f"\n{spec:<12} recall@{K}={rows[spec][0]:.3f} bytes={rows[spec][1]}")
+        assert rows["none"] == (1.0, DIM * 4)
+        assert rows["float16"][0] >= 0.99 and rows["float16"][1] == DIM * 2
+        assert rows["int8"][0] >= 0.95 and rows["int8"][1] == DIM + 4
+        # 低秩数据上PCA保留了几乎全部方差，截断前64维则不是(非Matryoshka模型)
+        assert rows["pca:64"][0] >= 0.95
+        assert rows["pca:64"][0] > rows["truncate:64"][0]
+        assert rows["pca:64,int8"][1] == 64 + 4
+
+    with allure.step("序列化后结果一致，输出归一化"):
+        transform = EmbeddingTransform.from_spec("truncate:128,pca:32,float16", sample_vectors=base)
+        assert transform.describe() == "truncate:128,pca:32,float16"
+        restored = EmbeddingTransform.from_json(transform.to_json())
+        assert np.array_equal(restored.apply(queries), transform.apply(queries))
+        assert transform.apply(queries).shape == (100, 32)
+        assert np.allclose(np.linalg.norm(transform.apply(queries), axis=1), 1, atol=1e-3)
+
+    with allure.step("不支持的变换"):
+        with pytest.raises(ValueError):
+            EmbeddingTransform.from_spec("pca:32")
+        with pytest.raises(ValueError):
+            EmbeddingTransform.from_spec("bf16")
+
+
+def test_transform_config_applies_to_vector_store():
+    set_transform(TENANT, NAMESPACE, "common", None)
+    assert get_transform(NAMESPACE, "common") is None
+
+    with allure.step("配置后新建的向量库实例写入和查询都执行变换"):
+        set_transform(TENANT, NAMESPACE, "common", EmbeddingTransform.from_spec("truncate:64"))
+        assert get_transform(NAMESPACE, "common").describe() == "truncate:64"
+        store = get_vector_store(TENANT, NAMESPACE, "common")
+        assert isinstance(store.embeddings, TransformedEmbeddings)
+        assert len(store.embeddings.embed_query("向量维度探测")) == 64
+
+    with allure.step("删除配置后恢复原始向量"):
+        set_transform(TENANT, NAMESPACE, "common", EmbeddingTransform.from_spec("none"))
+        assert get_transform(NAMESPACE, "common") is None
+        assert not isinstance(get_vector_store(TENANT, NAMESPACE, "common").embeddings, TransformedEmbeddings)
+    vector_store_registry.invalidate(namespace=NAMESPACE)
+
+
+@pytest.mark.asyncio
+async def test_vector_store_embeddings_async_path(monkeypatch):
+    """向量库实例的异步接口经过变换和缓存，最终调用全局Embedding的异步接口"""
+    set_transform(TENANT, NAMESPACE, "common", EmbeddingTransform.from_spec("truncate:64"))
+    texts = [f"异步路径 {uuid.uuid4()}" for _ in range(3)]
+    calls = []
+    aembed_documents = embedding.aembed_documents
+
+    async def counting(batch):
+        calls.append(list(batch))
+        return await aembed_documents(batch)
+
+    def sync_not_allowed(batch):
+        raise AssertionError("异步接口不应走同步Embedding")
+
+    monkeypatch.setattr(embedding, "aembed_documents", counting)
+    monkeypatch.setattr(embedding, "embed_documents", sync_not_allowed)
+
+    with allure.step("首次调用经过全局Embedding的异步接口，输出经过变换"):
+        store = get_vector_store(TENANT, NAMESPACE, "common")
+        vectors = await store.embeddings.aembed_documents(texts + texts[:1])
+        assert calls == [texts]
+        assert [len(vector) for vector in vectors] == [64] * 4
+        assert vectors[3] == vectors[0]
+
+    with allure.step("再次调用命中内容哈希缓存"):
+        assert await store.embeddings.aembed_documents(texts) == vectors[:3]
+        assert len(calls) == 1
+
+    with allure.step("查询向量"):
+        assert len(await store.embeddings.aembed_query(texts[0])) == 64
+
+    set_transform(TENANT, NAMESPACE, "common", None)
+    vector_store_registry.invalidate(namespace=NAMESPACE)
@@ -0,0 +1,205 @@
+"""
+按知识库配置的Embedding后处理
+Embedding服务返回的向量原样写入Weaviate，每个向量都是完整维度。可以按知识库配置依次执行的变换步骤:
+- truncate: Matryoshka截断，保留前dim维后重新归一化(只适用于按Matryoshka方式训练的模型)
+- pca: 在知识库样本上训练的PCA投影，投影到dim维后重新归一化
+- float16 / int8: 量化后再反量化为float32，模拟低精度存储带来的误差
+
+写入(api)和查询(components)使用同一份配置，保证两端向量处于同一空间。配置存放在去重Redis的
+embedding_transform:{knowledge_type}:{namespace} 中，修改后通过向量库注册表的失效广播通知各进程，
+并且需要重建该知识库的索引。
+
+关于存储: Weaviate始终按float32存放向量，内存和磁盘只随维度下降(截断/PCA)，float16/int8在Weaviate中
+只带来精度损失；量化的体积收益只在进程内索引等自己存放向量的地方成立，Weaviate侧的压缩使用schema中的PQ/BQ配置。
+"""
+import base64
+import json
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from core.indexing.de_duplication import de_duplicator
+
+_TRANSFORM_KEY = "embedding_transform:{}:{}"
+
+QUANTIZE_TYPES = ("float16", "int8")
+
+
+def _encode_array(array: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(array, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_array(data: str, shape) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(shape)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def fit_pca(vectors, dim: int) -> dict:
+    """
+    在样本向量上训练PCA投影
+    :param vectors: 原始维度的样本向量，数量不少于dim
+    :param dim: 投影后的维度
+    :return: pca步骤配置
+    """
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    if dim > min(vectors.shape):
+        raise ValueError(f"PCA维度{dim}不能超过样本数和原始维度: {vectors.shape}")
+    mean = vectors.mean(axis=0)
+    # 右奇异向量即协方差矩阵的特征向量，按方差降序
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    components = vt[:dim]
+    return {
+        "type": "pca",
+        "dim": dim,
+        "input_dim": vectors.shape[1],
+        "mean": _encode_array(mean),
+        "components": _encode_array(components),
+    }
+
+
+class EmbeddingTransform:
+    """依次执行的变换步骤，输入输出都是按行排列的向量"""
+
+    def __init__(self, steps: list[dict]):
+        self.steps = steps
+        self._pca = {}
+        for i, step in enumerate(steps):
+            if step["type"] == "pca":
+                self._pca[i] = (
+                    _decode_array(step["mean"], (step["input_dim"],)),
+                    _decode_array(step["components"], (step["dim"], step["input_dim"])),
+                )
+            elif step["type"] == "quantize" and step["dtype"] not in QUANTIZE_TYPES:
+                raise ValueError(f"不支持的量化类型: {step['dtype']}")
+            elif step["type"] not in ("truncate", "quantize"):
+                raise ValueError(f"不支持的变换: {step['type']}")
+
+    def apply(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i, step in enumerate(self.steps):
+            if step["type"] == "truncate":
+                vectors = _normalize(vectors[:, :step["dim"]])
+            elif step["type"] == "pca":
+                mean, components = self._pca[i]
+                vectors = _normalize((_normalize(vectors) - mean) @ components.T)
+            elif step["dtype"] == "float16":
+                vectors = vectors.astype(np.float16).astype(np.float32)
+            else:
+                # 按向量对称量化，每个向量一个缩放系数
+                scale = np.abs(vectors).max(axis=1, keepdims=True) / 127
+                scale[scale == 0] = 1
+                vectors = np.clip(np.round(vectors / scale), -127, 127) * scale
+        return vectors.astype(np.float32)
+
+    def output_dim(self, input_dim: int) -> int:
+        dim = input_dim
+        for step in self.steps:
+            if step["type"] in ("truncate", "pca"):
+                dim = min(dim, step["dim"])
+        return dim
+
+    def bytes_per_vector(self, input_dim: int) -> int:
+        """按最后一个量化步骤的精度计算单个向量的编码体积"""
+        dim = self.output_dim(input_dim)
+        dtypes = [step["dtype"] for step in self.steps if step["type"] == "quantize"]
+        if not dtypes:
+            return dim * 4
+        # int8额外保存一个float32缩放系数
+        return dim * 2 if dtypes[-1] == "float16" else dim + 4
+
+    def describe(self) -> str:
+        if not self.steps:
+            return "none"
+        return ",".join(
+            step["dtype"] if step["type"] == "quantize" else f"{step['type']}:{step['dim']}" for step in self.steps
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({"steps": self.steps})
+
+    @classmethod
+    def from_json(cls, data: str) -> "EmbeddingTransform":
+        return cls(json.loads(data)["steps"])
+
+    @classmethod
+    def from_spec(cls, spec: str, sample_vectors=None) -> "EmbeddingTransform":
+        """
+        按描述创建，例如 "truncate:256,int8" / "pca:128,float16" / "none"
+        :param sample_vectors: 包含pca步骤时用于训练的原始向量
+        """
+        steps = []
+        for token in filter(None, (token.strip() for token in spec.split(","))):
+            name, _, value = token.partition(":")
+            if name == "none":
+                continue
+            if name in QUANTIZE_TYPES:
+                steps.append({"type": "quantize", "dtype": name})
+            elif name == "truncate":
+                steps.append({"type": "truncate", "dim": int(value)})
+            elif name == "pca":
+                if sample_vectors is None:
+                    raise ValueError("pca变换需要样本向量")
+                # pca前的截断步骤也要作用在训练样本上
+                steps.append(fit_pca(cls(steps).apply(sample_vectors), int(value)))
+            else:
+                raise ValueError(f"不支持的变换: {token}")
+        return cls(steps)
+
+
+class TransformedEmbeddings(Embeddings):
+    """对Embedding结果执行变换，写入和查询共用"""
+
+    def __init__(self, embeddings: Embeddings, transform: EmbeddingTransform):
+        self.embeddings = embeddings
+        self.transform = transform
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self.transform.apply(self.embeddings.embed_documents(texts)).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.transform.apply([self.embeddings.embed_query(text)])[0].tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self.transform.apply(await self.embeddings.aembed_documents(texts)).tolist()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self.transform.apply([await self.embeddings.aembed_query(text)])[0].tolist()
+
+
+def get_transform(namespace: str, knowledge_type: str) -> Optional[EmbeddingTransform]:
+    """获取知识库的变换配置，没有配置时返回None"""
+    data = de_duplicator.redis_client.get(_TRANSFORM_KEY.format(knowledge_type, namespace))
+    if not data:
+        return None
+    return EmbeddingTransform.from_json(data)
+
+
+def set_transform(tenant: str, namespace: str, knowledge_type: str, transform: Optional[EmbeddingTransform]):
+    """
+    修改知识库的变换配置，为空或没有步骤时删除配置；修改后需要重建该知识库的索引，
+    一般通过 reindex_namespace(..., transform=) 在同一次操作中修改并重建
+    共享collection中的知识库不允许改变向量维度，需要先迁移到独占collection
+    """
+    from core.indexing.placement import SHARED, get_placement
+    from core.utils.vector_store import vector_store_registry
+
+    key = _TRANSFORM_KEY.format(knowledge_type, namespace)
+    if transform is None or not transform.steps:
+        de_duplicator.redis_client.delete(key)
+    else:
+        if any(step["type"] in ("truncate", "pca") for step in transform.steps) and \
+                get_placement(tenant, namespace, knowledge_type) == SHARED:
+            raise ValueError(f"知识库{namespace}存放在共享collection中，不能改变向量维度")
+        de_duplicator.redis_client.set(key, transform.to_json())
+    # 各进程重新创建向量库实例，读取新的配置
+    vector_store_registry.invalidate(namespace, knowledge_type)
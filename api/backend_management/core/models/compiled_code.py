@@ -0,0 +1,129 @@
+"""
+缓存编译后的动态代码
+CodeGeneration 生成的代码以 {函数名: 函数代码} 的JSON存放在Django缓存中，每次调用都读取缓存、解析JSON、exec
+会在真正的网络请求之前多出一次Redis往返和一次Python编译。这里按内容哈希缓存编译好的函数:
+- 保存代码时递增 {redis_key}_version (bump_code_version)
+- 进程内最多每check_interval秒读一次版本号，版本变化时才重新读取代码；内容哈希不变时不会重新exec
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.core.cache import cache
+
+VERSION_KEY_SUFFIX = "_version"
+
+
+def bump_code_version(redis_key: str):
+    """代码写入缓存后调用，通知各进程重新加载"""
+    version_key = f"{redis_key}{VERSION_KEY_SUFFIX}"
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # 键不存在
+        cache.set(version_key, 1, timeout=None)
+
+
+@dataclass
+class CompiledCode:
+    # 原始JSON的sha1前16位，与代码内容一一对应
+    content_hash: str
+    functions: dict[str, Callable]
+
+
+class CompiledCodeCache:
+    """按内容哈希缓存某个redis_key下编译好的函数"""
+
+    def __init__(
+            self,
+            redis_key: str,
+            function_names: list[str],
+            check_interval: float = 5,
+            namespace: Optional[dict] = None,
+            max_versions: int = 4,
+    ):
+        """
+        :param redis_key: 代码在Django缓存中的键
+        :param function_names: 需要编译的函数名
+        :param check_interval: 检查版本号的间隔秒数，为0时每次调用都检查
+        :param namespace: exec使用的全局变量，生成的代码可以直接引用其中的名字
+        :param max_versions: 进程内最多保留的编译结果数
+        """
+        self.redis_key = redis_key
+        self.version_key = f"{redis_key}{VERSION_KEY_SUFFIX}"
+        self.function_names = function_names
+        self.check_interval = check_interval
+        self.namespace = namespace if namespace is not None else {}
+        self.max_versions = max_versions
+        self._compiled: OrderedDict[str, CompiledCode] = OrderedDict()
+        self._current: Optional[CompiledCode] = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.compiles = 0
+        self.reloads = 0
+
+    def _compile(self, raw: str) -> CompiledCode:
+        content_hash = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        compiled = self._compiled.get(content_hash)
+        if compiled is not None:
+            self._compiled.move_to_end(content_hash)
+            return compiled
+        code_mapping = json.loads(raw)
+        functions = {}
+        for name in self.function_names:
+            # 可选函数(例如旧代码中没有的异步实现)不存在时跳过
+            if not code_mapping.get(name):
+                continue
+            local_vars = {}
+            code = compile(code_mapping[name], f"<{self.redis_key}:{name}>", "exec")
+            exec(code, self.namespace, local_vars)
+            functions[name] = local_vars[name]
+        self.compiles += 1
+        compiled = CompiledCode(content_hash=content_hash, functions=functions)
+        self._compiled[content_hash] = compiled
+        while len(self._compiled) > self.max_versions:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def get(self) -> CompiledCode:
+        """获取当前代码的编译结果，缓存中没有代码时抛出ValueError"""
+        if self._current is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._current
+        with self._lock:
+            if self._current is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._current
+            version = cache.get(self.version_key)
+            # 没有版本号(升级前保存的代码)时每次检查都重新读取代码，依靠内容哈希避免重复编译
+            if self._current is None or version is None or version != self._version:
+                raw = cache.get(self.redis_key)
+                if not raw:
+                    raise ValueError(f"缓存中没有{self.redis_key}代码")
+                self._current = self._compile(raw)
+                self._version = version
+                self.reloads += 1
+            self._checked_at = time.monotonic()
+            return self._current
+
+    def get_function(self, name: str) -> Callable:
+        return self.get().functions[name]
+
+    def find_function(self, name: str) -> Optional[Callable]:
+        """获取可选函数，不存在时返回None"""
+        return self.get().functions.get(name)
+
+    def invalidate(self):
+        """下次调用时重新检查版本号"""
+        self._checked_at = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "content_hash": self._current.content_hash if self._current else None,
+            "version": self._version,
+            "compiles": self.compiles,
+            "reloads": self.reloads,
+        }
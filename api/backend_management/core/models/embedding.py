@@ -1,32 +1,103 @@
+import asyncio
+import os
+import weakref
 from typing import List
 from django.core.cache import cache
 from langchain_core.embeddings import Embeddings
 import json
 
+from core.models.compiled_code import CompiledCodeCache
+
 
 # 如果有额外的导包需求不能在这里导入:比如requests等,在函数里面导入即可。
 
 class GlobalEmbedding(Embeddings):
+    def __init__(self, batch_size: int = 32, max_concurrency: int = 4, max_connections: int = 20):
+        """
+        :param batch_size: 异步调用时每批的文本数
+        :param max_concurrency: 单次异步调用中同时请求的批数
+        :param max_connections: 共享连接池的最大连接数，限制所有调用合计的并发
+        """
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        # httpx.AsyncClient 绑定创建时的事件循环，每个事件循环一个连接池
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def get_async_client(self):
+        """生成的异步代码通过该方法获取共享的httpx.AsyncClient，不要自己创建或关闭客户端"""
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60, connect=10),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed search docs.
         返回内容示例：Response: [[0.5, 0.6, 0.7], [0.5, 0.6, 0.7], ...]
         """
-        code_mapping = json.loads(cache.get("global_embedding"))
-        _code = code_mapping.get('embed_documents')
-        exec(_code)
-        return locals()['embed_documents'](self, texts)
+        return global_embedding_code.get_function('embed_documents')(self, texts)
 
     def embed_query(self, text: str) -> List[float]:
         """Embed query text.
         返回内容示例：Response: [-0.030950097, -0.042273305, -0.03612379, xxx]
         """
         # 如果要导包就在函数内部导包即可
-        code_mapping = json.loads(cache.get("global_embedding"))
-        _code = code_mapping.get('embed_query')
-        exec(_code)
-        return locals()['embed_query'](self, text)
+        return global_embedding_code.get_function('embed_query')(self, text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous Embed search docs.
+        按batch_size分批，最多max_concurrency批同时请求；
+        之前生成的代码没有异步实现时，在线程中执行同步实现
+        """
+        if not texts:
+            return []
+        _aembed_documents = global_embedding_code.find_function('aembed_documents')
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                if _aembed_documents is not None:
+                    return await _aembed_documents(self, batch)
+                return await loop.run_in_executor(None, self.embed_documents, batch)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*[_embed(batch) for batch in batches])
+        return [vector for result in results for vector in result]
 
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous Embed query text."""
+        _aembed_query = global_embedding_code.find_function('aembed_query')
+        if _aembed_query is not None:
+            return await _aembed_query(self, text)
+        return (await self.aembed_documents([text]))[0]
 
-embedding = GlobalEmbedding()
 
+# 生成的代码在本模块的全局变量中执行，与之前在方法内exec时可引用的名字一致
+global_embedding_code = CompiledCodeCache(
+    redis_key="global_embedding",
+    function_names=['embed_documents', 'embed_query', 'aembed_documents', 'aembed_query'],
+    check_interval=float(os.getenv('GLOBAL_EMBEDDING_CHECK_INTERVAL', 5)),
+    namespace=globals(),
+)
 
+embedding = GlobalEmbedding(
+    batch_size=int(os.getenv('GLOBAL_EMBEDDING_BATCH_SIZE', 32)),
+    max_concurrency=int(os.getenv('GLOBAL_EMBEDDING_MAX_CONCURRENCY', 4)),
+    max_connections=int(os.getenv('GLOBAL_EMBEDDING_MAX_CONNECTIONS', 20)),
+)
@@ -1,3 +1,12 @@
+import asyncio
+import json
+import time
+
+import allure
+import pytest
+from django.core.cache import cache
+
+from core.models.compiled_code import CompiledCodeCache, bump_code_version
 from core.models.embedding import embedding
 
 
@@ -11,3 +20,57 @@ def test_global_embedding():
     # assert text_response is not None
     print("Status:", "ok")
     print("Response:", text_response)
+
+
+@pytest.mark.asyncio
+async def test_global_embedding_async():
+    texts = [f"Deep Learning {i}" for i in range(100)]
+    with allure.step("分批并发的异步结果与同步结果一致"):
+        start = time.perf_counter()
+        vectors = await embedding.aembed_documents(texts)
+        print(f"\n异步{len(texts)}条: {(time.perf_counter() - start) * 1000:.0f}ms")
+        assert len(vectors) == len(texts)
+        assert vectors[:embedding.batch_size] == embedding.embed_documents(texts[:embedding.batch_size])
+    with allure.step("并发调用共享同一个连接池"):
+        await asyncio.gather(*[embedding.aembed_query(text) for text in texts[:10]])
+        assert embedding.get_async_client() is embedding.get_async_client()
+    await embedding.aclose()
+
+
+def test_compiled_code_overhead():
+    redis_key = "test_compiled_embedding"
+    code_mapping = {
+        "embed_query": "def embed_query(self, text):\n    return [float(len(text))] * 3\n",
+    }
+    cache.set(redis_key, json.dumps(code_mapping), timeout=None)
+    bump_code_version(redis_key)
+    compiled_code = CompiledCodeCache(redis_key=redis_key, function_names=["embed_query"], check_interval=5)
+    rounds = 200
+
+    with allure.step("每次调用读取缓存、解析JSON、exec"):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            _code = json.loads(cache.get(redis_key)).get("embed_query")
+            local_vars = {}
+            exec(_code, globals(), local_vars)
+            local_vars["embed_query"](None, "abc")
+        before_us = (time.perf_counter() - start) / rounds * 1e6
+
+    with allure.step("使用编译缓存"):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            assert compiled_code.get_function("embed_query")(None, "abc") == [3.0] * 3
+        after_us = (time.perf_counter() - start) / rounds * 1e6
+        print(f"\n每次调用额外开销: {before_us:.1f}us -> {after_us:.1f}us")
+        assert compiled_code.compiles == 1
+        assert after_us < before_us
+
+    with allure.step("保存新代码后按版本号重新编译"):
+        code_mapping["embed_query"] = "def embed_query(self, text):\n    return [0.0]\n"
+        cache.set(redis_key, json.dumps(code_mapping), timeout=None)
+        bump_code_version(redis_key)
+        compiled_code.invalidate()
+        assert compiled_code.get_function("embed_query")(None, "abc") == [0.0]
+        assert compiled_code.compiles == 2
+
+    cache.delete_many([redis_key, compiled_code.version_key])
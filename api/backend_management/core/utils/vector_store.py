@@ -1,59 +1,233 @@
-from functools import lru_cache
+import json
+import os
+from typing import Optional
 
+from ai_native_core.utils.registry import VectorStoreRegistry
 from langchain_weaviate import WeaviateVectorStore
 
-from core.extensions.ext_weaviate import weaviate_client
-from core.models.embedding import embedding
+from core.extensions.ext_redis import redis_client
+from core.extensions.ext_weaviate import weaviate_client, weaviate_client_manager
+from core.indexing.de_duplication import de_duplicator
+from core.indexing.embedding_cache import cached_embedding
+from core.indexing.placement import SHARED, get_placement, get_shared_collection_name
+from core.indexing.transform import TransformedEmbeddings, get_transform
+from llm_api.settings.base import warning_logger
 
 
-@lru_cache(maxsize=1000)
-def get_vector_store(
+def get_collection_name(
         tenant: str,
         namespace: str,
         knowledge_type: str
-):
+) -> str:
+    """
+    向量库collection名称，按命名空间纵向隔离(tenant目前不参与命名)
+    :param tenant: 租户
+    :param namespace: 命名空间
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :return:
+    """
     if knowledge_type == "common":
-        return WeaviateVectorStore(
-            client=weaviate_client,
-            index_name=f"common_knowledge_none_{namespace}",  # 数据库index，纵向隔离
-            text_key='text',  # 文本字段
-            embedding=embedding,
-            attributes=[
-                'text',
-                'tenant',
-                'owner',
-                'namespace',
-                'source',
-                'document_id',
-                'title',
-            ],
-        )
+        return f"common_knowledge_none_{namespace}"
     elif knowledge_type == "tool":
-        return WeaviateVectorStore(
-            client=weaviate_client,
-            index_name=f"tool_knowledge_none_{namespace}",  # 数据库index，纵向隔离
-            text_key='text',  # 文本字段
-            embedding=embedding,
-            attributes=[
-                'text',
-                'tenant',
-                'owner',
-                'namespace',
-                'source',
-                'document_id',
-                'input_schema',
-                'few_shots',
-                'name',
-                'description',
-                'tool_type',
-                'output_schema',
-                'jinja2_template',
-                'html_template',
-                'extra_params',
-            ],
+        return f"tool_knowledge_none_{namespace}"
+    raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+
+
+# 检索时返回的元数据字段，api与components保持一致
+COMMON_ATTRIBUTES = [
+    'text',
+    'tenant',
+    'owner',
+    'namespace',
+    'source',
+    'document_id',
+    'title',
+]
+TOOL_ATTRIBUTES = [
+    'text',
+    'tenant',
+    'owner',
+    'namespace',
+    'source',
+    'document_id',
+    'input_schema',
+    'few_shots',
+    'tool_trigger_selected_examples',
+    'name',
+    'description',
+    'tool_type',
+    'output_schema',
+    'output_schema_jinja2_template',
+    'html_template',
+    'extra_params',
+]
+
+# 知识数据变化的广播频道和数据版本，agent进程内的向量索引据此重新加载
+KNOWLEDGE_CHANGED_CHANNEL = "knowledge:changed"
+KNOWLEDGE_VERSION_KEY = "knowledge_version:{}:{}"
+
+
+class PooledWeaviateVectorStore(WeaviateVectorStore):
+    """
+    - collection句柄每次从当前线程的连接获取，连接池重连后不会继续使用已关闭连接上的句柄
+    - 存放在共享collection中的知识库绑定对应的tenant，写入、删除、检索时自动带上
+    """
+
+    def __init__(
+            self,
+            *args,
+            weaviate_tenant: Optional[str] = None,
+            placement_key: Optional[tuple[str, str, str]] = None,
+            **kwargs
+    ):
+        """
+        :param weaviate_tenant: 共享collection中的tenant，独占collection为空
+        :param placement_key: 共享collection中知识库的(tenant, namespace, knowledge_type)，写入前据此检查是否已迁移
+        """
+        self.weaviate_tenant = weaviate_tenant
+        self.placement_key = placement_key
+        super().__init__(*args, **kwargs)
+
+    @property
+    def _collection(self):
+        return self._client.collections.get(self._index_name)
+
+    @_collection.setter
+    def _collection(self, value):
+        # 父类初始化时会保存句柄，这里改为按需获取
+        pass
+
+    def _does_tenant_exist(self, tenant: str) -> bool:
+        # 共享collection开启了自动创建tenant，省去每次写入前查询tenant列表
+        return True
+
+    def _promoted(self) -> Optional["PooledWeaviateVectorStore"]:
+        """
+        知识库已从共享collection迁移到独占collection时返回新的实例
+        迁移过程中还持有旧实例的调用(例如正在分批写入的索引任务)改为写入独占collection，
+        写入旧tenant的数据会随tenant一起删除
+        """
+        if self.placement_key is None or get_placement(*self.placement_key) == SHARED:
+            return None
+        return get_vector_store(*self.placement_key)
+
+    def add_texts(self, texts, metadatas=None, tenant: Optional[str] = None, **kwargs):
+        promoted = self._promoted()
+        if promoted is not None:
+            return promoted.add_texts(texts, metadatas, **kwargs)
+        # langchain-weaviate使用client.batch写入，它是客户端上的共享状态，需要独占一个客户端
+        with weaviate_client_manager.lease():
+            return super().add_texts(texts, metadatas, tenant=tenant or self.weaviate_tenant, **kwargs)
+
+    def delete(self, ids=None, tenant: Optional[str] = None, **kwargs):
+        promoted = self._promoted()
+        if promoted is not None:
+            return promoted.delete(ids, **kwargs)
+        return super().delete(ids, tenant=tenant or self.weaviate_tenant, **kwargs)
+
+    def _perform_search(self, query, k, return_score=False, tenant: Optional[str] = None, **kwargs):
+        return super()._perform_search(
+            query, k, return_score=return_score, tenant=tenant or self.weaviate_tenant, **kwargs
         )
+
+
+def _create_vector_store(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+) -> WeaviateVectorStore:
+    from core.indexing.schema import schema_manager
+
+    if knowledge_type == "common":
+        attributes = COMMON_ATTRIBUTES
+    elif knowledge_type == "tool":
+        attributes = TOOL_ATTRIBUTES
     else:
         raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+    # 按显式结构创建collection，避免langchain-weaviate使用默认结构
+    if get_placement(tenant, namespace, knowledge_type) == SHARED:
+        index_name = schema_manager.ensure_shared_collection(knowledge_type)
+        weaviate_tenant = namespace
+        placement_key = (tenant, namespace, knowledge_type)
+    else:
+        index_name = schema_manager.ensure_collection(tenant, namespace, knowledge_type)
+        weaviate_tenant = None
+        placement_key = None
+    embedding = cached_embedding
+    transform = get_transform(namespace, knowledge_type)
+    if transform is not None:
+        # 知识库配置了降维/量化时，写入和查询都执行同样的变换
+        embedding = TransformedEmbeddings(cached_embedding, transform)
+    return PooledWeaviateVectorStore(
+        client=weaviate_client,
+        index_name=index_name,  # 数据库index，独占collection纵向隔离，共享collection按tenant隔离
+        text_key='text',  # 文本字段
+        embedding=embedding,  # (降维/量化 ->) 内容哈希缓存 -> 合并并发请求 -> 全局Embedding
+        attributes=attributes,
+        weaviate_tenant=weaviate_tenant,
+        placement_key=placement_key,
+    )
+
+
+vector_store_registry = VectorStoreRegistry(
+    factory=_create_vector_store,
+    ttl=float(os.getenv('VECTOR_STORE_REGISTRY_TTL', 300)),
+    max_size=int(os.getenv('VECTOR_STORE_REGISTRY_MAX_SIZE', 1000)),
+    client=redis_client,
+)
+
+
+def get_vector_store(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+) -> WeaviateVectorStore:
+    return vector_store_registry.get(tenant, namespace, knowledge_type)
+
+
+def get_collection(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+):
+    """
+    获取collection句柄，绑定当前线程的连接，不做缓存
+    存放在共享collection中的知识库返回绑定tenant的句柄
+    """
+    if get_placement(tenant, namespace, knowledge_type) == SHARED:
+        return weaviate_client.collections.get(get_shared_collection_name(knowledge_type)).with_tenant(namespace)
+    return weaviate_client.collections.get(get_collection_name(tenant, namespace, knowledge_type))
+
+
+def collection_exists(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+) -> bool:
+    """知识库的collection(共享collection中为tenant)是否已创建"""
+    if get_placement(tenant, namespace, knowledge_type) == SHARED:
+        name = get_shared_collection_name(knowledge_type)
+        if not weaviate_client.collections.exists(name):
+            return False
+        return weaviate_client.collections.get(name).tenants.exists(namespace)
+    return weaviate_client.collections.exists(get_collection_name(tenant, namespace, knowledge_type))
+
+
+def notify_knowledge_changed(namespace: str, knowledge_type: str):
+    """
+    知识写入/删除后递增数据版本并广播
+    :param namespace: 命名空间
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    """
+    de_duplicator.redis_client.incr(KNOWLEDGE_VERSION_KEY.format(knowledge_type, namespace))
+    try:
+        redis_client.publish(
+            KNOWLEDGE_CHANGED_CHANNEL,
+            json.dumps({"namespace": namespace, "knowledge_type": knowledge_type})
+        )
+    except Exception as e:
+        # 订阅方会按间隔检查数据版本
+        warning_logger(f"广播知识变更消息失败: {str(e)}")
 
 
 def get_vector_stores(
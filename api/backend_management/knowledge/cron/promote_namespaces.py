@@ -0,0 +1,25 @@
+from core.indexing.placement import PROMOTION_THRESHOLD, get_shared_namespaces, promote_namespace
+from knowledge.models import Namespace
+from llm_api.settings.base import error_logger, info_logger
+
+
+def promote_large_namespaces():
+    """把共享collection中数据量超过阈值的知识库迁移到独占collection"""
+    for knowledge_type in ('common', 'tool'):
+        try:
+            shared_namespaces = get_shared_namespaces(knowledge_type)
+        except Exception as e:
+            error_logger(f"获取共享collection {knowledge_type} 的知识库失败: {str(e)}")
+            continue
+        large = [namespace for namespace, count in shared_namespaces.items() if count >= PROMOTION_THRESHOLD]
+        creators = dict(Namespace.objects.filter(id__in=large).values_list('id', 'creator_id'))
+        for namespace in large:
+            creator_id = creators.get(int(namespace))
+            if creator_id is None:
+                continue
+            try:
+                copied = promote_namespace(str(creator_id), namespace, knowledge_type)
+            except Exception as e:
+                error_logger(f"知识库 {namespace} {knowledge_type} 迁移到独占collection失败: {str(e)}")
+                continue
+            info_logger(f"知识库 {namespace} {knowledge_type} 已迁移到独占collection，复制 {copied} 个对象")
@@ -0,0 +1,16 @@
+from core.indexing.schema import schema_manager
+from knowledge.models import Namespace
+from llm_api.settings.base import error_logger, info_logger
+
+
+def sync_vector_schemas():
+    """按数据量把所有知识库的collection在线迁移到对应的索引档位"""
+    for namespace in Namespace.objects.filter(is_active=True).only('id', 'creator_id'):
+        for knowledge_type in ('common', 'tool'):
+            try:
+                plan = schema_manager.sync(str(namespace.creator_id), str(namespace.id), knowledge_type)
+            except Exception as e:
+                error_logger(f"知识库 {namespace.id} {knowledge_type} collection迁移失败: {str(e)}")
+                continue
+            if plan.drift:
+                info_logger(f"collection {plan.collection} 有需要重建才能生效的差异: {plan.drift}")
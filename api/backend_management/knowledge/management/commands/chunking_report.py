@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.indexing.index import split_document
+from knowledge.models import KnowledgeDocument, Namespace
+from knowledge.utils.vector_db_helper import DocumentVectorDBWrapper
+
+# HNSW每个向量的邻接表开销估算: maxConnections(默认32) * 2(第0层双倍) * 8字节
+HNSW_LINK_BYTES = 32 * 2 * 8
+
+
+class Command(BaseCommand):
+    help = '对比固定窗口递归切分与语义切分的切块数量和索引体积估算'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace_ids', nargs='+', type=int, help='知识库ID')
+        parser.add_argument('--limit', type=int, default=200, help='每个知识库最多采样的文档数')
+
+    def handle(self, *args, **options):
+        from core.indexing.embedding_cache import cached_embedding
+
+        dim = len(cached_embedding.embed_query('向量维度探测'))
+        vector_bytes = dim * 4 + HNSW_LINK_BYTES
+        self.stdout.write(f'向量维度: {dim}, 单个切块向量+HNSW估算: {vector_bytes} 字节')
+
+        for namespace_id in options['namespace_ids']:
+            try:
+                namespace = Namespace.objects.get(id=namespace_id, is_active=True)
+            except Namespace.DoesNotExist:
+                raise CommandError(f'知识库 {namespace_id} 不存在')
+
+            documents = KnowledgeDocument.objects.filter(
+                namespace_id=namespace.id, is_active=True, doc_type='document'
+            ).exclude(markdown_content__isnull=True).exclude(markdown_content='').order_by('id')[:options['limit']]
+
+            report = {strategy: {'chunks': 0, 'chars': 0, 'text_bytes': 0} for strategy in ('recursive', 'semantic')}
+            doc_count = 0
+            for document in documents.iterator():
+                doc_count += 1
+                vector_doc = DocumentVectorDBWrapper.build_vector_doc(document)
+                for strategy, totals in report.items():
+                    chunks = split_document(vector_doc, knowledge_type='common', chunk_strategy=strategy)
+                    totals['chunks'] += len(chunks)
+                    totals['chars'] += sum(len(chunk.page_content) for chunk in chunks)
+                    totals['text_bytes'] += sum(len(chunk.page_content.encode('utf-8')) for chunk in chunks)
+
+            self.stdout.write(
+                f'知识库 {namespace.name}({namespace_id}) 当前策略: {namespace.chunk_strategy}, 采样文档: {doc_count}'
+            )
+            for strategy, totals in report.items():
+                chunks = totals['chunks']
+                index_bytes = chunks * vector_bytes + totals['text_bytes']
+                avg_chars = totals['chars'] / chunks if chunks else 0
+                self.stdout.write(
+                    f'  {strategy:<9} 切块数: {chunks:>7}  平均长度: {avg_chars:>7.1f}  '
+                    f'索引估算: {index_bytes / 1024 / 1024:>8.2f} MB'
+                )
+            recursive_chunks = report['recursive']['chunks']
+            if recursive_chunks:
+                ratio = report['semantic']['chunks'] / recursive_chunks
+                self.stdout.write(self.style.SUCCESS(f'  语义切分切块数为递归切分的 {ratio:.1%}'))
@@ -0,0 +1,110 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.indexing.transform import EmbeddingTransform, get_transform
+from core.utils.vector_store import get_collection
+from knowledge.models import Namespace
+from knowledge.utils.vector_db_helper import reindex_namespace
+
+# HNSW每个向量的邻接表开销估算: maxConnections(默认32) * 2(第0层双倍) * 8字节
+HNSW_LINK_BYTES = 32 * 2 * 8
+
+DEFAULT_CANDIDATES = [
+    'none', 'float16', 'int8', 'truncate:512', 'truncate:256', 'truncate:128',
+    'pca:256', 'pca:128', 'pca:128,int8',
+]
+
+
+def _top_k(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    base = base / (np.linalg.norm(base, axis=1, keepdims=True) + 1e-12)
+    queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12)
+    scores = queries @ base.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+class Command(BaseCommand):
+    help = '在知识库样本上评估Embedding降维/量化的召回率与体积，可选地应用到该知识库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace_id', type=int, help='知识库ID')
+        parser.add_argument('--knowledge-type', choices=['common', 'tool'], default='common', help='知识类型')
+        parser.add_argument('--sample', type=int, default=2000, help='采样的切块数')
+        parser.add_argument('--queries', type=int, default=100, help='从样本中留出作为查询的切块数')
+        parser.add_argument('--k', type=int, default=10, help='recall@k')
+        parser.add_argument(
+            '--candidates', nargs='+', default=DEFAULT_CANDIDATES,
+            help='待评估的变换，例如 truncate:256 pca:128,int8 float16'
+        )
+        parser.add_argument(
+            '--apply', default=None,
+            help='把指定变换应用到知识库(pca在本次样本上训练)并立即清空、全量重建该知识库的索引，none表示删除配置'
+        )
+
+    def handle(self, *args, **options):
+        from core.indexing.embedding_cache import cached_embedding
+
+        try:
+            namespace = Namespace.objects.get(id=options['namespace_id'], is_active=True)
+        except Namespace.DoesNotExist:
+            raise CommandError(f'知识库 {options["namespace_id"]} 不存在')
+        tenant = str(namespace.creator_id)
+        knowledge_type = options['knowledge_type']
+        k = options['k']
+
+        collection = get_collection(tenant, str(namespace.id), knowledge_type)
+        total = collection.aggregate.over_all(total_count=True).total_count
+        objects = collection.query.fetch_objects(limit=options['sample'], return_properties=['text']).objects
+        texts = [obj.properties['text'] for obj in objects if obj.properties.get('text')]
+        query_count = min(options['queries'], len(texts) // 5)
+        if query_count == 0 or len(texts) - query_count <= k:
+            raise CommandError(f'知识库 {namespace.name} 的样本太少: {len(texts)}')
+
+        # 使用原始维度和精度的向量评估，不经过知识库当前的变换
+        start = time.perf_counter()
+        base = np.asarray(cached_embedding.embed_documents(texts[query_count:]), dtype=np.float32)
+        queries = np.asarray([cached_embedding.embed_query(text) for text in texts[:query_count]], dtype=np.float32)
+        dim = base.shape[1]
+        truth = _top_k(base, queries, k)
+        current = get_transform(str(namespace.id), knowledge_type)
+        self.stdout.write(
+            f'知识库 {namespace.name}({namespace.id}) {knowledge_type}: 对象数 {total}, 样本 {len(base)}, '
+            f'查询 {query_count}, 原始维度 {dim}, Embedding耗时 {time.perf_counter() - start:.1f}s, '
+            f'当前变换: {current.describe() if current else "none"}'
+        )
+        self.stdout.write(
+            f'  {"变换":<16} {"维度":>6} {"recall@" + str(k):>10} {"编码字节":>8} {"Weaviate估算":>14}'
+        )
+
+        for spec in options['candidates']:
+            try:
+                transform = EmbeddingTransform.from_spec(spec, sample_vectors=base)
+            except ValueError as e:
+                self.stdout.write(self.style.WARNING(f'  {spec:<16} 跳过: {str(e)}'))
+                continue
+            result = _top_k(transform.apply(base), transform.apply(queries), k)
+            recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(result, truth)])
+            out_dim = transform.output_dim(dim)
+            # Weaviate按float32存放向量，量化不减少这部分体积
+            weaviate_bytes = total * (out_dim * 4 + HNSW_LINK_BYTES)
+            self.stdout.write(
+                f'  {spec:<16} {out_dim:>6} {recall:>10.3f} {transform.bytes_per_vector(dim):>8} '
+                f'{weaviate_bytes / 1024 / 1024:>11.2f} MB'
+            )
+        self.stdout.write('  说明: float16/int8只减少自行存放向量时的体积，Weaviate中的向量始终是float32，只随维度减少')
+
+        if options['apply'] is not None:
+            transform = EmbeddingTransform.from_spec(options['apply'], sample_vectors=base)
+            self.stdout.write(f'将知识库 {namespace.name} 的 {knowledge_type} 变换设置为 {transform.describe()} 并重建索引')
+            try:
+                stats = reindex_namespace(
+                    namespace,
+                    knowledge_type=knowledge_type,
+                    transform=transform,
+                    progress_callback=lambda progress: self.stdout.write(f'  进度: {progress}'),
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'知识库 {namespace.name} {knowledge_type} 索引重建完成: {stats}'))
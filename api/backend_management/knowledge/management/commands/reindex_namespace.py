@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.models import Namespace
+from knowledge.utils.vector_db_helper import reindex_namespace
+
+
+class Command(BaseCommand):
+    help = '批量重建知识库的向量索引（并行切块、跨文档批量Embedding、批量写入，支持断点续跑）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace_ids', nargs='+', type=int, help='知识库ID')
+        parser.add_argument(
+            '--knowledge-type', choices=['common', 'tool', 'all'], default='all',
+            help='重建的知识类型，默认全部'
+        )
+        parser.add_argument('--split-workers', type=int, default=None, help='切块进程数，默认CPU核数')
+        parser.add_argument('--write-workers', type=int, default=2, help='并发写入线程数')
+        parser.add_argument('--batch-size', type=int, default=256, help='每批写入/Embedding的切块数')
+        parser.add_argument('--max-inflight', type=int, default=64, help='在途切块任务上限')
+        parser.add_argument('--reset', action='store_true', help='忽略检查点，从头开始重建')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='先清空已有向量和去重记录再全量重建，例如 embedding_transform_report --apply 中途失败后重新执行'
+        )
+
+    def handle(self, *args, **options):
+        knowledge_types = ['common', 'tool'] if options['knowledge_type'] == 'all' else [options['knowledge_type']]
+
+        def report(stats):
+            self.stdout.write(f'  进度: {stats}')
+
+        for namespace_id in options['namespace_ids']:
+            try:
+                namespace = Namespace.objects.get(id=namespace_id, is_active=True)
+            except Namespace.DoesNotExist:
+                raise CommandError(f'知识库 {namespace_id} 不存在')
+
+            for knowledge_type in knowledge_types:
+                self.stdout.write(f'开始重建知识库 {namespace.name}({namespace_id}) 的 {knowledge_type} 索引')
+                stats = reindex_namespace(
+                    namespace,
+                    knowledge_type=knowledge_type,
+                    resume=not options['reset'],
+                    rebuild=options['rebuild'],
+                    progress_callback=report,
+                    split_workers=options['split_workers'],
+                    write_workers=options['write_workers'],
+                    write_batch_size=options['batch_size'],
+                    max_inflight_splits=options['max_inflight'],
+                )
+                self.stdout.write(
+                    self.style.SUCCESS(f'知识库 {namespace.name} {knowledge_type} 索引重建完成: {stats}')
+                )
@@ -0,0 +1,40 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from knowledge.utils.index_queue import IndexWorker
+from llm_api.settings.base import error_logger, info_logger
+
+
+class Command(BaseCommand):
+    help = "Runs vector indexing worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--name', type=str, default=None,
+            help='worker名称，多个worker需唯一；固定名称可在重启后恢复未完成任务，默认 主机名-进程号'
+        )
+        parser.add_argument('--max-attempts', type=int, default=3, help='单个任务最大尝试次数')
+        parser.add_argument('--block-timeout', type=int, default=5, help='阻塞等待任务的秒数')
+        parser.add_argument('--lock-timeout', type=int, default=600, help='文档锁的过期秒数，需大于单个任务的最长耗时')
+
+    def handle(self, *args, **options):
+        worker = IndexWorker(
+            name=options['name'],
+            max_attempts=options['max_attempts'],
+            block_timeout=options['block_timeout'],
+            lock_timeout=options['lock_timeout'],
+        )
+
+        def shutdown(signum, frame):
+            info_logger(f"Stopping index worker {worker.name}...")
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            info_logger(f"Starting index worker {worker.name}...")
+            worker.run_forever()
+        except KeyboardInterrupt:
+            error_logger("Stopping index worker...")
+            worker.stop()
+        info_logger("Index worker shut down successfully!")
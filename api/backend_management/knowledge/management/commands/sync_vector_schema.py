@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from core.indexing.schema import schema_manager
+from knowledge.models import Namespace
+
+
+def _mb(size):
+    return f'{size / 1024 / 1024:.2f}MB' if size is not None else '-'
+
+
+class Command(BaseCommand):
+    help = '按数据量为知识库的向量collection选择索引档位(HNSW参数、PQ/BQ压缩)并在线迁移'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace_ids', nargs='*', type=int, help='知识库ID，默认全部有效知识库')
+        parser.add_argument(
+            '--knowledge-type', choices=['common', 'tool', 'all'], default='all',
+            help='迁移的知识类型，默认全部'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='只输出迁移计划，不执行')
+
+    def handle(self, *args, **options):
+        knowledge_types = ['common', 'tool'] if options['knowledge_type'] == 'all' else [options['knowledge_type']]
+        namespaces = Namespace.objects.filter(is_active=True)
+        if options['namespace_ids']:
+            namespaces = namespaces.filter(id__in=options['namespace_ids'])
+
+        for namespace in namespaces.order_by('id'):
+            for knowledge_type in knowledge_types:
+                plan = schema_manager.sync(
+                    str(namespace.creator_id), str(namespace.id), knowledge_type, dry_run=options['dry_run']
+                )
+                if not plan.exists:
+                    continue
+                self.stdout.write(
+                    f'{plan.collection}: {plan.object_count} 个对象, 档位 {plan.target.name}, '
+                    f'压缩 {plan.current_quantizer or "none"} -> {plan.updates.get("quantizer", plan.current_quantizer) or "none"}, '
+                    f'向量内存 {_mb(plan.memory_before)} -> {_mb(plan.memory_after)}'
+                )
+                if plan.updates:
+                    action = '计划更新' if options['dry_run'] else '已在线更新'
+                    self.stdout.write(self.style.SUCCESS(f'  {action}: {plan.updates}'))
+                if plan.drift:
+                    self.stdout.write(self.style.WARNING(f'  需要重建collection才能生效: {plan.drift}'))
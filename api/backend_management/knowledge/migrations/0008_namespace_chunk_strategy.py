@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge", "0007_add_markdown_content"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="namespace",
+            name="chunk_strategy",
+            field=models.CharField(
+                choices=[("recursive", "固定窗口递归切分"), ("semantic", "语义切分")],
+                default="recursive",
+                help_text="常规知识的切分策略，修改后需要重建索引",
+                max_length=20,
+                verbose_name="切分策略",
+            ),
+        ),
+    ]
@@ -24,6 +24,12 @@ class Namespace(models.Model):
         ('collaborators', '仅协作者可访问'),
         ('public', '所有用户可访问'),
     ]
+
+    # 常规知识切分策略
+    CHUNK_STRATEGY_CHOICES = [
+        ('recursive', '固定窗口递归切分'),
+        ('semantic', '语义切分'),
+    ]
     
     name = models.CharField(
         max_length=255, 
@@ -68,6 +74,14 @@ class Namespace(models.Model):
         verbose_name="是否有效",
         help_text="是否启用该知识库"
     )
+    chunk_strategy = models.CharField(
+        max_length=20,
+        choices=CHUNK_STRATEGY_CHOICES,
+        default='recursive',
+        verbose_name="切分策略",
+        help_text="常规知识的切分策略，修改后需要重建索引"
+    )
+
     created_at = models.DateTimeField(
         auto_now_add=True, 
         verbose_name="创建时间"
@@ -13,7 +13,7 @@ from ..models import (
     FormDataEntry,
     ToolExecution
 )
-from ..utils.vector_db_helper import ToolVectorDBWrapper
+from ..utils.index_queue import enqueue_index_job
 
 User = get_user_model()
 
@@ -137,14 +137,13 @@ class KnowledgeDocumentDetailSerializer(serializers.ModelSerializer):
 
                 document.save()
 
-                # 存储到向量数据库
+                # 异步存储到向量数据库
                 if document.markdown_content and document.is_document:
-                    from ..utils.vector_db_helper import DocumentVectorDBWrapper
                     try:
-                        DocumentVectorDBWrapper.store_document_to_vector_db(document)
+                        enqueue_index_job(document, self.context['request'].user)
                     except Exception as e:
                         from llm_api.settings.base import error_logger
-                        error_logger(f"向量数据库存储处理失败: {str(e)}")
+                        error_logger(f"向量索引任务入队失败: {str(e)}")
 
         return document
 
@@ -273,14 +272,13 @@ class KnowledgeDocumentDetailSerializer(serializers.ModelSerializer):
             new_image_urls = self._extract_image_urls(document.content) if document.content else []
             self._cleanup_removed_images(old_image_urls, new_image_urls)
 
-        # 存储到向量数据库
+        # 异步存储到向量数据库
         if document.markdown_content and document.is_document:
-            from ..utils.vector_db_helper import DocumentVectorDBWrapper
             try:
-                DocumentVectorDBWrapper.store_document_to_vector_db(document)
+                enqueue_index_job(document, self.context['request'].user)
             except Exception as e:
                 from llm_api.settings.base import error_logger
-                error_logger(f"向量数据库存储处理失败: {str(e)}")
+                error_logger(f"向量索引任务入队失败: {str(e)}")
 
         return document
 
@@ -629,15 +627,12 @@ class KnowledgeDocumentToolSerializer(KnowledgeDocumentDetailSerializer):
             instance.set_tool_data(tool_data)
             instance.save()
 
-            # 添加工具到向量数据库
+            # 异步添加工具到向量数据库
             try:
-                from ..utils.vector_db_helper import ToolVectorDBWrapper
-                ToolVectorDBWrapper.add_tool_to_vector_db(instance, tool_data, self.context['request'].user)
-                from llm_api.settings.base import info_logger
-                info_logger(f"工具 {instance.title} 已成功添加到向量数据库")
+                enqueue_index_job(instance, self.context['request'].user)
             except Exception as e:
                 from llm_api.settings.base import error_logger
-                error_logger(f"添加工具到向量数据库失败: {str(e)}")
+                error_logger(f"工具向量索引任务入队失败: {str(e)}")
 
         return instance
 
@@ -655,14 +650,12 @@ class KnowledgeDocumentToolSerializer(KnowledgeDocumentDetailSerializer):
             instance.set_tool_data(tool_data)
             instance.save()
 
-            # 更新向量数据库中的工具
+            # 异步更新向量数据库中的工具
             try:
-                ToolVectorDBWrapper.add_tool_to_vector_db(instance, tool_data, self.context['request'].user)
-                from llm_api.settings.base import info_logger
-                info_logger(f"工具 {instance.title} 已成功更新到向量数据库")
+                enqueue_index_job(instance, self.context['request'].user)
             except Exception as e:
                 from llm_api.settings.base import error_logger
-                error_logger(f"更新工具到向量数据库失败: {str(e)}")
+                error_logger(f"工具向量索引任务入队失败: {str(e)}")
 
         return instance
 
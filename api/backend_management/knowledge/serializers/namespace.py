@@ -120,7 +120,7 @@ class NamespaceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Namespace
         fields = [
-            'id', 'name', 'description', 'cover', 'access_type', 'creator', 
+            'id', 'name', 'description', 'cover', 'access_type', 'chunk_strategy', 'creator', 
             'slug', 'is_active', 'created_at', 'updated_at', 'collaborators',
             'collaborator_count', 'is_public', 'can_access', 'can_edit'
         ]
@@ -165,7 +165,7 @@ class NamespaceListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Namespace
         fields = [
-            'id', 'name', 'description', 'cover', 'access_type', 'creator',
+            'id', 'name', 'description', 'cover', 'access_type', 'chunk_strategy', 'creator',
             'slug', 'is_active', 'created_at', 'updated_at', 'collaborator_count',
             'is_public', 'can_access', 'can_edit'
         ]
@@ -243,4 +243,4 @@ class NamespaceBasicUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Namespace
-        fields = ['name', 'description', 'cover', 'access_type'] 
\ No newline at end of file
+        fields = ['name', 'description', 'cover', 'access_type', 'chunk_strategy'] 
\ No newline at end of file
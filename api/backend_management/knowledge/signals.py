@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from knowledge.models.namespace import Namespace
+
+
+@receiver(post_delete, sender=Namespace)
+def invalidate_namespace_vector_stores(sender, instance, **kwargs):
+    """知识库删除后失效所有进程中缓存的向量库实例"""
+    from core.utils.vector_store import vector_store_registry
+    vector_store_registry.invalidate(namespace=str(instance.id))
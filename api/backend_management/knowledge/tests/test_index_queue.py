@@ -0,0 +1,151 @@
+"""
+测试向量索引任务队列
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.extensions.ext_redis import redis_client
+from ..models.knowledge_management import KnowledgeDocument
+from ..models.namespace import Namespace
+from ..utils.index_queue import (
+    IndexWorker,
+    enqueue_index_job,
+    get_index_status,
+    JOB_KEY,
+    LOCK_KEY,
+    PENDING_KEY,
+    QUEUE_KEY,
+    STATUS_KEY,
+)
+
+User = get_user_model()
+
+
+class TestIndexQueue(TestCase):
+    """索引任务队列测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.namespace = Namespace.objects.create(
+            name='test_namespace',
+            creator=self.user
+        )
+        self.document = KnowledgeDocument.objects.create(
+            title='Test Document',
+            content='<p>测试内容</p>',
+            markdown_content='测试内容',
+            creator=self.user,
+            namespace=self.namespace
+        )
+        self.worker = IndexWorker(name='test-worker', block_timeout=1, busy_delay=0)
+        self._clear()
+
+    def tearDown(self):
+        self._clear()
+
+    def _clear(self):
+        redis_client.delete(
+            QUEUE_KEY, PENDING_KEY, self.worker.processing_key,
+            JOB_KEY.format(self.document.id), STATUS_KEY.format(self.document.id), LOCK_KEY.format(self.document.id)
+        )
+
+    def test_repeated_saves_collapse_into_one_job(self):
+        """重复保存只保留一个任务"""
+        self.assertTrue(enqueue_index_job(self.document, self.user))
+        self.assertFalse(enqueue_index_job(self.document, self.user))
+        self.assertFalse(enqueue_index_job(self.document, self.user))
+        self.assertEqual(redis_client.llen(QUEUE_KEY), 1)
+        self.assertEqual(get_index_status(self.document.id)['status'], 'pending')
+
+    @patch('knowledge.utils.vector_db_helper.DocumentVectorDBWrapper.store_document_to_vector_db')
+    def test_worker_indexes_latest_content(self, mock_store):
+        """worker处理任务并更新状态"""
+        enqueue_index_job(self.document, self.user)
+        self.assertTrue(self.worker.process_one())
+        mock_store.assert_called_once()
+        self.assertEqual(mock_store.call_args[0][0].id, self.document.id)
+        self.assertEqual(get_index_status(self.document.id)['status'], 'success')
+        self.assertEqual(redis_client.llen(self.worker.processing_key), 0)
+        # 取走后再次保存会重新入队
+        self.assertTrue(enqueue_index_job(self.document, self.user))
+
+    @patch('knowledge.utils.vector_db_helper.DocumentVectorDBWrapper.store_document_to_vector_db')
+    def test_worker_retries_then_fails(self, mock_store):
+        """失败任务重试，超过次数后标记为failed"""
+        mock_store.side_effect = RuntimeError('weaviate unavailable')
+        self.worker.max_attempts = 2
+        enqueue_index_job(self.document, self.user)
+        self.worker.process_one()
+        self.assertEqual(get_index_status(self.document.id)['status'], 'pending')
+        self.worker.process_one()
+        index_status = get_index_status(self.document.id)
+        self.assertEqual(index_status['status'], 'failed')
+        self.assertIn('weaviate unavailable', index_status['error'])
+
+    @patch('knowledge.utils.vector_db_helper.DocumentVectorDBWrapper.store_document_to_vector_db')
+    def test_document_locked_by_other_worker_is_deferred(self, mock_store):
+        """其他worker正在处理同一文档时放回队列，不并发索引"""
+        other = IndexWorker(name='other-worker')
+        self.assertTrue(other._acquire(self.document.id))
+        enqueue_index_job(self.document, self.user)
+        self.assertFalse(self.worker.process_one())
+        mock_store.assert_not_called()
+        self.assertEqual(redis_client.llen(QUEUE_KEY), 1)
+        self.assertEqual(redis_client.llen(self.worker.processing_key), 0)
+        self.assertEqual(get_index_status(self.document.id)['status'], 'pending')
+        # 锁只能由持有者释放
+        self.worker._release(self.document.id)
+        self.assertIsNotNone(redis_client.get(LOCK_KEY.format(self.document.id)))
+        other._release(self.document.id)
+        self.assertTrue(self.worker.process_one())
+        mock_store.assert_called_once()
+        self.assertIsNone(redis_client.get(LOCK_KEY.format(self.document.id)))
+
+    @patch('knowledge.utils.vector_db_helper.DocumentVectorDBWrapper.store_document_to_vector_db')
+    def test_retry_does_not_override_newer_job(self, mock_store):
+        """处理失败时文档已被再次保存，以新任务为准，不覆盖它的重试次数"""
+        def save_again_then_fail(document):
+            enqueue_index_job(self.document, self.user)
+            raise RuntimeError('weaviate unavailable')
+
+        mock_store.side_effect = save_again_then_fail
+        enqueue_index_job(self.document, self.user)
+        self.worker.process_one()
+        self.assertEqual(redis_client.llen(QUEUE_KEY), 1)
+        self.assertEqual(int(redis_client.hget(JOB_KEY.format(self.document.id), 'attempts')), 0)
+        self.assertEqual(get_index_status(self.document.id)['status'], 'pending')
+
+    @patch('knowledge.utils.index_queue._delete_vectors')
+    def test_deleted_document_vectors_are_cleaned(self, mock_delete):
+        """已删除文档由worker在文档锁下清理切块"""
+        self.document.is_active = False
+        self.document.save()
+        enqueue_index_job(self.document, self.user)
+        self.worker.process_one()
+        mock_delete.assert_called_once()
+        self.assertEqual(mock_delete.call_args[0][0].id, self.document.id)
+        self.assertEqual(get_index_status(self.document.id)['status'], 'deleted')
+
+    @patch('knowledge.utils.index_queue._delete_vectors')
+    @patch('knowledge.utils.vector_db_helper.DocumentVectorDBWrapper.store_document_to_vector_db')
+    def test_delete_during_indexing_undoes_writes(self, mock_store, mock_delete):
+        """索引期间文档被删除，撤销刚写入的切块，删除入队的任务与其合并"""
+        def delete_while_indexing(document):
+            KnowledgeDocument.objects.filter(id=self.document.id).update(is_active=False)
+            enqueue_index_job(self.document, self.user)
+
+        mock_store.side_effect = delete_while_indexing
+        enqueue_index_job(self.document, self.user)
+        self.worker.process_one()
+        mock_delete.assert_called_once()
+        self.assertEqual(redis_client.llen(QUEUE_KEY), 1)
+        self.worker.process_one()
+        self.assertEqual(mock_delete.call_count, 2)
+        mock_store.assert_called_once()
+        self.assertEqual(get_index_status(self.document.id)['status'], 'deleted')
@@ -0,0 +1,78 @@
+"""
+测试向量库实例注册表
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.utils.vector_store import VectorStoreRegistry, vector_store_registry
+from ..models.namespace import Namespace
+
+User = get_user_model()
+
+
+class TestVectorStoreRegistry(TestCase):
+    """向量库实例注册表测试"""
+
+    def setUp(self):
+        self.created = []
+        self.registry = VectorStoreRegistry(factory=self._factory, ttl=0.2, max_size=2)
+
+    def _factory(self, tenant, namespace, knowledge_type):
+        self.created.append((tenant, namespace, knowledge_type))
+        return object()
+
+    def test_hit_and_lru_eviction(self):
+        """命中复用实例，超过上限淘汰最久未使用的实例"""
+        store = self.registry.get('tenant1', '1', 'common')
+        self.assertIs(self.registry.get('tenant1', '1', 'common'), store)
+        self.registry.get('tenant1', '2', 'common')
+        self.registry.get('tenant1', '1', 'common')
+        self.registry.get('tenant1', '3', 'common')  # 淘汰 2
+        self.registry.get('tenant1', '2', 'common')
+        stats = self.registry.get_stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['evictions'], 2)
+
+    def test_ttl_expiration(self):
+        """过期后重新创建实例"""
+        store = self.registry.get('tenant1', '1', 'common')
+        time.sleep(0.25)
+        self.assertIsNot(self.registry.get('tenant1', '1', 'common'), store)
+        self.assertEqual(self.registry.get_stats()['expirations'], 1)
+
+    def test_invalidate_namespace(self):
+        """按命名空间失效，不影响其他命名空间"""
+        self.registry.get('tenant1', '1', 'common')
+        self.registry.get('tenant1', '1', 'tool')
+        self.assertEqual(self.registry.invalidate(namespace='1', knowledge_type='tool'), 1)
+        self.assertEqual(self.registry.invalidate(namespace='1'), 1)
+        self.assertEqual(self.registry.get_stats()['size'], 0)
+
+    def test_invalidate_during_build_discards_store(self):
+        """创建实例期间失效，创建出的实例不放入注册表"""
+        def invalidate_while_building(tenant, namespace, knowledge_type):
+            self.registry.invalidate(namespace=namespace)
+            return object()
+
+        self.registry.factory = invalidate_while_building
+        store = self.registry.get('tenant1', '1', 'common')
+        self.assertIsNotNone(store)
+        self.assertEqual(self.registry.get_stats()['size'], 0)
+        self.assertEqual(self.registry.get_stats()['discards'], 1)
+        # 没有并发失效时正常放入注册表
+        self.registry.factory = self._factory
+        self.registry.get('tenant1', '1', 'common')
+        self.assertEqual(self.registry.get_stats()['size'], 1)
+
+    def test_namespace_delete_invalidates_registry(self):
+        """删除知识库时失效全局注册表中的实例"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        namespace = Namespace.objects.create(name='test_namespace', creator=user)
+        key = (str(user.id), str(namespace.id), 'common')
+        vector_store_registry._stores[key] = (time.monotonic() + 60, object())
+        namespace.delete()
+        self.assertNotIn(key, vector_store_registry._stores)
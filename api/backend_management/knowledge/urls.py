@@ -46,4 +46,5 @@ urlpatterns = [
 - DELETE /namespaces/{id}/documents/{doc_id}/           - 删除文档
 - GET    /namespaces/{id}/documents/tree/               - 获取文档树
 - POST   /namespaces/{id}/documents/{doc_id}/move/      - 移动文档
+- GET    /namespaces/{id}/documents/{doc_id}/indexing_status/ - 获取文档索引状态
 """
@@ -0,0 +1,266 @@
+"""
+基于Redis的向量索引任务队列
+保存文档时只入队文档id，由 runindexworker 进程异步完成切块、Embedding和写入。
+同一文档在被worker取走前的多次保存只会保留一个任务；worker处理时读取数据库中的最新内容。
+
+Redis结构:
+    indexing:queue                 待处理文档id列表(LPUSH入队, 右侧出队)
+    indexing:pending               已入队但尚未被取走的文档id集合，用于合并重复任务
+    indexing:job:{doc_id}          任务参数(触发用户、入队时间、重试次数)
+    indexing:processing:{worker}   worker正在处理的文档id，worker重启时据此恢复
+    indexing:lock:{doc_id}         正在处理该文档的worker，同一文档同时只有一个worker处理
+    indexing:status:{doc_id}       文档索引状态 pending/running/success/failed/skipped/deleted
+
+删除文档同样入队(事务提交后)，worker读到已删除的文档时清理它的切块，
+这样删除与索引在同一文档锁下串行执行，不会在删除后又写入切块。
+"""
+import os
+import socket
+import time
+
+from core.extensions.ext_redis import redis_client
+from llm_api.settings.base import error_logger, info_logger
+
+QUEUE_KEY = "indexing:queue"
+PENDING_KEY = "indexing:pending"
+JOB_KEY = "indexing:job:{}"
+PROCESSING_KEY = "indexing:processing:{}"
+LOCK_KEY = "indexing:lock:{}"
+STATUS_KEY = "indexing:status:{}"
+STATUS_TTL = 7 * 24 * 3600
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+STATUS_DELETED = "deleted"
+
+# 原子入队: 已在pending集合中的文档只更新任务参数，不重复入队
+# 重试(ARGV[6]=1)时如果文档已被再次保存而入队，以新任务为准，不覆盖它的参数
+_ENQUEUE_SCRIPT = """
+local doc_id = ARGV[1]
+if ARGV[6] == '1' and redis.call('SISMEMBER', KEYS[2], doc_id) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[3], 'user_id', ARGV[2], 'enqueued_at', ARGV[3], 'attempts', ARGV[4])
+redis.call('HSET', KEYS[4], 'status', 'pending', 'updated_at', ARGV[3], 'error', '')
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+if redis.call('SADD', KEYS[2], doc_id) == 1 then
+    redis.call('LPUSH', KEYS[1], doc_id)
+    return 1
+end
+return 0
+"""
+_enqueue_script = None
+
+# 只释放自己持有的锁
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release_script = None
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _set_status(document_id, status, **fields):
+    key = STATUS_KEY.format(document_id)
+    mapping = {"status": status, "updated_at": str(time.time())}
+    mapping.update({k: str(v) for k, v in fields.items()})
+    with redis_client.pipeline() as pipeline:
+        pipeline.hset(key, mapping=mapping)
+        pipeline.expire(key, STATUS_TTL)
+        pipeline.execute()
+
+
+def enqueue_index_job(document, user=None, attempts=0, user_id=None, retry=False):
+    """
+    入队文档索引任务
+    :param document: KnowledgeDocument实例(或文档id)
+    :param user: 触发保存的用户，工具知识以该用户作为租户写入
+    :param attempts: 已重试次数
+    :param user_id: 未传user时直接指定用户id(重试/恢复任务时使用)
+    :param retry: 是否为失败后的重试，文档已有待处理任务时不入队
+    :return: 是否新入队(False表示与已有任务合并)
+    """
+    global _enqueue_script
+    if _enqueue_script is None:
+        _enqueue_script = redis_client.register_script(_ENQUEUE_SCRIPT)
+    document_id = str(getattr(document, "id", document))
+    user_id = str(user.id) if user is not None else (user_id or "")
+    queued = _enqueue_script(
+        keys=[QUEUE_KEY, PENDING_KEY, JOB_KEY.format(document_id), STATUS_KEY.format(document_id)],
+        args=[document_id, user_id, str(time.time()), attempts, STATUS_TTL, int(retry)],
+    )
+    return bool(queued)
+
+
+def get_index_status(document_id):
+    """获取文档索引状态，从未入队过的文档返回None"""
+    status = redis_client.hgetall(STATUS_KEY.format(document_id))
+    if not status:
+        return None
+    return {_decode(k): _decode(v) for k, v in status.items()}
+
+
+def get_queue_stats():
+    return {
+        "queued": redis_client.llen(QUEUE_KEY),
+        "pending": redis_client.scard(PENDING_KEY),
+    }
+
+
+def _delete_vectors(document):
+    """删除文档在向量库中的全部切块"""
+    from core.indexing.index import delete
+
+    if not (document.is_document or document.is_tool):
+        return 0
+    return delete(
+        document_id=str(document.id),
+        tenant=str(document.creator_id),
+        namespace=str(document.namespace_id),
+        knowledge_type="tool" if document.is_tool else "common",
+    )
+
+
+def run_index_job(document_id, user_id=None):
+    """
+    执行单个索引任务，始终读取数据库中的最新文档
+    文档已删除时清理它的切块；索引期间文档被删除时撤销刚写入的切块
+    :return: 最终状态
+    """
+    from django.contrib.auth import get_user_model
+    from knowledge.models import KnowledgeDocument
+    from knowledge.utils.vector_db_helper import DocumentVectorDBWrapper, ToolVectorDBWrapper
+
+    document = KnowledgeDocument.objects.select_related("creator", "namespace").filter(id=document_id).first()
+    if document is None:
+        return STATUS_SKIPPED
+    if not document.is_active:
+        _delete_vectors(document)
+        return STATUS_DELETED
+    if document.is_document:
+        if not document.markdown_content:
+            return STATUS_SKIPPED
+        DocumentVectorDBWrapper.store_document_to_vector_db(document)
+    elif document.is_tool:
+        tool_data = document.get_tool_data()
+        if not tool_data:
+            return STATUS_SKIPPED
+        user = get_user_model().objects.filter(id=user_id).first() if user_id else None
+        ToolVectorDBWrapper.add_tool_to_vector_db(document, tool_data, user or document.creator)
+    else:
+        return STATUS_SKIPPED
+    if not KnowledgeDocument.objects.filter(id=document_id, is_active=True).exists():
+        _delete_vectors(document)
+        return STATUS_DELETED
+    return STATUS_SUCCESS
+
+
+class IndexWorker:
+    """索引任务消费者"""
+
+    def __init__(self, name=None, max_attempts=3, block_timeout=5, lock_timeout=600, busy_delay=0.5):
+        """
+        :param name: worker名称，需在多个worker间唯一，重启后使用同一名称可恢复未完成任务
+        :param max_attempts: 单个任务最大尝试次数
+        :param block_timeout: 阻塞等待任务的秒数
+        :param lock_timeout: 文档锁的过期秒数，需要大于单个任务的最长耗时
+        :param busy_delay: 取到其他worker正在处理的文档时，放回队列后等待的秒数
+        """
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.processing_key = PROCESSING_KEY.format(self.name)
+        self.max_attempts = max_attempts
+        self.block_timeout = block_timeout
+        self.lock_timeout = lock_timeout
+        self.busy_delay = busy_delay
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def recover(self):
+        """把上次异常退出时未完成的任务放回队列"""
+        recovered = 0
+        while True:
+            document_id = redis_client.rpop(self.processing_key)
+            if document_id is None:
+                return recovered
+            document_id = _decode(document_id)
+            self._release(document_id)
+            user_id = redis_client.hget(JOB_KEY.format(document_id), "user_id")
+            enqueue_index_job(document_id, user_id=_decode(user_id))
+            recovered += 1
+
+    def _acquire(self, document_id):
+        return bool(redis_client.set(
+            LOCK_KEY.format(document_id), self.name, nx=True, px=int(self.lock_timeout * 1000)
+        ))
+
+    def _release(self, document_id):
+        global _release_script
+        if _release_script is None:
+            _release_script = redis_client.register_script(_RELEASE_SCRIPT)
+        _release_script(keys=[LOCK_KEY.format(document_id)], args=[self.name])
+
+    def process_one(self):
+        """
+        取出并处理一个任务
+        :return: 是否处理了任务
+        """
+        document_id = redis_client.blmove(
+            QUEUE_KEY, self.processing_key, self.block_timeout, src="RIGHT", dest="LEFT"
+        )
+        if document_id is None:
+            return False
+        document_id = _decode(document_id)
+        if not self._acquire(document_id):
+            # 其他worker正在处理同一文档(处理期间又被保存)，放回队尾等它处理完
+            with redis_client.pipeline() as pipeline:
+                pipeline.lpush(QUEUE_KEY, document_id)
+                pipeline.lrem(self.processing_key, 1, document_id)
+                pipeline.execute()
+            time.sleep(self.busy_delay)
+            return False
+        with redis_client.pipeline() as pipeline:
+            # 移出pending后，再次保存会重新入队，保证最后一次修改一定会被索引
+            pipeline.srem(PENDING_KEY, document_id)
+            pipeline.hgetall(JOB_KEY.format(document_id))
+            _, job = pipeline.execute()
+        job = {_decode(k): _decode(v) for k, v in job.items()}
+        attempts = int(job.get("attempts") or 0) + 1
+        _set_status(document_id, STATUS_RUNNING, attempts=attempts, worker=self.name, error="")
+
+        started_at = time.monotonic()
+        try:
+            result = run_index_job(document_id, user_id=job.get("user_id") or None)
+            # 处理期间文档又被保存时保留pending状态，等待下一次任务
+            if not redis_client.sismember(PENDING_KEY, document_id):
+                _set_status(
+                    document_id, result, attempts=attempts, duration=round(time.monotonic() - started_at, 3)
+                )
+            info_logger(f"文档 {document_id} 索引任务完成: {result}")
+        except Exception as e:
+            error_logger(f"文档 {document_id} 索引任务失败(第{attempts}次): {str(e)}")
+            if attempts < self.max_attempts:
+                enqueue_index_job(document_id, attempts=attempts, user_id=job.get("user_id"), retry=True)
+            elif not redis_client.sismember(PENDING_KEY, document_id):
+                _set_status(document_id, STATUS_FAILED, attempts=attempts, error=str(e))
+        finally:
+            self._release(document_id)
+            redis_client.lrem(self.processing_key, 1, document_id)
+        return True
+
+    def run_forever(self):
+        recovered = self.recover()
+        if recovered:
+            info_logger(f"索引worker {self.name} 恢复了 {recovered} 个未完成任务")
+        info_logger(f"索引worker {self.name} 已启动")
+        while not self._stopped:
+            self.process_one()
@@ -2,6 +2,7 @@
 Django异步操作兼容性工具
 """
 import json
+import os
 
 from langchain_core.documents import Document
 from langchain_core.documents import Document as LangchainDocument
@@ -9,16 +10,18 @@ from langchain_core.documents import Document as LangchainDocument
 from core.indexing.index import index
 from llm_api.settings.base import info_logger
 
+# 超过该字符数的文档使用流式切分索引
+STREAMING_INDEX_THRESHOLD = int(os.getenv('STREAMING_INDEX_THRESHOLD', 5 * 1024 * 1024))
+
 
 # 向量数据库操作的异步包装器
 class ToolVectorDBWrapper:
     """向量数据库异步操作包装器"""
 
     @staticmethod
-    def add_tool_to_vector_db(document, tool_data, user):
-        """同步方式添加工具到向量数据库"""
-
-        vector_doc = Document(
+    def build_vector_doc(document, tool_data, user):
+        """构建工具的向量文档"""
+        return Document(
             page_content="",  # 工具知识不需要内容，主要靠元数据
             metadata={
                 "tenant": str(user.id),
@@ -38,6 +41,11 @@ class ToolVectorDBWrapper:
             }
         )
 
+    @staticmethod
+    def add_tool_to_vector_db(document, tool_data, user):
+        """同步方式添加工具到向量数据库"""
+        vector_doc = ToolVectorDBWrapper.build_vector_doc(document, tool_data, user)
+
         # 添加到向量数据库
         index(
             document_id=str(document.id),
@@ -67,15 +75,14 @@ class DocumentVectorDBWrapper:
     """文档向量数据库异步操作包装器"""
 
     @staticmethod
-    def store_document_to_vector_db(document):
-        """同步方式存储文档到向量数据库"""
-        # 创建文档对象
-        doc = LangchainDocument(
+    def build_vector_doc(document):
+        """构建文档的向量文档"""
+        return LangchainDocument(
             page_content=document.markdown_content,
             metadata={
-                "tenant": str(document.creator.id),
-                "owner": str(document.creator.id),
-                "namespace": str(document.namespace.id),
+                "tenant": str(document.creator_id),
+                "owner": str(document.creator_id),
+                "namespace": str(document.namespace_id),
                 "source": f"document_{document.id}",
                 "document_id": str(document.id),
                 "title": document.title,
@@ -88,12 +95,128 @@ class DocumentVectorDBWrapper:
             }
         )
 
-        # 存储到向量数据库
+    @staticmethod
+    def store_document_to_vector_db(document):
+        """同步方式存储文档到向量数据库"""
+        doc = DocumentVectorDBWrapper.build_vector_doc(document)
+
+        # 存储到向量数据库，超大文档流式切分以控制内存峰值
         index(
             document_id=str(document.id),
             tenant=str(document.creator.id),
             namespace=str(document.namespace.id),
             doc=doc,
+            streaming=len(doc.page_content) > STREAMING_INDEX_THRESHOLD,
+            chunk_strategy=document.namespace.chunk_strategy,
         )
 
         info_logger(f"文档 {document.title} 已成功存储到向量数据库")
+
+
+def drop_namespace_vectors(namespace, knowledge_type="common"):
+    """
+    删除知识库某类知识的全部向量和去重记录
+    向量变换(降维/量化)修改后已有切块的id不变但向量变了，去重会跳过它们，需要先清空再全量重建
+    """
+    from core.extensions.ext_weaviate import weaviate_client
+    from core.indexing.de_duplication import de_duplicator
+    from core.indexing.placement import SHARED, get_placement, get_shared_collection_name
+    from core.utils.vector_store import get_collection_name, vector_store_registry
+    from knowledge.models import KnowledgeDocument
+
+    tenant = str(namespace.creator_id)
+    namespace_id = str(namespace.id)
+    if get_placement(tenant, namespace_id, knowledge_type) == SHARED:
+        shared = weaviate_client.collections.get(get_shared_collection_name(knowledge_type))
+        if shared.tenants.exists(namespace_id):
+            shared.tenants.remove([namespace_id])
+    else:
+        name = get_collection_name(tenant, namespace_id, knowledge_type)
+        if weaviate_client.collections.exists(name):
+            weaviate_client.collections.delete(name)
+    vector_store_registry.invalidate(namespace_id, knowledge_type)
+
+    document_ids = [
+        str(document_id) for document_id in KnowledgeDocument.objects.filter(
+            namespace_id=namespace.id,
+            doc_type="tool" if knowledge_type == "tool" else "document",
+        ).values_list("id", flat=True).iterator()
+    ]
+    for start in range(0, len(document_ids), 500):
+        de_duplicator.redis_client.delete(*document_ids[start:start + 500])
+    info_logger(f"知识库 {namespace.id} 的{knowledge_type}向量已清空: {len(document_ids)}篇文档")
+
+
+def reindex_namespace(
+        namespace,
+        knowledge_type="common",
+        resume=True,
+        progress_callback=None,
+        rebuild=False,
+        transform=None,
+        **options,
+):
+    """
+    批量重建整个知识库的向量索引
+    :param namespace: Namespace实例
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :param resume: 是否从上次中断的检查点继续
+    :param progress_callback: 进度回调，参数为BulkIndexStats
+    :param rebuild: 先清空已有向量和去重记录再全量写入(忽略检查点)，向量变换修改后使用
+    :param transform: 新的Embedding变换(EmbeddingTransform，没有步骤表示删除配置)，与清空、重建作为一次操作执行，
+        保证配置生效后知识库中只有按新配置写入的向量
+    :param options: 透传给BulkIndexer的并发参数
+    :return: BulkIndexStats
+    """
+    from core.indexing.bulk import BulkIndexer
+    from knowledge.models import KnowledgeDocument
+
+    if transform is not None:
+        from core.indexing.transform import set_transform
+
+        # 校验失败时不会清空已有数据
+        set_transform(str(namespace.creator_id), str(namespace.id), knowledge_type, transform)
+        rebuild = True
+    if rebuild:
+        # 在创建向量库实例之前清空，新collection按变换后的维度创建
+        drop_namespace_vectors(namespace, knowledge_type)
+        resume = False
+    indexer = BulkIndexer(
+        tenant=str(namespace.creator_id),
+        namespace=str(namespace.id),
+        knowledge_type=knowledge_type,
+        chunk_strategy=namespace.chunk_strategy,
+        progress_callback=progress_callback,
+        **options,
+    )
+    if not resume:
+        indexer.reset_checkpoint()
+    checkpoint = indexer.get_checkpoint()
+
+    queryset = KnowledgeDocument.objects.filter(
+        namespace_id=namespace.id,
+        is_active=True,
+        doc_type="tool" if knowledge_type == "tool" else "document",
+    ).order_by("id")
+    if knowledge_type == "common":
+        queryset = queryset.exclude(markdown_content__isnull=True).exclude(markdown_content="")
+    else:
+        queryset = queryset.select_related("creator")
+    if checkpoint:
+        info_logger(f"知识库 {namespace.id} 从检查点 {checkpoint} 继续重建{knowledge_type}索引")
+        queryset = queryset.filter(id__gt=int(checkpoint))
+
+    def iter_documents():
+        # 流式读取，避免一次性加载整个知识库
+        for document in queryset.iterator(chunk_size=500):
+            if knowledge_type == "tool":
+                vector_doc = ToolVectorDBWrapper.build_vector_doc(
+                    document, document.get_tool_data(), document.creator
+                )
+            else:
+                vector_doc = DocumentVectorDBWrapper.build_vector_doc(document)
+            yield str(document.id), vector_doc
+
+    stats = indexer.run(iter_documents())
+    info_logger(f"知识库 {namespace.id} {knowledge_type}索引重建完成: {stats}")
+    return stats
@@ -1,6 +1,7 @@
 import json
 import re
 import uuid
+from functools import partial
 
 from django.core.cache import cache
 from django.core.files.storage import default_storage
@@ -18,7 +19,7 @@ from core.indexing.index import delete as delete_from_vector_db
 from core.models.extractor.tool_generator import tool_generator_llm, tool_generator_examples_to_messages
 from core.models.utils import from_examples_to_messages
 from core.tool.dynamic_tool import create_dynamic_tool
-from llm_api.settings.base import info_logger, error_logger
+from llm_api.settings.base import info_logger, error_logger, warning_logger
 from ..models import (
     Namespace,
     KnowledgeDocument
@@ -34,7 +35,7 @@ from ..serializers import (
     FormDataEntrySerializer,
     ToolExecutionSerializer
 )
-from ..utils.vector_db_helper import ToolVectorDBWrapper
+from ..utils.index_queue import enqueue_index_job, get_index_status
 
 
 class KnowledgeBaseViewSet(viewsets.GenericViewSet):
@@ -331,35 +332,15 @@ class KnowledgeDocumentViewSet(KnowledgeBaseViewSet):
             )
 
     def _cleanup_documents_resources(self, documents):
-        """清理文档相关资源（向量数据库和图片）"""
+        """
+        清理文档相关资源（向量数据库和图片）
+        向量清理在删除事务提交后入队，由索引worker在文档锁下执行，避免与正在进行的索引任务交错
+        """
         try:
 
             for doc in documents:
-                # 删除普通文档的向量数据库内容
-                if doc.is_document and doc.markdown_content:
-                    try:
-                        delete_from_vector_db(
-                            document_id=str(doc.id),
-                            tenant=str(doc.creator.id),
-                            namespace=str(doc.namespace.id),
-                            knowledge_type="common"
-                        )
-                        info_logger(f"已从向量数据库删除普通文档: {doc.id}")
-                    except Exception as e:
-                        error_logger(f"删除普通文档向量数据库内容失败: {str(e)}")
-
-                # 删除工具文档的向量数据库内容
-                elif doc.is_tool:
-                    try:
-                        delete_from_vector_db(
-                            document_id=str(doc.id),
-                            tenant=str(doc.creator.id),
-                            namespace=str(doc.namespace.id),
-                            knowledge_type="tool"
-                        )
-                        info_logger(f"已从向量数据库删除工具文档: {doc.id}")
-                    except Exception as e:
-                        error_logger(f"删除工具文档向量数据库内容失败: {str(e)}")
+                if doc.is_document or doc.is_tool:
+                    transaction.on_commit(partial(self._enqueue_vector_cleanup, doc))
 
                 # 清理文档相关图片
                 if doc.content:
@@ -368,6 +349,26 @@ class KnowledgeDocumentViewSet(KnowledgeBaseViewSet):
         except Exception as e:
             error_logger(f"清理文档资源失败: {str(e)}")
 
+    @staticmethod
+    def _enqueue_vector_cleanup(doc):
+        """入队向量清理任务，Redis不可用时直接删除"""
+        knowledge_type = "tool" if doc.is_tool else "common"
+        try:
+            enqueue_index_job(doc, user_id=str(doc.creator_id))
+            info_logger(f"已入队向量清理任务: {doc.id}")
+        except Exception as e:
+            warning_logger(f"入队向量清理任务失败，直接删除: {str(e)}")
+            try:
+                delete_from_vector_db(
+                    document_id=str(doc.id),
+                    tenant=str(doc.creator_id),
+                    namespace=str(doc.namespace_id),
+                    knowledge_type=knowledge_type
+                )
+                info_logger(f"已从向量数据库删除文档: {doc.id}")
+            except Exception as e:
+                error_logger(f"删除文档向量数据库内容失败: {str(e)}")
+
     def _cleanup_document_images(self, document):
         """清理文档相关图片"""
         try:
@@ -665,6 +666,38 @@ class KnowledgeDocumentViewSet(KnowledgeBaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @swagger_auto_schema(
+        operation_summary="获取文档索引状态",
+        operation_description="获取文档向量索引任务的状态：pending/running/success/failed/skipped"
+    )
+    @action(detail=True, methods=['get'])
+    def indexing_status(self, request, namespace_pk=None, pk=None):
+        """获取文档索引状态"""
+        try:
+            namespace = self.get_namespace()
+            document = get_object_or_404(
+                KnowledgeDocument,
+                id=pk,
+                namespace=namespace,
+                is_active=True
+            )
+
+            # 检查访问权限
+            if not document.can_access(request.user):
+                raise PermissionDenied("您没有访问此文档的权限")
+
+            index_status = get_index_status(document.id) or {"status": "not_indexed"}
+            return Response({"document_id": document.id, **index_status})
+
+        except PermissionDenied:
+            raise
+        except Exception as e:
+            error_logger(f"获取文档索引状态失败: {str(e)}")
+            return Response(
+                {"error": "获取文档索引状态失败"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @swagger_auto_schema(
         operation_summary="获取表单数据",
         operation_description="获取指定表单的所有数据条目",
@@ -902,12 +935,11 @@ class KnowledgeDocumentViewSet(KnowledgeBaseViewSet):
                 serializer.is_valid(raise_exception=True)
                 document = serializer.save()
 
-                # 异步添加到向量数据库
+                # 异步添加到向量数据库，与序列化器保存时的任务合并
                 try:
-                    ToolVectorDBWrapper.add_tool_to_vector_db(document, tool_data, request.user)
-                    info_logger(f"工具已添加到向量数据库: {document.title}")
+                    enqueue_index_job(document, request.user)
                 except Exception as vector_error:
-                    error_logger(f"添加工具到向量数据库失败: {str(vector_error)}")
+                    error_logger(f"工具向量索引任务入队失败: {str(vector_error)}")
                     # 不影响主流程，只记录错误
 
                 info_logger(f"用户 {request.user.username} 通过AI生成工具: {document.title}")
@@ -761,6 +761,11 @@ class GlobalConfigCacheViewSet(viewsets.ViewSet):
                 user_demand,
                 redis_key="global_embedding"
             )
+            # 生成结果总会覆盖全局Embedding代码，旧向量不再可用
+            from core.indexing.embedding_cache import cached_embedding
+            from core.models.embedding import global_embedding_code
+            global_embedding_code.invalidate()
+            cached_embedding.invalidate()
 
             return Response({
                 'code': 200,
@@ -878,6 +883,11 @@ class GlobalConfigCacheViewSet(viewsets.ViewSet):
         try:
             code = request.data.get('code')
             embedding_code_generator.parse_generation_code(code, redis_key="global_embedding")
+            # Embedding代码变化后旧向量不再可用
+            from core.indexing.embedding_cache import cached_embedding
+            from core.models.embedding import global_embedding_code
+            global_embedding_code.invalidate()
+            cached_embedding.invalidate()
             info_logger("保存编辑的Embedding代码成功")
             return Response({
                 'code': 200,
@@ -890,3 +900,73 @@ class GlobalConfigCacheViewSet(viewsets.ViewSet):
                 'code': 500,
                 'message': f'保存编辑的Embedding代码失败: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(
+        operation_id="global_config_cache_get_embedding_stats",
+        summary="获取Embedding批处理指标",
+        description="获取索引链路Embedding合并批处理的指标：批次填充率、排队等待时间、缓存命中率等",
+        responses={
+            200: BaseResponseSerializer,
+            403: ErrorResponseSerializer,
+            500: ErrorResponseSerializer,
+        },
+        tags=["Provider管理-全局配置缓存"]
+    )
+    @action(detail=False, methods=['get'])
+    def get_embedding_stats(self, request):
+        """
+        获取Embedding批处理指标
+        """
+        try:
+            from core.indexing.embedding_batcher import embedding_batcher
+            from core.indexing.embedding_cache import cached_embedding
+            return Response({
+                'code': 200,
+                'message': '获取Embedding批处理指标成功',
+                'data': {
+                    'batcher': embedding_batcher.get_stats(),
+                    'cache': cached_embedding.get_stats()
+                }
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            error_logger(f"获取Embedding批处理指标失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取Embedding批处理指标失败: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(
+        operation_id="global_config_cache_get_vector_db_stats",
+        summary="获取向量数据库连接指标",
+        description="获取Weaviate连接池的指标(连接数、重连次数、健康检查失败次数和探活延迟)以及向量库实例注册表的命中率",
+        responses={
+            200: BaseResponseSerializer,
+            403: ErrorResponseSerializer,
+            500: ErrorResponseSerializer,
+        },
+        tags=["Provider管理-全局配置缓存"]
+    )
+    @action(detail=False, methods=['get'])
+    def get_vector_db_stats(self, request):
+        """
+        获取向量数据库连接指标
+        """
+        try:
+            from core.extensions.ext_weaviate import weaviate_client_manager
+            from core.utils.vector_store import vector_store_registry
+            return Response({
+                'code': 200,
+                'message': '获取向量数据库连接指标成功',
+                'data': {
+                    'connections': weaviate_client_manager.get_stats(),
+                    'vector_store_registry': vector_store_registry.get_stats()
+                }
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            error_logger(f"获取向量数据库连接指标失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取向量数据库连接指标失败: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
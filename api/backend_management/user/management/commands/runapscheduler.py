@@ -7,6 +7,8 @@ from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
 
 from llm_api.settings.prod_settings import error_logger, info_logger
+from knowledge.cron.promote_namespaces import promote_large_namespaces
+from knowledge.cron.sync_vector_schema import sync_vector_schemas
 from user.cron.clean_logs import clean_logs
 
 logger = logging.getLogger(__name__)
@@ -27,6 +29,22 @@ class Command(BaseCommand):
             replace_existing=True,
         )
 
+        scheduler.add_job(
+            sync_vector_schemas,
+            trigger=CronTrigger(hour="03", minute="00"),
+            id="sync_vector_schemas",
+            max_instances=1,
+            replace_existing=True,
+        )
+
+        scheduler.add_job(
+            promote_large_namespaces,
+            trigger=CronTrigger(minute="30"),
+            id="promote_large_namespaces",
+            max_instances=1,
+            replace_existing=True,
+        )
+
         try:
             info_logger("Starting scheduler...")
             scheduler.start()
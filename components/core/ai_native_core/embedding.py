@@ -1,23 +1,48 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from langchain_core.embeddings import Embeddings
 from tang_yuan_mlops_sdk.llm.embedding import EmbeddingClient
 
+from ai_native_core.utils.http_pool import PooledHTTPClient
+
 
 class BGEEmbeddings(Embeddings):
     def __init__(
             self,
             base_url: str = os.getenv('EMBEDDING_BASE_URL'),  # 使用配置文件中的值
             token: str = os.getenv('EMBEDDING_TOKEN'),  # 使用配置文件中的值
+            batch_size: int = 32,
+            max_workers: int = 4,
+            http_client: PooledHTTPClient = None,
     ):
+        """
+        :param batch_size: 同步调用时每个请求的最大文本数(按Embedding服务的批大小设置)
+        :param max_workers: 同步调用时并行发送的请求数
+        :param http_client: 同步调用使用的连接池，为空时按max_workers创建
+        """
         self.client = EmbeddingClient(base_url=base_url, token=token)
         self.base_url = base_url
         self.token = token
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.http_client = http_client or PooledHTTPClient(pool_size=max_workers)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed search docs."""
-        import requests
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # fork出的子进程中父进程的线程不存在，需要重新创建
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embedding")
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.token}"
@@ -25,25 +50,24 @@ class BGEEmbeddings(Embeddings):
         data = {
             "inputs": texts
         }
-        response = requests.post(self.base_url, headers=headers, json=data)
+        response = self.http_client.post(self.base_url, headers=headers, json=data)
         if response.status_code != 200:
             raise Exception(f"Request failed with status code {response.status_code}: {response.text}")
         return response.json()
 
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs.
+        超过batch_size时拆成多个请求，最多max_workers个并行发送
+        """
+        if len(texts) <= self.batch_size:
+            return self._post(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = self._get_executor().map(self._post, batches)
+        return [vector for result in results for vector in result]
+
     def embed_query(self, text: str) -> List[float]:
         """Embed query text."""
-        import requests
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.token}"
-        }
-        data = {
-            "inputs": [text]
-        }
-        response = requests.post(self.base_url, headers=headers, json=data)
-        if response.status_code != 200:
-            raise Exception(f"Request failed with status code {response.status_code}: {response.text}")
-        return response.json()[0]
+        return self._post([text])[0]
 
     async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
         """Asynchronous Embed search docs."""
@@ -54,5 +78,21 @@ class BGEEmbeddings(Embeddings):
         embeddings = await self.client.get_embeddings([text])
         return embeddings[0]
 
+    def get_stats(self) -> dict:
+        """同步调用的请求数、错误数和延迟直方图"""
+        return {
+            "batch_size": self.batch_size,
+            "max_workers": self.max_workers,
+            **self.http_client.get_stats(),
+        }
+
 
-embedding = BGEEmbeddings()
+embedding = BGEEmbeddings(
+    batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 32)),
+    max_workers=int(os.getenv('EMBEDDING_MAX_WORKERS', 4)),
+    http_client=PooledHTTPClient(
+        pool_size=int(os.getenv('EMBEDDING_MAX_WORKERS', 4)),
+        retries=int(os.getenv('EMBEDDING_RETRIES', 3)),
+        timeout=(5, float(os.getenv('EMBEDDING_TIMEOUT', 60))),
+    ),
+)
@@ -2,6 +2,34 @@ import os
 
 import redis.asyncio as aioredis
 
+# 单次往返完成整篇文章的差异计算: KEYS[1]为文章的切块id集合, ARGV为本次全部切块id
+# 返回 {新增id列表, 删除id列表}
+_DIFF_SCRIPT = """
+local existing = redis.call('SMEMBERS', KEYS[1])
+local existing_set = {}
+for _, id in ipairs(existing) do
+    existing_set[id] = true
+end
+local incoming_set = {}
+local to_add = {}
+for _, id in ipairs(ARGV) do
+    if not incoming_set[id] then
+        incoming_set[id] = true
+        if not existing_set[id] then
+            table.insert(to_add, id)
+        end
+    end
+end
+local to_delete = {}
+for _, id in ipairs(existing) do
+    if not incoming_set[id] then
+        table.insert(to_delete, id)
+    end
+end
+return {to_add, to_delete}
+"""
+
+
 class DeDuplication:
     _instance = None
 
@@ -25,19 +53,23 @@ class DeDuplication:
                 password=None,
                 decode_responses=True
             )
+            self._diff_script = self.redis_client.register_script(_DIFF_SCRIPT)
 
     async def get_to_update_and_to_delete_doc_ids(
             self,
             document_id,
             source_ids
     ):
-        # 获取 Redis 中存储的集合
-        existing_ids = await self.redis_client.smembers(document_id)
-        # 计算新增的 ID
-        to_add_ids = set(source_ids) - existing_ids
-        # 计算需要删除的 ID
-        to_delete_ids = existing_ids - set(source_ids)
-        return to_add_ids, to_delete_ids
+        """
+        计算文章的新增/删除切块id
+        source_ids必须是整篇文章的全部切块id，只传一个批次会把其余批次的切块误判为删除
+        """
+        if not source_ids:
+            # 文章切块为空时，已有切块全部删除
+            return set(), await self.redis_client.smembers(document_id)
+        # 在Redis服务端一次完成差异计算，不再拉取整个集合到本地
+        to_add_ids, to_delete_ids = await self._diff_script(keys=[document_id], args=list(source_ids))
+        return set(to_add_ids), set(to_delete_ids)
 
     async def update_source_ids(
             self,
@@ -45,8 +77,8 @@ class DeDuplication:
             to_add_ids,
             to_delete_ids
     ):
-        # 使用pipeline批量操作以优化IO
-        async with self.redis_client.pipeline() as pipeline:
+        # 使用MULTI事务pipeline，新增和删除原子生效
+        async with self.redis_client.pipeline(transaction=True) as pipeline:
             if to_add_ids:
                 await pipeline.sadd(document_id, *to_add_ids)
             if to_delete_ids:
@@ -0,0 +1,318 @@
+"""
+进程内HNSW向量索引
+在 exp/rag/3.向量数据库/12.索引算法实现_HNSW.py 的基础上改为生产实现:
+- 向量归一化后存放在连续的float32 NumPy数组中(按需倍增扩容)，使用余弦距离
+- 一次计算一个节点全部邻居的距离(矩阵乘)，邻居选择使用论文中的启发式(Algorithm 4)
+- 数据量不超过exact_threshold时直接精确检索，小索引上比遍历图更快且召回率为1；
+  这时不构建图，超过阈值时再一次性把尚未入图的节点插入
+- save/load 使用不含pickle的npz快照，图结构按CSR格式存放
+"""
+import io
+import heapq
+import json
+import math
+import os
+import random
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class HNSWIndex:
+    """分层可导航小世界图索引，只支持追加，数据变化后整体重建"""
+
+    def __init__(
+            self,
+            dim: int,
+            m: int = 16,
+            ef_construction: int = 200,
+            ef_search: int = 128,
+            exact_threshold: int = 1024,
+            initial_capacity: int = 256,
+            seed: Optional[int] = None,
+    ):
+        """
+        :param dim: 向量维度
+        :param m: 第1层及以上每个节点的最大连接数，第0层为2m
+        :param ef_construction: 构建时的候选集大小
+        :param ef_search: 检索时的默认候选集大小
+        :param exact_threshold: 数据量不超过该值时精确检索
+        :param initial_capacity: 初始容量
+        :param seed: 层级随机数种子
+        """
+        self.dim = dim
+        self.m = m
+        self.m0 = m * 2
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_threshold = exact_threshold
+        self._level_mult = 1 / math.log(max(m, 2))
+        self._rng = random.Random(seed)
+        self._vectors = np.zeros((max(initial_capacity, 1), dim), dtype=np.float32)
+        self._count = 0
+        # _links[节点][层] -> 邻居节点列表，只包含已经入图的前len(_links)个节点
+        self._links: list[list[list[int]]] = []
+        self._entry_point: Optional[int] = None
+        self._max_level = -1
+        self.ids: list[str] = []
+        self.payloads: list[dict] = []
+        self._id_to_node: dict[str, int] = {}
+        # 随快照保存的附加信息，例如数据版本
+        self.info: dict = {}
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._count]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _reserve(self, size: int):
+        capacity = self._vectors.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        self._vectors = vectors
+
+    def _distances(self, query: np.ndarray, nodes: Sequence[int]) -> np.ndarray:
+        return 1 - self._vectors[nodes] @ query
+
+    def _random_level(self) -> int:
+        return int(-math.log(1 - self._rng.random()) * self._level_mult)
+
+    def _search_layer(self, query: np.ndarray, entry_points: list[int], ef: int, layer: int) -> list[tuple[float, int]]:
+        """
+        在指定层做贪心best-first搜索
+        :return: 按距离升序的 [(距离, 节点)]
+        """
+        visited = set(entry_points)
+        distances = self._distances(query, entry_points).tolist()
+        candidates = list(zip(distances, entry_points))
+        heapq.heapify(candidates)
+        # 用负距离实现最大堆，堆顶是当前结果中最远的节点
+        results = [(-distance, node) for distance, node in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0]:
+                break
+            neighbors = [neighbor for neighbor in self._links[node][layer] if neighbor not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for neighbor_distance, neighbor in zip(self._distances(query, neighbors).tolist(), neighbors):
+                if len(results) < ef or neighbor_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbor_distance, neighbor))
+                    heapq.heappush(results, (-neighbor_distance, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted((-distance, node) for distance, node in results)
+
+    def _select_neighbors(self, candidates: list[tuple[float, int]], m: int) -> list[int]:
+        """
+        启发式选择邻居: 候选按距离升序，只保留比所有已选邻居都更接近目标的候选，
+        让连接分布在不同方向上，聚簇数据上的召回率明显高于直接取最近的m个
+        """
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        vectors = self._vectors[nodes]
+        # 候选两两之间的距离，转为列表后逐个比较比索引NumPy数组快得多
+        pairwise = (1 - vectors @ vectors.T).tolist()
+        selected: list[int] = []
+        for i, (distance, node) in enumerate(candidates):
+            if len(selected) == m:
+                break
+            row = pairwise[i]
+            if all(row[j] > distance for j in selected):
+                selected.append(i)
+        # 不足m个时用被跳过的最近候选补齐
+        if len(selected) < m:
+            chosen = set(selected)
+            selected.extend(i for i in range(len(candidates)) if i not in chosen)
+            selected = sorted(selected[:m])
+        return [nodes[i] for i in selected]
+
+    def _shrink(self, node: int, layer: int, max_links: int):
+        links = self._links[node][layer]
+        if len(links) <= max_links:
+            return
+        distances = self._distances(self._vectors[node], links).tolist()
+        self._links[node][layer] = self._select_neighbors(sorted(zip(distances, links)), max_links)
+
+    def _insert(self, node: int):
+        query = self._vectors[node]
+        level = self._random_level()
+        self._links.append([[] for _ in range(level + 1)])
+        if self._entry_point is None:
+            self._entry_point = node
+            self._max_level = level
+            return
+
+        entry_points = [self._entry_point]
+        for layer in range(self._max_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        for layer in range(min(level, self._max_level), -1, -1):
+            candidates = self._search_layer(query, entry_points, self.ef_construction, layer)
+            max_links = self.m0 if layer == 0 else self.m
+            neighbors = self._select_neighbors(candidates, self.m)
+            self._links[node][layer] = neighbors
+            for neighbor in neighbors:
+                self._links[neighbor][layer].append(node)
+                self._shrink(neighbor, layer, max_links)
+            entry_points = [node for _, node in candidates]
+
+        if level > self._max_level:
+            self._entry_point = node
+            self._max_level = level
+
+    def add(
+            self,
+            ids: Sequence[str],
+            vectors: Iterable[Sequence[float]],
+            payloads: Optional[Sequence[dict]] = None,
+    ):
+        """
+        批量追加向量
+        :param ids: 外部id，不允许重复
+        :param vectors: 向量
+        :param payloads: 随结果返回的数据，需要可以JSON序列化
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(ids) != len(vectors):
+            raise ValueError(f"ids与vectors数量不一致: {len(ids)} != {len(vectors)}")
+        duplicated = [object_id for object_id in ids if object_id in self._id_to_node]
+        if duplicated or len(set(ids)) != len(ids):
+            raise ValueError(f"重复的id: {duplicated[:5] or ids}")
+        start = self._count
+        self._reserve(start + len(vectors))
+        self._vectors[start:start + len(vectors)] = self._normalize(vectors)
+        for offset, object_id in enumerate(ids):
+            node = start + offset
+            self._count = node + 1
+            self.ids.append(object_id)
+            self.payloads.append(dict(payloads[offset]) if payloads is not None else {})
+            self._id_to_node[object_id] = node
+        if self._count > self.exact_threshold:
+            self._build_graph()
+
+    def _build_graph(self):
+        """把尚未入图的节点依次插入图中"""
+        for node in range(len(self._links), self._count):
+            self._insert(node)
+
+    def search(
+            self,
+            vector: Sequence[float],
+            k: int = 4,
+            ef: Optional[int] = None,
+    ) -> list[tuple[str, float, dict]]:
+        """
+        检索最相似的k个向量
+        :param vector: 查询向量
+        :param k: 返回数量
+        :param ef: 候选集大小，默认max(ef_search, k)
+        :return: 按相似度降序的 [(id, 余弦相似度, payload)]
+        """
+        if self._count == 0 or k <= 0:
+            return []
+        query = self._normalize(np.asarray(vector, dtype=np.float32).reshape(self.dim))
+        if self._count <= self.exact_threshold:
+            similarities = self.vectors @ query
+            k = min(k, self._count)
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            return [(self.ids[node], float(similarities[node]), self.payloads[node]) for node in top]
+
+        self._build_graph()
+        entry_points = [self._entry_point]
+        for layer in range(self._max_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        candidates = self._search_layer(query, entry_points, max(ef or self.ef_search, k), 0)
+        return [(self.ids[node], 1 - distance, self.payloads[node]) for distance, node in candidates[:k]]
+
+    def save(self, path: str):
+        """保存快照，先写临时文件再替换，读取方不会看到写了一半的文件"""
+        levels = np.array([len(links) for links in self._links], dtype=np.int32)
+        flat_links = [links for node_links in self._links for links in node_links]
+        offsets = np.zeros(len(flat_links) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(links) for links in flat_links])
+        indices = np.fromiter(
+            (neighbor for links in flat_links for neighbor in links), dtype=np.int32, count=int(offsets[-1])
+        )
+        header = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "dim": self.dim,
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "exact_threshold": self.exact_threshold,
+            "entry_point": self._entry_point,
+            "max_level": self._max_level,
+            "ids": self.ids,
+            "payloads": self.payloads,
+            "info": self.info,
+        }
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            header=np.array(json.dumps(header, ensure_ascii=False, default=str)),
+            vectors=self.vectors,
+            levels=levels,
+            link_offsets=offsets,
+            link_indices=indices,
+        )
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HNSWIndex":
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            if header["format"] != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(f"不支持的快照格式: {header['format']}")
+            index = cls(
+                dim=header["dim"],
+                m=header["m"],
+                ef_construction=header["ef_construction"],
+                ef_search=header["ef_search"],
+                exact_threshold=header["exact_threshold"],
+                initial_capacity=len(header["ids"]),
+            )
+            vectors = data["vectors"]
+            levels = data["levels"].tolist()
+            offsets = data["link_offsets"].tolist()
+            indices = data["link_indices"].tolist()
+
+        index._vectors[:len(vectors)] = vectors
+        index._count = len(vectors)
+        position = 0
+        for level_count in levels:
+            node_links = []
+            for _ in range(level_count):
+                node_links.append(indices[offsets[position]:offsets[position + 1]])
+                position += 1
+            index._links.append(node_links)
+        index._entry_point = header["entry_point"]
+        index._max_level = header["max_level"]
+        index.ids = header["ids"]
+        index.payloads = header["payloads"]
+        index._id_to_node = {object_id: node for node, object_id in enumerate(index.ids)}
+        index.info = header["info"]
+        return index
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from itertools import islice
 from typing import Iterable, Iterator, TypeVar, Optional, Any
 
@@ -23,6 +24,12 @@ def _batch(size: int, iterable: Iterable[T]) -> Iterator[list[T]]:
         yield chunk
 
 
+@lru_cache(maxsize=65536)
+def _content_hash(content: str) -> str:
+    """切块内容哈希，未变化段落的切块直接命中缓存"""
+    return str(_hash_string_to_uuid(content))
+
+
 class _HashedDocument(Document):
     """A hashed document with a unique ID."""
 
@@ -55,7 +62,7 @@ class _HashedDocument(Document):
                 )
                 raise ValueError(msg)
 
-        content_hash = str(_hash_string_to_uuid(content))
+        content_hash = _content_hash(content)
 
         values["content_hash"] = content_hash
         values['metadata_hash'] = ''
@@ -122,48 +129,33 @@ async def index(
         knowledge_type=knowledge_type
     )
 
-    doc_iterator = iter(docs_source)
-    all_to_add_ids = []
-    all_to_delete_ids = []
-    for doc_batch in _batch(batch_size, doc_iterator):
-        hashed_docs = list(
-            _deduplicate_in_order(
-                [_HashedDocument.from_document(doc) for doc in doc_batch]
-            )
-        )
-        source_ids = [
-            doc.uid for doc in hashed_docs
-        ]
-        to_add_ids, to_delete_ids = await de_duplicator.get_to_update_and_to_delete_doc_ids(
-            document_id=document_id,
-            source_ids=source_ids,
-        )
-        to_add_docs = []
-        to_add_uids = []
-        for doc, source_id in zip(hashed_docs, source_ids):
-            if source_id in to_add_ids:
-                to_add_docs.append(doc.to_document())
-                to_add_uids.append(source_id)
-
-        if to_add_docs:
-            res = await vector_store.aadd_documents(
-                to_add_docs,
-                ids=to_add_uids,
-                batch_size=batch_size,
-            )
-        if to_delete_ids:
-            await _adelete(vector_store, list(to_delete_ids))
-        await de_duplicator.update_source_ids(
-            document_id=document_id,
-            to_add_ids=list(to_add_ids),
-            to_delete_ids=list(to_delete_ids),
+    # 先计算整篇文章的切块哈希，再一次性与Redis中的集合做差异
+    hashed_docs = list(
+        _deduplicate_in_order(
+            [_HashedDocument.from_document(doc) for doc in docs_source]
         )
-        all_to_add_ids.extend(
-            to_add_ids
-        )
-        all_to_delete_ids.extend(
-            to_delete_ids
+    )
+    to_add_ids, to_delete_ids = await de_duplicator.get_to_update_and_to_delete_doc_ids(
+        document_id=document_id,
+        source_ids=[doc.uid for doc in hashed_docs],
+    )
+    to_add_docs = [doc for doc in hashed_docs if doc.uid in to_add_ids]
+    for doc_batch in _batch(batch_size, to_add_docs):
+        await vector_store.aadd_documents(
+            [doc.to_document() for doc in doc_batch],
+            ids=[doc.uid for doc in doc_batch],
+            batch_size=batch_size,
         )
+    if to_delete_ids:
+        await _adelete(vector_store, list(to_delete_ids))
+    # 向量库写入成功后，新增和删除原子地同步到Redis
+    await de_duplicator.update_source_ids(
+        document_id=document_id,
+        to_add_ids=list(to_add_ids),
+        to_delete_ids=list(to_delete_ids),
+    )
+    all_to_add_ids = [doc.uid for doc in to_add_docs]
+    all_to_delete_ids = list(to_delete_ids)
     return all_to_add_ids, all_to_delete_ids
 
 
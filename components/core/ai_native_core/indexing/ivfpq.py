@@ -0,0 +1,406 @@
+"""
+IVF-PQ向量索引
+在 exp/rag/3.向量数据库/10.索引算法实现_IVF_FLAT.py / 11.索引算法实现_IVF_PQ.py 的基础上改为可复用实现:
+- 粗聚类和PQ码本使用NumPy实现的k-means，只在抽样子集上训练，不依赖sklearn
+- 编码残差(向量-所属聚类中心)，检索时按查询批量计算查找表，非对称距离(ADC)通过查表求和完全向量化
+- 倒排列表按聚类连续存放(codes按聚类排序 + offsets)，save/load使用np.save，加载时可以内存映射
+- 余弦度量时向量先归一化，按L2排序，分数换算为余弦相似度 1 - d²/2，与Weaviate余弦检索一致
+"""
+import json
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+_FORMAT_VERSION = 1
+
+
+def _squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """x与质心两两之间的L2距离平方，shape=(len(x), len(centroids))"""
+    distances = (x * x).sum(axis=1, keepdims=True) - 2 * x @ centroids.T + (centroids * centroids).sum(axis=1)
+    return np.maximum(distances, 0)
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+    """分块计算每个向量最近的质心，控制距离矩阵的内存"""
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk_size):
+        labels[start:start + chunk_size] = _squared_distances(x[start:start + chunk_size], centroids).argmin(axis=1)
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd k-means
+    :param x: 训练向量，shape=(n, d)
+    :param k: 质心数量，超过样本数时取样本数
+    :param iterations: 迭代次数
+    :param seed: 随机数种子
+    :return: 质心，shape=(k, d)
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        # 空簇重新从样本中随机选取
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+class ProductQuantizer:
+    """乘积量化器: 向量切分为m个子向量，每个子空间用2^nbits个质心量化"""
+
+    def __init__(self, m: int = 8, nbits: int = 8):
+        """
+        :param m: 子空间数量
+        :param nbits: 每个子空间的量化位数，最大8位(编码为uint8)
+        """
+        if not 1 <= nbits <= 8:
+            raise ValueError(f"nbits必须在1-8之间: {nbits}")
+        self.m = m
+        self.nbits = nbits
+        self.ksub = 2 ** nbits
+        self.dsub = 0
+        # shape=(m, ksub, dsub)
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, x: np.ndarray) -> np.ndarray:
+        """shape=(n, d) -> (n, m, dsub)"""
+        return x.reshape(len(x), self.m, self.dsub)
+
+    def train(self, x: np.ndarray, iterations: int = 20, seed: int = 0):
+        x = np.asarray(x, dtype=np.float32)
+        if x.shape[1] % self.m != 0:
+            raise ValueError(f"向量维度 {x.shape[1]} 不能被子空间数量 {self.m} 整除")
+        self.dsub = x.shape[1] // self.m
+        subvectors = self._split(x)
+        codebooks = np.zeros((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for i in range(self.m):
+            centroids = kmeans(subvectors[:, i], self.ksub, iterations=iterations, seed=seed + i)
+            codebooks[i, :len(centroids)] = centroids
+        self.codebooks = codebooks
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        """:return: PQ码，shape=(n, m)，uint8"""
+        subvectors = self._split(np.asarray(x, dtype=np.float32))
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for i in range(self.m):
+            codes[:, i] = _assign(subvectors[:, i], self.codebooks[i])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """:return: 近似向量，shape=(n, d)"""
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), -1)
+
+    def distance_tables(self, x: np.ndarray) -> np.ndarray:
+        """
+        批量计算查找表
+        :param x: 查询(或查询残差)，shape=(n, d)
+        :return: shape=(n, m, ksub)，[q, i, j]为第q个查询的第i个子向量到第i个子空间第j个质心的L2距离平方
+        """
+        subvectors = self._split(np.asarray(x, dtype=np.float32))
+        # ||x||² - 2x·c + ||c||²，避免展开 (n, m, ksub, dsub) 的差值张量
+        tables = np.einsum("nmd,mkd->nmk", subvectors, self.codebooks) * -2
+        tables += (subvectors * subvectors).sum(axis=2)[:, :, None]
+        tables += (self.codebooks * self.codebooks).sum(axis=2)[None]
+        return np.maximum(tables, 0)
+
+
+class IVFPQIndex:
+    """倒排文件 + 乘积量化索引"""
+
+    def __init__(
+            self,
+            nlist: int = 256,
+            m: int = 8,
+            nbits: int = 8,
+            nprobe: int = 8,
+            metric: str = "cosine",
+            store_vectors: bool = False,
+    ):
+        """
+        :param nlist: 粗聚类数量(倒排列表数量)
+        :param m: PQ子空间数量，需要整除向量维度
+        :param nbits: PQ每个子空间的量化位数
+        :param nprobe: 检索时默认探查的倒排列表数量
+        :param metric: cosine / l2
+        :param store_vectors: 同时保存原始向量，检索时可以用refine_factor对PQ候选精确重排；
+            原始向量落盘后内存映射加载，常驻内存的仍只有PQ码
+        """
+        if metric not in ("cosine", "l2"):
+            raise ValueError(f"不支持的度量方式: {metric}")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.metric = metric
+        self.pq = ProductQuantizer(m=m, nbits=nbits)
+        self.dim = 0
+        self.centroids: Optional[np.ndarray] = None
+        # 按倒排列表排序后连续存放，第i个列表为 codes[offsets[i]:offsets[i+1]]
+        self.codes = np.empty((0, m), dtype=np.uint8)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        self.vectors: Optional[np.ndarray] = np.empty((0, 0), dtype=np.float32) if store_vectors else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None and self.pq.is_trained
+
+    def _prepare(self, x) -> np.ndarray:
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        if self.metric == "cosine":
+            norms = np.linalg.norm(x, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            x = x / norms
+        return x
+
+    def train(
+            self,
+            x,
+            sample_size: Optional[int] = 65536,
+            iterations: int = 20,
+            seed: int = 0,
+    ):
+        """
+        在抽样子集上训练粗聚类和PQ码本
+        :param x: 训练向量
+        :param sample_size: 抽样数量，为空时使用全部向量；经验上每个质心有几十个样本即可
+        :param iterations: k-means迭代次数
+        :param seed: 随机数种子
+        """
+        x = self._prepare(x)
+        if sample_size is not None and len(x) > sample_size:
+            x = x[np.random.default_rng(seed).choice(len(x), sample_size, replace=False)]
+        self.dim = x.shape[1]
+        self.centroids = kmeans(x, self.nlist, iterations=iterations, seed=seed)
+        self.nlist = len(self.centroids)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        if self.vectors is not None:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+        residuals = x - self.centroids[_assign(x, self.centroids)]
+        self.pq.train(residuals, iterations=iterations, seed=seed)
+
+    def add(self, x, ids: Optional[Sequence[int]] = None):
+        """
+        编码并追加向量
+        :param x: 向量
+        :param ids: 整数id，为空时使用递增序号
+        """
+        if not self.is_trained:
+            raise ValueError("索引尚未训练，请先调用train()")
+        x = self._prepare(x)
+        if ids is None:
+            ids = np.arange(len(self.ids), len(self.ids) + len(x), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        labels = _assign(x, self.centroids)
+        codes = self.pq.encode(x - self.centroids[labels])
+
+        # 与已有数据合并后按倒排列表重新排序
+        old_labels = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        all_labels = np.concatenate([old_labels, labels])
+        order = np.argsort(all_labels, kind="stable")
+        self.codes = np.concatenate([self.codes, codes])[order]
+        self.ids = np.concatenate([self.ids, ids])[order]
+        if self.vectors is not None:
+            self.vectors = np.concatenate([self.vectors, x])[order]
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(all_labels, minlength=self.nlist))
+
+    def search(
+            self,
+            queries,
+            k: int = 10,
+            nprobe: Optional[int] = None,
+            refine_factor: int = 1,
+            batch_size: int = 64,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        批量检索
+        :param queries: 查询向量，shape=(nq, d)或(d,)
+        :param k: 每个查询返回的数量
+        :param nprobe: 探查的倒排列表数量
+        :param refine_factor: 大于1时按PQ距离取k*refine_factor个候选，再用原始向量精确重排(需要store_vectors)
+        :param batch_size: 每批计算查找表的查询数，控制查找表内存(batch_size*nprobe*m*ksub)
+        :return: (scores, ids)，shape均为(nq, k)，不足k个时id为-1；余弦度量时分数为相似度(降序)，L2时为距离平方(升序)
+        """
+        queries = self._prepare(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        fill = -np.inf if self.metric == "cosine" else np.inf
+        all_scores = np.full((len(queries), k), fill, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if refine_factor > 1 and self.vectors is None:
+            raise ValueError("精确重排需要创建索引时开启store_vectors")
+        # 查表时把 (子空间, 质心) 展平为一维下标
+        table_offsets = np.arange(self.pq.m) * self.pq.ksub
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            coarse = _squared_distances(batch, self.centroids)
+            probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+            # 每个(查询, 探查列表)的残差查找表，shape=(nb, nprobe, m, ksub)
+            residuals = batch[:, None, :] - self.centroids[probes]
+            tables = self.pq.distance_tables(residuals.reshape(-1, self.dim)).reshape(
+                len(batch), nprobe, self.pq.m, self.pq.ksub
+            )
+            for qi in range(len(batch)):
+                distances, positions = [], []
+                for pi, list_id in enumerate(probes[qi]):
+                    begin, end = self.offsets[list_id], self.offsets[list_id + 1]
+                    if begin == end:
+                        continue
+                    lookup = tables[qi, pi].ravel()
+                    distances.append(lookup[self.codes[begin:end] + table_offsets].sum(axis=1))
+                    positions.append(np.arange(begin, end))
+                if not distances:
+                    continue
+                distances = np.concatenate(distances)
+                positions = np.concatenate(positions)
+                top = min(k * refine_factor, len(distances))
+                best = np.argpartition(distances, top - 1)[:top]
+                positions = positions[best]
+                if refine_factor > 1:
+                    distances = ((self.vectors[np.sort(positions)] - batch[qi]) ** 2).sum(axis=1)
+                    positions = np.sort(positions)
+                else:
+                    distances = distances[best]
+                order = np.argsort(distances)[:k]
+                distances, positions = distances[order], positions[order]
+                scores = 1 - distances / 2 if self.metric == "cosine" else distances
+                all_scores[start + qi, :len(order)] = scores
+                all_ids[start + qi, :len(order)] = self.ids[positions]
+        return all_scores, all_ids
+
+    def memory_bytes(self) -> int:
+        """索引常驻内存估算: PQ码 + id + 质心 + 码本(原始向量内存映射，不计入)"""
+        return int(self.codes.nbytes + self.ids.nbytes + self.centroids.nbytes + self.pq.codebooks.nbytes)
+
+    def save(self, directory: str):
+        """每个数组单独保存为.npy，便于加载时内存映射"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "codebooks.npy"), self.pq.codebooks)
+        np.save(os.path.join(directory, "codes.npy"), self.codes)
+        np.save(os.path.join(directory, "ids.npy"), self.ids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        if self.vectors is not None:
+            np.save(os.path.join(directory, "vectors.npy"), self.vectors)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({
+                "format": _FORMAT_VERSION,
+                "nlist": self.nlist,
+                "nprobe": self.nprobe,
+                "metric": self.metric,
+                "m": self.pq.m,
+                "nbits": self.pq.nbits,
+                "dim": self.dim,
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "IVFPQIndex":
+        """
+        :param mmap: PQ码和id以只读内存映射方式加载，多个进程共享页缓存，加载后不能再add
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["format"] != _FORMAT_VERSION:
+            raise ValueError(f"不支持的索引格式: {meta['format']}")
+        vectors_path = os.path.join(directory, "vectors.npy")
+        index = cls(
+            nlist=meta["nlist"],
+            m=meta["m"],
+            nbits=meta["nbits"],
+            nprobe=meta["nprobe"],
+            metric=meta["metric"],
+            store_vectors=os.path.exists(vectors_path),
+        )
+        mmap_mode = "r" if mmap else None
+        index.dim = meta["dim"]
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        index.pq.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+        index.pq.dsub = index.dim // index.pq.m
+        index.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode=mmap_mode)
+        index.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode=mmap_mode)
+        index.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        if index.vectors is not None:
+            index.vectors = np.load(vectors_path, mmap_mode=mmap_mode)
+        return index
+
+
+def brute_force_search(base, queries, k: int = 10, metric: str = "cosine") -> tuple[np.ndarray, np.ndarray]:
+    """精确检索，作为召回率基准"""
+    base = np.asarray(base, dtype=np.float32)
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if metric == "cosine":
+        base = base / np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ base.T
+        order = np.argsort(-scores, axis=1)[:, :k]
+    else:
+        scores = _squared_distances(queries, base)
+        order = np.argsort(scores, axis=1)[:, :k]
+    return np.take_along_axis(scores, order, axis=1), order
+
+
+def benchmark(
+        index: IVFPQIndex,
+        base,
+        queries,
+        k: int = 10,
+        nprobes: Sequence[int] = (1, 4, 8, 16, 32),
+        refine_factors: Sequence[int] = (1,),
+) -> list[dict]:
+    """
+    recall@k 与 QPS 对比
+    :param index: 已经add了base(id为序号)的索引
+    :param base: 原始向量
+    :param queries: 查询向量
+    :param refine_factors: 精确重排倍数，大于1时需要索引开启store_vectors
+    :return: [{"method", "nprobe", "refine_factor", "recall", "qps"}]，第一行为精确检索
+    """
+    start = time.perf_counter()
+    _, truth = brute_force_search(base, queries, k=k, metric=index.metric)
+    rows = [{"method": "brute_force", "nprobe": None, "refine_factor": None, "recall": 1.0,
+             "qps": round(len(queries) / (time.perf_counter() - start), 1)}]
+    for refine_factor in refine_factors:
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            _, ids = index.search(queries, k=k, nprobe=nprobe, refine_factor=refine_factor)
+            elapsed = time.perf_counter() - start
+            hits = sum(len(set(found) & set(expected)) for found, expected in zip(ids.tolist(), truth.tolist()))
+            rows.append({
+                "method": "ivf_pq",
+                "nprobe": nprobe,
+                "refine_factor": refine_factor,
+                "recall": round(hits / (len(queries) * k), 4),
+                "qps": round(len(queries) / elapsed, 1),
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(100, 768))
+    base = (centers[rng.integers(0, 100, 100000)] + 0.5 * rng.normal(size=(100000, 768))).astype(np.float32)
+    queries = (centers[rng.integers(0, 100, 200)] + 0.5 * rng.normal(size=(200, 768))).astype(np.float32)
+    ivfpq = IVFPQIndex(nlist=256, m=96, nbits=8, store_vectors=True)
+    ivfpq.train(base, sample_size=20000)
+    ivfpq.add(base)
+    print(f"PQ索引内存 {ivfpq.memory_bytes() / 1024 / 1024:.1f}MB vs 原始向量 {base.nbytes / 1024 / 1024:.1f}MB")
+    for row in benchmark(ivfpq, base, queries, refine_factors=(1, 4)):
+        print(row)
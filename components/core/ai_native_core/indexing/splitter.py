@@ -1,4 +1,9 @@
+import hashlib
 import json
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
@@ -19,6 +24,89 @@ markdown_splitter = MarkdownHeaderTextSplitter(
 )
 
 
+SectionCacheInfo = namedtuple("SectionCacheInfo", ["hits", "misses", "currsize", "bytes", "max_bytes"])
+
+
+class SectionSplitCache:
+    """
+    标题段落的递归切分结果缓存，保存文档时只有内容变化的段落会被重新切分
+    - 键为 sha1(标题路径 + 段落内容 + 切分参数)，不保存段落原文
+    - 按切块占用的字节数做LRU淘汰；超过单条上限的段落不缓存(超大段落很少原样重复出现)
+    - 每个进程(包括split_docs_parallel的子进程)各自一份，总量受max_bytes限制
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entry_bytes: int = 1024 * 1024):
+        """
+        :param max_bytes: 缓存的切块总字节数上限
+        :param max_entry_bytes: 单个段落的切块超过该字节数时不缓存
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, tuple[tuple[str, ...], int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(section_text, chunk_size, chunk_overlap, header_path) -> str:
+        digest = hashlib.sha1()
+        for part in (*header_path, str(chunk_size), str(chunk_overlap), section_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def __call__(self, section_text, chunk_size, chunk_overlap, header_path=()):
+        """
+        切分单个段落
+        :param header_path: 段落的多级标题，例如 ("第1章", "1.1节")
+        """
+        key = self._key(section_text, chunk_size, chunk_overlap, header_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+        chunks = tuple(text_splitter.split_text(section_text))
+        size = sum(sys.getsizeof(chunk) for chunk in chunks)
+        if size > self.max_entry_bytes:
+            return chunks
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (chunks, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return chunks
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self) -> SectionCacheInfo:
+        with self._lock:
+            return SectionCacheInfo(self.hits, self.misses, len(self._entries), self._bytes, self.max_bytes)
+
+
+_split_section = SectionSplitCache(
+    max_bytes=int(os.getenv('SPLIT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    max_entry_bytes=int(os.getenv('SPLIT_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)),
+)
+
+
+def _header_path(metadata) -> tuple:
+    return tuple(metadata[header] for header in ["H1", "H2", "H3", "H4", "H5", "H6"] if header in metadata)
+
+
 # 标准splitter:markdown + 递归 + header提升可解释性，可操控性
 # 两种splitter混合提升综合切分效果
 # TODO:元数据增强,header可以作为混合检索BM25依据。header可以作为Embedding增强依据。融合文章标题，文章树标题也能一定程度提升命中率
@@ -28,25 +116,28 @@ def split_docs(
         chunk_size=800,
         chunk_overlap=150
 ):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
-    )
     splits = []
     for markdown_document in markdown_documents:
         meta_data = markdown_document.metadata
         md_header_splits = markdown_splitter.split_text(markdown_document.page_content)
         title = markdown_document.metadata.get("title", "")
         # Split
-        res = text_splitter.split_documents(md_header_splits)
-        for _res in res:
-            _res.metadata.update(meta_data)
-            multi_header = title
-            # 多级标题提取
-            for header in ["H1", "H2", "H3", "H4", "H5", "H6"]:
-                if header in _res.metadata:
-                    multi_header = f"{multi_header}-{_res.metadata[header]}"
-            _res.page_content = f"多级标题:{multi_header}\n\n{_res.page_content}"
-        splits.extend(res)
+        for section in md_header_splits:
+            for chunk in _split_section(
+                    section.page_content, chunk_size, chunk_overlap, _header_path(section.metadata)
+            ):
+                metadata = section.metadata | meta_data
+                multi_header = title
+                # 多级标题提取
+                for header in ["H1", "H2", "H3", "H4", "H5", "H6"]:
+                    if header in metadata:
+                        multi_header = f"{multi_header}-{metadata[header]}"
+                splits.append(
+                    Document(
+                        page_content=f"多级标题:{multi_header}\n\n{chunk}",
+                        metadata=metadata
+                    )
+                )
     return splits
 
 
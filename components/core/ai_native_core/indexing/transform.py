@@ -0,0 +1,74 @@
+"""
+按知识库配置的Embedding后处理(查询侧)
+配置由api的 core/indexing/transform.py 写入去重Redis的 embedding_transform:{knowledge_type}:{namespace}，
+写入时已对文档向量执行，查询向量在这里执行同样的步骤后再检索:
+- truncate: Matryoshka截断后重新归一化
+- pca: 投影到训练好的主成分后重新归一化
+- quantize: float16 / int8 量化后反量化
+"""
+import base64
+import json
+from typing import Optional
+
+import numpy as np
+
+from ai_native_core.indexing.de_duplication import de_duplicator
+
+TRANSFORM_KEY = "embedding_transform:{}:{}"
+
+
+def _decode_array(data: str, shape) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(shape)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class EmbeddingTransform:
+    """依次执行的变换步骤，与api中的实现保持一致"""
+
+    def __init__(self, steps: list[dict]):
+        self.steps = steps
+        self._pca = {
+            i: (
+                _decode_array(step["mean"], (step["input_dim"],)),
+                _decode_array(step["components"], (step["dim"], step["input_dim"])),
+            )
+            for i, step in enumerate(steps) if step["type"] == "pca"
+        }
+
+    def apply(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i, step in enumerate(self.steps):
+            if step["type"] == "truncate":
+                vectors = _normalize(vectors[:, :step["dim"]])
+            elif step["type"] == "pca":
+                mean, components = self._pca[i]
+                vectors = _normalize((_normalize(vectors) - mean) @ components.T)
+            elif step["dtype"] == "float16":
+                vectors = vectors.astype(np.float16).astype(np.float32)
+            elif step["dtype"] == "int8":
+                scale = np.abs(vectors).max(axis=1, keepdims=True) / 127
+                scale[scale == 0] = 1
+                vectors = np.clip(np.round(vectors / scale), -127, 127) * scale
+            else:
+                raise ValueError(f"不支持的变换: {step}")
+        return vectors.astype(np.float32)
+
+    def apply_query(self, vector: list[float]) -> list[float]:
+        return self.apply([vector])[0].tolist()
+
+    @classmethod
+    def from_json(cls, data: str) -> "EmbeddingTransform":
+        return cls(json.loads(data)["steps"])
+
+
+async def aget_transform(namespace: str, knowledge_type: str) -> Optional[EmbeddingTransform]:
+    """获取知识库的变换配置，没有配置时返回None"""
+    data = await de_duplicator.redis_client.get(TRANSFORM_KEY.format(knowledge_type, namespace))
+    if not data:
+        return None
+    return EmbeddingTransform.from_json(data)
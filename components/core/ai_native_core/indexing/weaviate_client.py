@@ -1,6 +1,9 @@
+import asyncio
 import os
+import weakref
 
 import weaviate
+from weaviate.client import WeaviateAsyncClient
 
 weaviate_client = weaviate.connect_to_local(
     host=os.getenv('WEAVIATE_HOST'),
@@ -13,3 +16,48 @@ weaviate_client = weaviate.connect_to_local(
         api_key=os.getenv('WEAVIATE_API_KEY')
     )
 )
+
+# 异步客户端的gRPC channel绑定在创建它的事件循环上，每个事件循环共享一个客户端
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_async_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _new_async_client() -> WeaviateAsyncClient:
+    return weaviate.use_async_with_local(
+        host=os.getenv('WEAVIATE_HOST'),
+        port=int(os.getenv('WEAVIATE_PORT')),
+        grpc_port=int(os.getenv('WEAVIATE_GRPC_PORT')),
+        headers=None,
+        additional_config=None,
+        skip_init_checks=True,
+        auth_credentials=weaviate.auth.AuthApiKey(
+            api_key=os.getenv('WEAVIATE_API_KEY')
+        )
+    )
+
+
+async def get_async_weaviate_client() -> WeaviateAsyncClient:
+    """
+    获取当前事件循环共享的异步Weaviate客户端，首次调用时建立连接
+    所有命名空间的查询复用同一个gRPC channel
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is not None and client.is_connected():
+        return client
+    lock = _async_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _new_async_client()
+            _async_clients[loop] = client
+        if not client.is_connected():
+            await client.connect()
+    return client
+
+
+async def close_async_weaviate_client():
+    """关闭当前事件循环的异步客户端"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -1,16 +1,92 @@
+import asyncio
+import hashlib
 import os
+import time
+from collections import OrderedDict
 
 from langchain_core.documents import Document
 from tang_yuan_mlops_sdk.llm.rerank import RerankClient
 
 
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
 class BCERerank:
+    """
+    重排序
+    交叉编码器对每个(问题, 切块)单独打分，分数与同一批的其他候选无关，因此按 (问题哈希, 切块内容哈希) 缓存分数:
+    - 热门问题重复命中相同切块时只请求未缓存的部分，缓存有TTL和数量上限(LRU)
+    - 并发的相同请求合并为一次在途调用
+    """
+
     def __init__(
             self,
             base_url: str = os.getenv('RERANK_BASE_URL'),
             token: str = os.getenv('RERANK_TOKEN'),
+            cache_ttl: float = 600,
+            cache_max_size: int = 10000,
     ):
+        """
+        :param cache_ttl: 分数缓存秒数，为0时不缓存
+        :param cache_max_size: 最多缓存的(问题, 切块)分数数
+        """
         self.client = RerankClient(base_url=base_url, token=token)
+        self.cache_ttl = cache_ttl
+        self.cache_max_size = cache_max_size
+        # (问题哈希, 切块哈希) -> (过期时间, 分数)
+        self._cache: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.coalesced = 0
+
+    def _get_cached(self, key: tuple[str, str], now: float):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, score = entry
+        if expires_at <= now:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return score
+
+    def _put_cached(self, query_hash: str, scores: dict[str, float]):
+        if self.cache_ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.cache_ttl
+        for content_hash, score in scores.items():
+            key = (query_hash, content_hash)
+            self._cache[key] = (expires_at, score)
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, query: str, query_hash: str, contents: dict[str, str]) -> dict[str, float]:
+        """请求重排服务，返回 {切块哈希: 分数}"""
+        content_hashes = list(contents)
+        self.requests += 1
+        res = await self.client.rerank(query, [contents[content_hash] for content_hash in content_hashes])
+        scores = {content_hashes[item['index']]: item['score'] for item in res}
+        self._put_cached(query_hash, scores)
+        return scores
+
+    async def _ascore(self, query: str, query_hash: str, contents: dict[str, str]) -> dict[str, float]:
+        """未缓存的切块打分，相同的在途请求只调用一次重排服务"""
+        key = (query_hash, tuple(contents))
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self._fetch(query, query_hash, contents))
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None
+            )
+        # shield: 一个调用方被取消不影响其他等待同一结果的调用方
+        return await asyncio.shield(future)
 
     async def rerank(
             self,
@@ -19,22 +95,57 @@ class BCERerank:
             topn: int = 10,
             rerank_threshold: float = 0.4,
     ) -> list[Document]:
-        """异步重排序接口"""
+        """异步重排序接口，返回带rerank_score/rerank_rank的文档副本，不修改传入的文档"""
         if not texts:
             return []
-        page_content_list = [doc.page_content for doc in texts]
-        res = await self.client.rerank(query, page_content_list)
-        # 把分数赋值到原始文本元数据中
-        for rank, item in enumerate(res):
-            index = item['index']
-            score = item['score']
-            texts[index].metadata['rerank_score'] = score
-            texts[index].metadata['rerank_rank'] = rank
-        # 重新排序文本
-        texts = sorted(texts, key=lambda x: x.metadata['rerank_score'], reverse=True)
+        query_hash = _hash(query)
+        content_hashes = [_hash(doc.page_content) for doc in texts]
+        now = time.monotonic()
+        scores = {}
+        missing = {}
+        for content_hash, doc in zip(content_hashes, texts):
+            if content_hash in scores or content_hash in missing:
+                continue
+            score = self._get_cached((query_hash, content_hash), now)
+            if score is None:
+                missing[content_hash] = doc.page_content
+            else:
+                scores[content_hash] = score
+        self.hits += len(scores)
+        self.misses += len(missing)
+        if missing:
+            scores.update(await self._ascore(query, query_hash, missing))
+
+        # 按分数降序排名，与重排服务返回的顺序一致
+        order = sorted(range(len(texts)), key=lambda i: scores[content_hashes[i]], reverse=True)
+        reranked = [
+            texts[i].model_copy(update={
+                "metadata": {**texts[i].metadata, "rerank_score": scores[content_hashes[i]], "rerank_rank": rank}
+            })
+            for rank, i in enumerate(order)
+        ]
         # filter
-        texts = [doc for doc in texts if doc.metadata['rerank_score'] >= rerank_threshold]
-        return texts[:topn]
+        reranked = [doc for doc in reranked if doc.metadata['rerank_score'] >= rerank_threshold]
+        return reranked[:topn]
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": self.cache_max_size,
+            "ttl": self.cache_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+        }
 
 
-reranker = BCERerank()
+reranker = BCERerank(
+    cache_ttl=float(os.getenv('RERANK_CACHE_TTL', 600)),
+    cache_max_size=int(os.getenv('RERANK_CACHE_MAX_SIZE', 10000)),
+)
@@ -0,0 +1,179 @@
+"""
+多命名空间检索延迟对比: 同步客户端(线程池) vs 异步客户端(共享gRPC channel)
+"""
+import asyncio
+import random
+import statistics
+import time
+
+import allure
+import pytest
+from weaviate.classes.config import Configure, DataType, Property
+
+from ai_native_core.indexing.weaviate_client import close_async_weaviate_client, weaviate_client
+from ai_native_core.utils.vector_store import (
+    amulti_namespace_search,
+    get_async_vector_stores,
+    get_collection_name,
+    get_hybrid_kwargs,
+    get_vector_stores,
+)
+
+TENANT = "tenant1"
+NAMESPACES = [f"async_benchmark_{i}" for i in range(20)]
+CHUNKS = 200
+DIM = 768
+ROUNDS = 10
+
+
+def _prepare():
+    """每个命名空间直接写入CHUNKS个切块，绕过Embedding服务"""
+    for namespace in NAMESPACES:
+        name = get_collection_name(namespace, "common")
+        if weaviate_client.collections.exists(name):
+            continue
+        collection = weaviate_client.collections.create(
+            name=name,
+            vectorizer_config=Configure.Vectorizer.none(),
+            properties=[
+                Property(name="text", data_type=DataType.TEXT),
+                Property(name="document_id", data_type=DataType.TEXT),
+            ],
+        )
+        with collection.batch.fixed_size(batch_size=200) as batch:
+            for i in range(CHUNKS):
+                batch.add_object(
+                    properties={"text": f"{namespace} 第{i}条知识", "document_id": str(i)},
+                    vector=[random.random() for _ in range(DIM)],
+                )
+
+
+async def _sync_fan_out(namespace_list, vector, query):
+    stores = get_vector_stores(tenant=TENANT, namespace_list=namespace_list)
+    results = await asyncio.gather(*[
+        asyncio.to_thread(store.similarity_search_with_score, query, k=5, vector=vector)
+        for store in stores
+    ])
+    return [item for sublist in results for item in sublist]
+
+
+async def _async_fan_out(namespace_list, vector, query):
+    stores = get_async_vector_stores(tenant=TENANT, namespace_list=namespace_list)
+    results = await asyncio.gather(*[
+        store.asimilarity_search_by_vector_with_score(vector, k=5, query=query)
+        for store in stores
+    ])
+    return [item for sublist in results for item in sublist]
+
+
+async def _latency(fan_out, namespace_list, vector, query):
+    latencies = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        docs = await fan_out(namespace_list, vector, query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), docs
+
+
+@pytest.mark.asyncio
+async def test_async_fan_out_latency():
+    _prepare()
+    vector = [random.random() for _ in range(DIM)]
+    query = "知识"
+
+    for count in (1, 5, 20):
+        namespace_list = NAMESPACES[:count]
+        with allure.step(f"{count}个命名空间"):
+            sync_ms, sync_docs = await _latency(_sync_fan_out, namespace_list, vector, query)
+            async_ms, async_docs = await _latency(_async_fan_out, namespace_list, vector, query)
+            # 两种方式检索结果与分数一致
+            assert [(d.page_content, round(s, 4)) for d, s in sync_docs] == \
+                   [(d.page_content, round(s, 4)) for d, s in async_docs]
+            print(f"\n{count}个命名空间: 同步+线程池 {sync_ms:.1f}ms vs 异步 {async_ms:.1f}ms")
+
+    with allure.step("不存在的命名空间返回空结果"):
+        stores = get_async_vector_stores(tenant=TENANT, namespace_list=["async_benchmark_missing"])
+        assert await stores[0].asimilarity_search_by_vector_with_score(vector, k=5, query=query) == []
+
+    await close_async_weaviate_client()
+
+
+@pytest.mark.asyncio
+async def test_multi_namespace_search_global_top_k():
+    _prepare()
+    vector = [random.random() for _ in range(DIM)]
+    k = 10
+
+    with allure.step("逐个collection取全部结果，得到基准全局top-k"):
+        stores = get_async_vector_stores(tenant=TENANT, namespace_list=NAMESPACES)
+        everything = []
+        for store in stores:
+            everything.extend(await store.asimilarity_search_by_vector_with_relevance(vector, k=CHUNKS))
+        expected = sorted(everything, key=lambda item: item[1], reverse=True)[:k]
+
+    with allure.step("全局检索"):
+        start = time.perf_counter()
+        top_k = await amulti_namespace_search(
+            tenant=TENANT,
+            namespace_list=NAMESPACES,
+            query="知识",
+            k=k,
+            vector=vector,
+        )
+        print(f"\n{len(NAMESPACES)}个命名空间全局top-{k}: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    assert [doc.page_content for doc, _ in top_k] == [doc.page_content for doc, _ in expected]
+    scores = [score for _, score in top_k]
+    assert scores == sorted(scores, reverse=True)
+    assert [doc.metadata["embedding_rank"] for doc, _ in top_k] == list(range(k))
+    assert all(doc.metadata["embedding_score"] == score for doc, score in top_k)
+
+    await close_async_weaviate_client()
+
+
+@pytest.mark.asyncio
+async def test_hybrid_keyword_recall():
+    namespace = "hybrid_benchmark"
+    name = get_collection_name(namespace, "common")
+    if weaviate_client.collections.exists(name):
+        weaviate_client.collections.delete(name)
+    collection = weaviate_client.collections.create(
+        name=name,
+        vectorizer_config=Configure.Vectorizer.none(),
+        properties=[
+            Property(name="text", data_type=DataType.TEXT),
+            Property(name="title", data_type=DataType.TEXT),
+        ],
+    )
+    with collection.batch.fixed_size(batch_size=200) as batch:
+        for i in range(CHUNKS):
+            title = "VPN connection guide" if i == 42 else f"handbook chapter {i}"
+            batch.add_object(
+                properties={"text": f"content {i}", "title": title},
+                vector=[random.random() for _ in range(DIM)],
+            )
+    store = get_async_vector_stores(tenant=TENANT, namespace_list=[namespace])[0]
+    vector = [random.random() for _ in range(DIM)]
+
+    with allure.step("纯向量检索对短关键词问题召回不稳定"):
+        docs = await store.asimilarity_search_by_vector_with_score(
+            vector, k=5, query="VPN", **get_hybrid_kwargs(search_mode="vector")
+        )
+        print(f"\n纯向量: {[doc.metadata['title'] for doc, _ in docs]}")
+
+    with allure.step("hybrid在Weaviate中一次完成BM25与向量融合"):
+        docs = await store.asimilarity_search_by_vector_with_score(
+            vector, k=5, query="VPN",
+            **get_hybrid_kwargs(alpha=0.3, fusion_type="relative_score", bm25_properties=["title^2", "text"]),
+        )
+        print(f"hybrid: {[doc.metadata['title'] for doc, _ in docs]}")
+        assert docs[0][0].metadata["title"] == "VPN connection guide"
+
+    with allure.step("非法参数"):
+        with pytest.raises(ValueError):
+            get_hybrid_kwargs(search_mode="bm25")
+        with pytest.raises(ValueError):
+            get_hybrid_kwargs(fusion_type="rrf")
+
+    weaviate_client.collections.delete(name)
+    await close_async_weaviate_client()
@@ -0,0 +1,97 @@
+"""
+Embedding同步调用的连接池: keep-alive复用连接、自动重试、分批并行与延迟直方图
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import allure
+
+from ai_native_core.embedding import BGEEmbeddings
+from ai_native_core.utils.http_pool import LatencyHistogram, PooledHTTPClient
+
+
+class _EmbeddingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.batch_sizes.append(len(body["inputs"]))
+            fail = server.failures > 0
+            server.failures -= fail
+        if fail:
+            payload, status = b"busy", 503
+        else:
+            time.sleep(0.02)
+            payload, status = json.dumps([[float(len(text))] for text in body["inputs"]]).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EmbeddingHandler)
+    server.lock = threading.Lock()
+    server.connections = set()
+    server.batch_sizes = []
+    server.failures = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_pooled_embedding_calls():
+    server = _start_server()
+    url = f"http://127.0.0.1:{server.server_port}/embed"
+    embeddings = BGEEmbeddings(
+        base_url=url,
+        token="test",
+        batch_size=8,
+        max_workers=4,
+        http_client=PooledHTTPClient(pool_size=4, retries=2, backoff_factor=0.01),
+    )
+
+    with allure.step("连续调用复用同一个keep-alive连接"):
+        for i in range(20):
+            assert embeddings.embed_query("x" * i) == [float(i)]
+        assert len(server.connections) == 1
+
+    with allure.step("大输入按batch_size拆分并行发送，结果保持顺序"):
+        server.batch_sizes.clear()
+        texts = ["x" * i for i in range(100)]
+        start = time.perf_counter()
+        assert embeddings.embed_documents(texts) == [[float(i)] for i in range(100)]
+        print(f"\n100条分13批: {(time.perf_counter() - start) * 1000:.0f}ms")
+        assert sorted(server.batch_sizes) == [4] + [8] * 12
+        assert len(server.connections) <= 4
+
+    with allure.step("503自动重试"):
+        server.failures = 2
+        assert embeddings.embed_query("abc") == [3.0]
+
+    with allure.step("延迟直方图"):
+        stats = embeddings.get_stats()
+        print(stats)
+        assert stats["requests"] == stats["latency"]["count"] == 20 + 13 + 1
+        assert stats["errors"] == 0
+        assert stats["latency"]["p50_ms"] >= 25
+
+    embeddings.http_client.close()
+    server.shutdown()
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(10, 100))
+    for latency in (1, 5, 50, 500):
+        histogram.observe(latency)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"le_10": 2, "le_100": 1, "le_inf": 1}
+    assert snapshot["p50_ms"] == 10 and snapshot["p99_ms"] == float("inf")
@@ -0,0 +1,151 @@
+"""
+进程内HNSW索引: 召回率、快照，以及与Weaviate检索的延迟对比
+"""
+import json
+import random
+import statistics
+import time
+
+import allure
+import numpy as np
+import pytest
+from weaviate.classes.config import Configure, DataType, Property
+
+from ai_native_core.extensions.ext_redis import redis_client
+from ai_native_core.indexing.de_duplication import de_duplicator
+from ai_native_core.indexing.hnsw import HNSWIndex
+from ai_native_core.indexing.weaviate_client import close_async_weaviate_client, weaviate_client
+from ai_native_core.utils.local_index import (
+    KNOWLEDGE_CHANGED_CHANNEL,
+    KNOWLEDGE_VERSION_KEY,
+    LocalVectorIndex,
+)
+from ai_native_core.utils.vector_store import get_async_vector_store, get_collection_name
+
+TENANT = "tenant1"
+NAMESPACE = "local_index_benchmark"
+DIM = 128
+ROUNDS = 50
+
+
+def _clustered(count, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    return (centers[rng.integers(0, clusters, count)] + 0.3 * rng.normal(size=(count, DIM))).astype(np.float32)
+
+
+def test_hnsw_recall_and_snapshot(tmp_path):
+    vectors = _clustered(3000)
+    queries = _clustered(100, seed=1)
+
+    with allure.step("关闭精确检索，测试图检索的召回率"):
+        index = HNSWIndex(dim=DIM, exact_threshold=0, seed=42)
+        index.add([str(i) for i in range(len(vectors))], vectors, [{"i": i} for i in range(len(vectors))])
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        recall = 0
+        for query in queries:
+            truth = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+            recall += len({str(i) for i in truth} & {object_id for object_id, _, _ in index.search(query, k=10)}) / 10
+        recall /= len(queries)
+        print(f"\nrecall@10: {recall:.3f}")
+        assert recall >= 0.95
+
+    with allure.step("快照保存后加载，检索结果一致"):
+        path = str(tmp_path / "index.npz")
+        index.info = {"version": "3"}
+        index.save(path)
+        loaded = HNSWIndex.load(path)
+        assert loaded.info == {"version": "3"}
+        for query in queries[:10]:
+            assert loaded.search(query, k=10) == index.search(query, k=10)
+
+    with allure.step("小索引精确检索"):
+        small = HNSWIndex(dim=DIM)
+        small.add(["a", "b"], vectors[:2])
+        results = small.search(vectors[0], k=5)
+        assert [object_id for object_id, _, _ in results] == ["a", "b"]
+        assert results[0][1] == pytest.approx(1, abs=1e-5)
+        with pytest.raises(ValueError):
+            small.add(["a"], vectors[:1])
+
+    with allure.step("不超过阈值时不构建图，超过后补建"):
+        lazy = HNSWIndex(dim=DIM, exact_threshold=100, seed=42)
+        start = time.perf_counter()
+        lazy.add([str(i) for i in range(100)], vectors[:100])
+        print(f"\n阈值内添加100个向量耗时 {(time.perf_counter() - start) * 1000:.2f}ms")
+        assert len(lazy._links) == 0
+        lazy.add([str(i) for i in range(100, 200)], vectors[100:200])
+        assert len(lazy._links) == 200
+        assert lazy.search(vectors[150], k=1)[0][0] == "150"
+
+
+def _prepare(count=300):
+    name = get_collection_name(NAMESPACE, "tool")
+    if weaviate_client.collections.exists(name):
+        weaviate_client.collections.delete(name)
+    collection = weaviate_client.collections.create(
+        name=name,
+        vectorizer_config=Configure.Vectorizer.none(),
+        properties=[
+            Property(name="text", data_type=DataType.TEXT),
+            Property(name="name", data_type=DataType.TEXT),
+        ],
+    )
+    vectors = _clustered(count)
+    with collection.batch.fixed_size(batch_size=200) as batch:
+        for i, vector in enumerate(vectors):
+            batch.add_object(properties={"text": f"工具{i}", "name": f"tool_{i}"}, vector=vector.tolist())
+    return collection, vectors
+
+
+@pytest.mark.asyncio
+async def test_local_index_latency_and_refresh(tmp_path):
+    collection, vectors = _prepare()
+    version_key = KNOWLEDGE_VERSION_KEY.format("tool", NAMESPACE)
+    await de_duplicator.redis_client.delete(version_key)
+    local_index = LocalVectorIndex(knowledge_type="tool", snapshot_dir=str(tmp_path), client=redis_client)
+    store = get_async_vector_store(tenant=TENANT, namespace=NAMESPACE, knowledge_type="tool")
+    query = vectors[0].tolist()
+
+    with allure.step("首次检索从Weaviate加载，结果与Weaviate纯向量检索一致"):
+        local_docs = await local_index.asearch(TENANT, NAMESPACE, query, k=5)
+        remote_docs = await store.asimilarity_search_by_vector_with_relevance(query, k=5)
+        assert [doc.page_content for doc, _ in local_docs] == [doc.page_content for doc, _ in remote_docs]
+        assert [round(score, 4) for _, score in local_docs] == [round(score, 4) for _, score in remote_docs]
+        assert local_index.builds == 1
+        # 不超过max_objects时精确检索，不在服务进程中构建HNSW图
+        assert not local_index._entries[NAMESPACE].index._links
+
+    with allure.step("检索延迟对比"):
+        local_ms, remote_ms = [], []
+        for _ in range(ROUNDS):
+            vector = random.choice(vectors).tolist()
+            start = time.perf_counter()
+            await local_index.asearch(TENANT, NAMESPACE, vector, k=5)
+            local_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            await store.asimilarity_search_by_vector_with_relevance(vector, k=5)
+            remote_ms.append((time.perf_counter() - start) * 1000)
+        print(f"\n进程内 {statistics.median(local_ms):.2f}ms vs Weaviate {statistics.median(remote_ms):.2f}ms")
+        assert statistics.median(local_ms) < statistics.median(remote_ms)
+
+    with allure.step("工具变更广播后重新加载"):
+        collection.data.insert(properties={"text": "新工具", "name": "new_tool"}, vector=[1.0] * DIM)
+        await de_duplicator.redis_client.incr(version_key)
+        redis_client.publish(KNOWLEDGE_CHANGED_CHANNEL, json.dumps({"namespace": NAMESPACE, "knowledge_type": "tool"}))
+        for _ in range(50):
+            if NAMESPACE in local_index._stale:
+                break
+            time.sleep(0.1)
+        docs = await local_index.asearch(TENANT, NAMESPACE, [1.0] * DIM, k=1)
+        assert docs[0][0].page_content == "新工具"
+        assert local_index.builds == 2
+
+    with allure.step("重启后版本未变化时从快照加载"):
+        restarted = LocalVectorIndex(knowledge_type="tool", snapshot_dir=str(tmp_path))
+        docs = await restarted.asearch(TENANT, NAMESPACE, [1.0] * DIM, k=1)
+        assert docs[0][0].page_content == "新工具"
+        assert restarted.snapshot_loads == 1 and restarted.builds == 0
+
+    weaviate_client.collections.delete(get_collection_name(NAMESPACE, "tool"))
+    await close_async_weaviate_client()
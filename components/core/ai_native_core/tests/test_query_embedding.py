@@ -0,0 +1,38 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from ai_native_core.utils.query_embedding import QueryEmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    """记录实际Embedding调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_query_embedding_cache_lru():
+    embeddings = CountingEmbeddings()
+    cache = QueryEmbeddingCache(embeddings=embeddings, max_size=2)
+
+    # 常规知识与工具知识分支对同一个问题只计算一次
+    assert await cache.aembed_query("会议室号码") == await cache.aembed_query("会议室号码")
+    assert embeddings.calls == 1
+
+    await cache.aembed_query("请假流程")
+    await cache.aembed_query("会议室号码")  # 刷新访问时间
+    await cache.aembed_query("报销流程")  # 淘汰 请假流程
+    assert embeddings.calls == 3
+    await cache.aembed_query("会议室号码")
+    assert embeddings.calls == 3
+    await cache.aembed_query("请假流程")
+    assert embeddings.calls == 4
+    assert cache.hits == 3 and cache.misses == 4
@@ -1,9 +1,11 @@
+import asyncio
 from pprint import pprint
 
+import allure
 import pytest
 from langchain_core.documents import Document
 
-from ai_native_core.rerank import reranker
+from ai_native_core.rerank import BCERerank, reranker
 
 
 @pytest.mark.asyncio
@@ -18,3 +20,56 @@ async def test_rerank():
         texts=texts,
     )
     pprint(res)
+
+
+class CountingRerankClient:
+    """按文本长度打分，记录实际请求"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def rerank(self, query, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.05)
+        scores = [min(len(text) / 20, 1.0) for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: scores[i], reverse=True)
+        return [{"index": i, "score": scores[i]} for i in order]
+
+
+@pytest.mark.asyncio
+async def test_rerank_cache_and_coalescing():
+    rerank = BCERerank(base_url="http://127.0.0.1", token="test", cache_ttl=600, cache_max_size=3)
+    client = rerank.client = CountingRerankClient()
+    texts = [Document(page_content="a" * n, metadata={"n": n}) for n in (4, 16, 12)]
+
+    with allure.step("按分数排序过滤，不修改传入的文档"):
+        res = await rerank.rerank("问题", texts, topn=10, rerank_threshold=0.5)
+        assert [doc.metadata["n"] for doc in res] == [16, 12]
+        assert [doc.metadata["rerank_rank"] for doc in res] == [0, 1]
+        assert all("rerank_score" not in doc.metadata for doc in texts)
+
+    with allure.step("已缓存的切块不再请求，只发送新的切块"):
+        res = await rerank.rerank("问题", texts + [Document(page_content="b" * 8)], rerank_threshold=0)
+        assert client.calls[-1] == ["b" * 8]
+        assert [doc.page_content for doc in res] == ["a" * 16, "a" * 12, "b" * 8, "a" * 4]
+        # 缓存上限为3，最早的分数被淘汰
+        assert len(rerank._cache) == 3
+
+    with allure.step("并发的相同请求合并为一次调用"):
+        calls = len(client.calls)
+        results = await asyncio.gather(*[rerank.rerank("另一个问题", texts) for _ in range(5)])
+        assert len(client.calls) == calls + 1
+        assert rerank.coalesced == 4
+        assert all([doc.page_content for doc in r] == [doc.page_content for doc in results[0]] for r in results)
+        # 每个调用方拿到独立的文档副本
+        assert results[0][0] is not results[1][0]
+
+    with allure.step("过期后重新请求"):
+        rerank.cache_ttl = 0.01
+        rerank.clear()
+        await rerank.rerank("问题", texts[:1], rerank_threshold=0)
+        await asyncio.sleep(0.02)
+        calls = len(client.calls)
+        await rerank.rerank("问题", texts[:1], rerank_threshold=0)
+        assert len(client.calls) == calls + 1
+    print(rerank.get_stats())
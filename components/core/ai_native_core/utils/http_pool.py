@@ -0,0 +1,157 @@
+"""
+模型服务的同步HTTP连接池
+- 每个进程一个 requests.Session，HTTPAdapter 复用keep-alive连接，避免每次请求重新建立TCP/TLS连接
+- 连接失败、429和5xx按指数退避重试
+- 按固定分桶记录请求延迟直方图，用于观察模型服务的耗时分布
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 延迟分桶上界(毫秒)，最后一个桶收集超过10秒的请求
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """线程安全的固定分桶延迟直方图"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, latency_ms)] += 1
+            self._sum += latency_ms
+            self._count += 1
+
+    def _quantile(self, q: float) -> Optional[float]:
+        """返回分位数所在桶的上界，落在最后一个桶时返回inf"""
+        if self._count == 0:
+            return None
+        rank = q * self._count
+        cumulative = 0
+        for i, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"le_{bucket}" for bucket in self.buckets] + ["le_inf"]
+            return {
+                "count": self._count,
+                "avg_ms": round(self._sum / self._count, 2) if self._count else 0.0,
+                "p50_ms": self._quantile(0.5),
+                "p95_ms": self._quantile(0.95),
+                "p99_ms": self._quantile(0.99),
+                "buckets": dict(zip(labels, self._counts)),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+
+
+def create_session(pool_size: int = 8, retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    """
+    创建带连接池和重试的Session
+    :param pool_size: 每个主机保持的连接数，不小于并发请求数
+    :param retries: 最多重试次数
+    :param backoff_factor: 退避系数，第n次重试前等待 backoff_factor * 2^(n-1) 秒
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # 模型推理请求没有副作用，POST也可以重试
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PooledHTTPClient:
+    """按进程懒创建Session，fork出的子进程不会复用父进程的连接"""
+
+    def __init__(
+            self,
+            pool_size: int = 8,
+            retries: int = 3,
+            backoff_factor: float = 0.5,
+            timeout: tuple[float, float] = (5, 60),
+    ):
+        """
+        :param pool_size: 连接池大小
+        :param retries: 最多重试次数
+        :param backoff_factor: 退避系数
+        :param timeout: (连接超时, 读取超时) 秒
+        """
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+        self._session: Optional[requests.Session] = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    self._session = create_session(self.pool_size, self.retries, self.backoff_factor)
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """发送POST请求并记录延迟(包含重试)，请求异常和非200响应计入errors"""
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.post(url, **kwargs)
+            failed = response.status_code != 200
+            return response
+        finally:
+            self.latency.observe((time.perf_counter() - start) * 1000)
+            with self._lock:
+                self.requests += 1
+                self.errors += failed
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._session_pid == os.getpid():
+                self._session.close()
+            self._session = None
+
+    def get_stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency": self.latency.snapshot(),
+        }
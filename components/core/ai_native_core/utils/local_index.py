@@ -0,0 +1,278 @@
+"""
+进程内向量索引
+工具知识每个命名空间只有几百个切块，全部加载到agent进程内存中检索，省去每次检索访问Weaviate的网络往返
+- 数据版本: api写入/删除知识后递增去重Redis中的 knowledge_version:{knowledge_type}:{namespace}，并在
+  KNOWLEDGE_CHANGED_CHANNEL 广播；收到广播或超过check_interval后比较版本，版本变化时重新从Weaviate加载
+- 快照: 构建好的索引按版本保存到本地目录，进程重启后版本未变化时直接加载
+- 超过max_objects的命名空间不加载，回退到Weaviate检索
+- 不超过exact_threshold(默认等于max_objects)时使用NumPy精确检索，不构建HNSW图：
+  纯Python构建图持有GIL，5000条需要十秒以上，不能在服务进程里随数据版本变化反复执行；
+  5000条1024维向量的精确检索不到1ms
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from ai_native_core.extensions.ext_redis import redis_client
+from ai_native_core.indexing.de_duplication import de_duplicator
+from ai_native_core.indexing.hnsw import HNSWIndex
+from ai_native_core.utils.vector_store import INVALIDATION_CHANNEL, get_async_vector_store
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_CHANGED_CHANNEL = "knowledge:changed"
+KNOWLEDGE_VERSION_KEY = "knowledge_version:{}:{}"
+
+
+@dataclass
+class _LocalEntry:
+    # None表示数据量超过上限，回退到Weaviate
+    index: Optional[HNSWIndex]
+    version: str
+    checked_at: float
+
+
+class LocalVectorIndex:
+    """按命名空间管理进程内HNSW索引"""
+
+    def __init__(
+            self,
+            knowledge_type: str = "tool",
+            max_objects: int = 5000,
+            exact_threshold: Optional[int] = None,
+            check_interval: float = 60,
+            snapshot_dir: Optional[str] = None,
+            client=None,
+    ):
+        """
+        :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+        :param max_objects: 单个命名空间加载到内存的对象数上限
+        :param exact_threshold: 对象数不超过该值时精确检索、不构建图，默认等于max_objects
+        :param check_interval: 没有收到变更广播时，检查数据版本的间隔秒数(广播丢失时的兜底)
+        :param snapshot_dir: 快照目录，为空时不保存快照
+        :param client: 订阅变更广播的Redis客户端，为空时只按check_interval检查
+        """
+        self.knowledge_type = knowledge_type
+        self.max_objects = max_objects
+        self.exact_threshold = max_objects if exact_threshold is None else exact_threshold
+        self.check_interval = check_interval
+        self.snapshot_dir = snapshot_dir
+        self.client = client
+        self._entries: dict[str, _LocalEntry] = {}
+        self._stale: set[str] = set()
+        self._building: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self.hits = 0
+        self.builds = 0
+        self.snapshot_loads = 0
+        self.fallbacks = 0
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def _snapshot_path(self, namespace: str) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, f"{self.knowledge_type}_{namespace}.npz")
+
+    async def _get_version(self, namespace: str) -> str:
+        version = await de_duplicator.redis_client.get(KNOWLEDGE_VERSION_KEY.format(self.knowledge_type, namespace))
+        return version or "0"
+
+    def _load_snapshot(self, namespace: str, version: str) -> Optional[HNSWIndex]:
+        path = self._snapshot_path(namespace)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            index = HNSWIndex.load(path)
+        except Exception as e:
+            logger.warning(f"加载向量索引快照{path}失败: {str(e)}")
+            return None
+        if index.info.get("version") != version:
+            return None
+        # 按当前配置检索，旧快照中较小的阈值不会触发构建图
+        index.exact_threshold = self.exact_threshold
+        return index
+
+    async def _build(self, tenant: str, namespace: str, version: str) -> Optional[HNSWIndex]:
+        index = await asyncio.to_thread(self._load_snapshot, namespace, version)
+        if index is not None:
+            self.snapshot_loads += 1
+            return index
+        store = get_async_vector_store(tenant=tenant, namespace=namespace, knowledge_type=self.knowledge_type)
+        objects = await store.afetch_objects(max_objects=self.max_objects)
+        if len(objects) > self.max_objects:
+            logger.info(f"命名空间{namespace}的{self.knowledge_type}知识超过{self.max_objects}条，使用Weaviate检索")
+            return None
+        self.builds += 1
+        if not objects:
+            return HNSWIndex(dim=0)
+        vectors = [obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector for obj in objects]
+        index = HNSWIndex(dim=len(vectors[0]), exact_threshold=self.exact_threshold)
+        index.info = {"version": version, "namespace": namespace}
+        # 构建是CPU密集的，放到线程中执行，不阻塞事件循环
+        await asyncio.to_thread(
+            index.add,
+            [str(obj.uuid) for obj in objects],
+            vectors,
+            [dict(obj.properties) for obj in objects],
+        )
+        path = self._snapshot_path(namespace)
+        if path is not None:
+            await asyncio.to_thread(index.save, path)
+        return index
+
+    async def _refresh(self, tenant: str, namespace: str) -> _LocalEntry:
+        # 先清除失效标记再读版本，读版本之后到达的广播会再次标记
+        with self._lock:
+            self._stale.discard(namespace)
+        version = await self._get_version(namespace)
+        entry = self._entries.get(namespace)
+        if entry is not None and entry.version == version:
+            entry.checked_at = time.monotonic()
+            return entry
+        entry = _LocalEntry(
+            index=await self._build(tenant, namespace, version),
+            version=version,
+            checked_at=time.monotonic(),
+        )
+        self._entries[namespace] = entry
+        return entry
+
+    async def aget(self, tenant: str, namespace: str) -> Optional[HNSWIndex]:
+        """
+        获取命名空间的进程内索引，版本变化时重新加载，同一命名空间的并发加载合并为一次
+        :return: 索引，数据量超过上限时为None
+        """
+        self._ensure_listener()
+        entry = self._entries.get(namespace)
+        if (
+                entry is not None
+                and namespace not in self._stale
+                and time.monotonic() - entry.checked_at < self.check_interval
+        ):
+            self.hits += 1
+            return entry.index
+        future = self._building.get(namespace)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(self._refresh(tenant, namespace))
+            self._building[namespace] = future
+            future.add_done_callback(
+                lambda f: self._building.pop(namespace, None) if self._building.get(namespace) is f else None
+            )
+        return (await asyncio.shield(future)).index
+
+    async def asearch(
+            self,
+            tenant: str,
+            namespace: str,
+            vector: list[float],
+            k: int = 4,
+    ) -> list[tuple[Document, float]]:
+        """
+        检索单个命名空间
+        :return: [(文档, 分数)]，分数为余弦相似度，与Weaviate纯向量检索一致
+        """
+        index = await self.aget(tenant, namespace)
+        if index is None:
+            self.fallbacks += 1
+            store = get_async_vector_store(tenant=tenant, namespace=namespace, knowledge_type=self.knowledge_type)
+            return await store.asimilarity_search_by_vector_with_relevance(vector, k=k)
+        if len(index) == 0:
+            return []
+        # 索引中是写入时变换后的向量，查询向量也要执行同样的变换
+        store = get_async_vector_store(tenant=tenant, namespace=namespace, knowledge_type=self.knowledge_type)
+        vector = await store.atransform_query(vector)
+        results = []
+        for _, score, payload in index.search(vector, k=k):
+            # 每次返回新的文档对象，下游会修改metadata
+            properties = dict(payload)
+            text = properties.pop("text", "")
+            results.append((Document(page_content=text, metadata=properties), score))
+        return results
+
+    async def amulti_namespace_search(
+            self,
+            tenant: str,
+            namespace_list: list,
+            vector: list[float],
+            k: int = 4,
+            is_global: bool = False,
+    ) -> list[tuple[Document, float]]:
+        """
+        多命名空间检索，并在metadata中写入embedding_rank/embedding_score
+        :param is_global: 是否按余弦相似度合并出全局top-k，否则每个命名空间各取k个
+        """
+        results = await asyncio.gather(*[
+            self.asearch(tenant, namespace, vector, k=k) for namespace in namespace_list
+        ])
+        items = (item for sublist in results for item in sublist)
+        if is_global:
+            retrieved = heapq.nlargest(k, items, key=lambda item: item[1])
+        else:
+            retrieved = list(items)
+        for rank, (doc, score) in enumerate(retrieved):
+            doc.metadata["embedding_rank"] = rank
+            doc.metadata["embedding_score"] = score
+        return retrieved
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """标记命名空间需要检查版本，为空时标记全部"""
+        with self._lock:
+            if namespace is None:
+                self._stale.update(self._entries)
+            else:
+                self._stale.add(namespace)
+
+    def _ensure_listener(self):
+        # 懒启动；fork出的子进程需要重新订阅
+        if self.client is None or (self._listener_pid == os.getpid() and self._listener.is_alive()):
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="local-vector-index", daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(KNOWLEDGE_CHANGED_CHANNEL, INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("knowledge_type") in (None, self.knowledge_type):
+                        self.invalidate(data.get("namespace"))
+            except Exception as e:
+                logger.warning(f"进程内向量索引变更订阅中断: {str(e)}")
+                time.sleep(1)
+
+    def get_stats(self) -> dict:
+        return {
+            "namespaces": len(self._entries),
+            "objects": sum(len(entry.index) for entry in self._entries.values() if entry.index is not None),
+            "hits": self.hits,
+            "builds": self.builds,
+            "snapshot_loads": self.snapshot_loads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+local_tool_index = LocalVectorIndex(
+    knowledge_type="tool",
+    max_objects=int(os.getenv('LOCAL_INDEX_MAX_OBJECTS', 5000)),
+    exact_threshold=int(os.getenv('LOCAL_INDEX_EXACT_THRESHOLD') or os.getenv('LOCAL_INDEX_MAX_OBJECTS', 5000)),
+    check_interval=float(os.getenv('LOCAL_INDEX_CHECK_INTERVAL', 60)),
+    snapshot_dir=os.getenv('LOCAL_INDEX_SNAPSHOT_DIR') or None,
+    client=redis_client,
+)
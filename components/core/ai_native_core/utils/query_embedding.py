@@ -0,0 +1,47 @@
+"""
+查询向量的进程内LRU缓存
+同一轮对话中常规知识与工具知识两个检索分支共享一次Embedding，重复的问题直接命中缓存
+"""
+import os
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from ai_native_core.embedding import embedding
+
+
+class QueryEmbeddingCache:
+    """按问题文本缓存查询向量"""
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 1024):
+        """
+        :param embeddings: 实际执行Embedding的模型
+        :param max_size: 最多缓存的问题数
+        """
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = self._cache.get(text)
+        if vector is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return vector
+        self.misses += 1
+        vector = await self.embeddings.aembed_query(text)
+        self._cache[text] = vector
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    def clear(self):
+        self._cache.clear()
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    embeddings=embedding,
+    max_size=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 1024)),
+)
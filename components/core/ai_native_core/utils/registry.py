@@ -0,0 +1,175 @@
+"""
+有界、可失效的向量库实例注册表，api与components共用这一份实现
+只依赖标准库，向量库实例由调用方传入的factory创建
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "vector_store_registry:invalidate"
+
+
+class VectorStoreRegistry:
+    """
+    有界、可失效的向量库实例注册表
+    - LRU + TTL: 实例数量有上限，过期后重新创建(会重新检查collection是否存在)
+    - 失效: 知识库删除、collection结构变化时按命名空间失效，并通过Redis广播给其他进程
+    - 创建实例期间发生失效时，创建出的实例只返回给本次调用，不放入注册表
+    """
+
+    def __init__(
+            self,
+            factory: Callable[[str, str, str], Any],
+            ttl: float = 300,
+            max_size: int = 1000,
+            client=None,
+    ):
+        """
+        :param factory: (tenant, namespace, knowledge_type) -> 向量库实例
+        :param ttl: 实例存活秒数
+        :param max_size: 最多缓存的实例数
+        :param client: 用于广播失效消息的Redis客户端，为空时只在本进程失效
+        """
+        self.factory = factory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.client = client
+        self._stores: OrderedDict[tuple[str, str, str], tuple[float, Any]] = OrderedDict()
+        # 正在创建的实例: key -> [创建中的调用数, 代数]，失效时递增代数
+        self._building: dict[tuple[str, str, str], list[int]] = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.discards = 0
+
+    def get(self, tenant: str, namespace: str, knowledge_type: str):
+        self._ensure_listener()
+        key = (tenant, namespace, knowledge_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._stores.get(key)
+            if entry is not None:
+                expires_at, store = entry
+                if expires_at > now:
+                    self._stores.move_to_end(key)
+                    self.hits += 1
+                    return store
+                del self._stores[key]
+                self.expirations += 1
+            self.misses += 1
+            building = self._building.setdefault(key, [0, 0])
+            building[0] += 1
+            generation = building[1]
+        # 创建实例会访问Weaviate，不在锁内执行
+        try:
+            store = self.factory(tenant, namespace, knowledge_type)
+        except BaseException:
+            with self._lock:
+                self._finish_build(key)
+            raise
+        with self._lock:
+            if self._finish_build(key) != generation:
+                self.discards += 1
+                return store
+            self._stores[key] = (now + self.ttl, store)
+            self._stores.move_to_end(key)
+            while len(self._stores) > self.max_size:
+                self._stores.popitem(last=False)
+                self.evictions += 1
+        return store
+
+    def _finish_build(self, key: tuple[str, str, str]) -> int:
+        """结束一次创建，返回当前代数，需持有锁"""
+        building = self._building[key]
+        building[0] -= 1
+        if building[0] == 0:
+            del self._building[key]
+        return building[1]
+
+    def _invalidate_local(self, namespace: Optional[str] = None, knowledge_type: Optional[str] = None) -> int:
+        def matches(key):
+            return (namespace is None or key[1] == namespace) and (knowledge_type is None or key[2] == knowledge_type)
+
+        with self._lock:
+            keys = [key for key in self._stores if matches(key)]
+            for key in keys:
+                del self._stores[key]
+            for key, building in self._building.items():
+                if matches(key):
+                    building[1] += 1
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def invalidate(self, namespace: Optional[str] = None, knowledge_type: Optional[str] = None) -> int:
+        """
+        失效指定命名空间的实例，并通知其他进程
+        :param namespace: 命名空间，为空时失效全部
+        :param knowledge_type: 知识类型，为空时失效全部类型
+        :return: 本进程失效的实例数
+        """
+        count = self._invalidate_local(namespace, knowledge_type)
+        if self.client is not None:
+            try:
+                self.client.publish(
+                    INVALIDATION_CHANNEL,
+                    json.dumps({"namespace": namespace, "knowledge_type": knowledge_type, "sender": self._sender})
+                )
+            except Exception as e:
+                logger.warning(f"广播向量库实例失效消息失败: {str(e)}")
+        return count
+
+    def _ensure_listener(self):
+        # 懒启动；fork出的子进程需要重新订阅
+        if self.client is None or (self._listener_pid == os.getpid() and self._listener.is_alive()):
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="vector-store-registry", daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("sender") != self._sender:
+                        self._invalidate_local(data.get("namespace"), data.get("knowledge_type"))
+            except Exception as e:
+                logger.warning(f"向量库实例失效订阅中断: {str(e)}")
+                time.sleep(1)
+
+    @property
+    def _sender(self) -> str:
+        # 本进程本实例已经在本地失效，收到自己的广播时跳过
+        return f"{os.getpid()}:{id(self)}"
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._stores),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "discards": self.discards,
+            }
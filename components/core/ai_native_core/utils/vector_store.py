@@ -1,57 +1,100 @@
-from functools import lru_cache
+import asyncio
+import heapq
+import os
 from pprint import pprint
+from typing import Any, Optional
 
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_weaviate import WeaviateVectorStore
+from weaviate.classes.query import HybridFusion
+from weaviate.exceptions import WeaviateQueryError
 
 from ai_native_core.embedding import embedding
-from ai_native_core.indexing.weaviate_client import weaviate_client
+from ai_native_core.extensions.ext_redis import redis_client
+from ai_native_core.indexing.de_duplication import de_duplicator
+from ai_native_core.indexing.transform import EmbeddingTransform, aget_transform
+from ai_native_core.indexing.weaviate_client import get_async_weaviate_client, weaviate_client
+from ai_native_core.utils.query_embedding import query_embedding_cache
+from ai_native_core.utils.registry import INVALIDATION_CHANNEL, VectorStoreRegistry
+
+
+def get_collection_name(namespace: str, knowledge_type: str) -> str:
+    """向量库collection名称，与get_vector_store中的index_name一致"""
+    if knowledge_type == "common":
+        return f"common_knowledge_none_{namespace}"
+    elif knowledge_type == "tool":
+        return f"tool_knowledge_none_{namespace}"
+    raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+
+
+# 检索时返回的元数据字段，api与components保持一致
+COMMON_ATTRIBUTES = [
+    'text',
+    'tenant',
+    'owner',
+    'namespace',
+    'source',
+    'document_id',
+    'title',
+]
+TOOL_ATTRIBUTES = [
+    'text',
+    'tenant',
+    'owner',
+    'namespace',
+    'source',
+    'document_id',
+    'input_schema',
+    'few_shots',
+    'tool_trigger_selected_examples',
+    'name',
+    'description',
+    'tool_type',
+    'output_schema',
+    'output_schema_jinja2_template',
+    'html_template',
+    'extra_params',
+]
+
+
+# 小知识库合并存放的共享collection(多租户，tenant为命名空间)，存放位置由api写入去重Redis
+SHARED_COLLECTION_NAMES = {
+    "common": "common_knowledge_shared",
+    "tool": "tool_knowledge_shared",
+}
+PLACEMENT_KEY = "vector_placement:{}"
+
+
+def _create_vector_store(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+) -> WeaviateVectorStore:
+    attributes = COMMON_ATTRIBUTES if knowledge_type == "common" else TOOL_ATTRIBUTES
+    return WeaviateVectorStore(
+        client=weaviate_client,
+        index_name=get_collection_name(namespace, knowledge_type),  # 数据库index，纵向隔离
+        text_key='text',  # 文本字段
+        embedding=embedding,
+        attributes=attributes,
+    )
+
+
+vector_store_registry = VectorStoreRegistry(
+    factory=_create_vector_store,
+    ttl=float(os.getenv('VECTOR_STORE_REGISTRY_TTL', 300)),
+    max_size=int(os.getenv('VECTOR_STORE_REGISTRY_MAX_SIZE', 1000)),
+    client=redis_client,
+)
 
 
-@lru_cache(maxsize=1000)
 def get_vector_store(
         tenant: str,
         namespace: str,
         knowledge_type: str
-):
-    if knowledge_type == "common":
-        return WeaviateVectorStore(
-            client=weaviate_client,
-            index_name=f"common_knowledge_none_{namespace}",  # 数据库index，纵向隔离
-            text_key='text',  # 文本字段
-            embedding=embedding,
-            attributes=[
-                'text',
-                'tenant',
-                'owner',
-                'namespace',
-                'source',
-                'document_id',
-                'title',
-            ],
-        )
-    elif knowledge_type == "tool":
-        return WeaviateVectorStore(
-            client=weaviate_client,
-            index_name=f"tool_knowledge_none_{namespace}",  # 数据库index，纵向隔离
-            text_key='text',  # 文本字段
-            embedding=embedding,
-            attributes=[
-                'text',
-                'tenant',
-                'owner',
-                'namespace',
-                'source',
-                'document_id',
-                'input_schema',
-                'few_shots',
-                'name',
-                'description',
-                'tool_type',
-                'extra_params',
-            ],
-        )
-    else:
-        raise ValueError(f"Unsupported knowledge type: {knowledge_type}")
+) -> WeaviateVectorStore:
+    return vector_store_registry.get(tenant, namespace, knowledge_type)
 
 
 def get_vector_stores(
@@ -72,6 +115,273 @@ def get_vector_stores(
     ]
 
 
+HYBRID_FUSION_TYPES = {
+    "relative_score": HybridFusion.RELATIVE_SCORE,
+    "ranked": HybridFusion.RANKED,
+}
+
+
+def get_hybrid_kwargs(
+        search_mode: str = "hybrid",
+        alpha: float = 0.75,
+        fusion_type: str = "relative_score",
+        bm25_properties: Optional[list[str]] = None,
+) -> dict:
+    """
+    构建hybrid检索参数，BM25与向量的融合在Weaviate中一次查询完成
+    :param search_mode: hybrid(BM25+向量融合) / vector(纯向量)
+    :param alpha: 向量的权重，0为纯BM25，1为纯向量
+    :param fusion_type: 融合方式 relative_score / ranked
+    :param bm25_properties: 参与BM25的字段，支持 title^2 形式的权重，为空时使用全部文本字段
+    :return: 透传给collection.query.hybrid的参数
+    """
+    if search_mode == "vector":
+        return {"alpha": 1}
+    if search_mode != "hybrid":
+        raise ValueError(f"Unsupported search mode: {search_mode}")
+    if fusion_type not in HYBRID_FUSION_TYPES:
+        raise ValueError(f"Unsupported fusion type: {fusion_type}")
+    return {
+        "alpha": alpha,
+        "fusion_type": HYBRID_FUSION_TYPES[fusion_type],
+        "query_properties": bm25_properties or None,
+    }
+
+
+class AsyncWeaviateVectorStore:
+    """
+    基于Weaviate异步客户端的只读向量库适配器
+    查询方式与WeaviateVectorStore.similarity_search_with_score一致(hybrid检索，返回融合分数)，
+    所有实例共享当前事件循环的异步客户端，多命名空间并发查询不再占用线程池
+    """
+
+    def __init__(
+            self,
+            index_name: str,
+            embedding: Embeddings,
+            text_key: str = "text",
+            namespace: Optional[str] = None,
+            knowledge_type: Optional[str] = None,
+    ):
+        """
+        :param index_name: 独占collection名称
+        :param namespace: 命名空间，为空时不查询存放位置，总是使用独占collection
+        :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+        """
+        self.index_name = index_name
+        self.embedding = embedding
+        self.text_key = text_key
+        self.namespace = namespace
+        self.knowledge_type = knowledge_type
+        # (collection名称, tenant)，存放位置确定后缓存，迁移时通过注册表失效
+        self._placement: Optional[tuple[str, Optional[str]]] = None
+        # (变换配置,)，读取一次后缓存，修改配置时通过注册表失效
+        self._transform: Optional[tuple[Optional[EmbeddingTransform]]] = None
+
+    async def _resolve(self) -> tuple[str, Optional[str]]:
+        """
+        按api写入时记录的存放位置选择独占collection或共享collection中的tenant
+        还没有记录时不缓存，知识库首次写入后重新查询
+        """
+        if self._placement is not None:
+            return self._placement
+        if self.namespace is None:
+            return self.index_name, None
+        placement = await de_duplicator.redis_client.hget(
+            PLACEMENT_KEY.format(self.knowledge_type), self.namespace
+        )
+        if placement == "shared":
+            self._placement = (SHARED_COLLECTION_NAMES[self.knowledge_type], self.namespace)
+        elif placement:
+            self._placement = (self.index_name, None)
+        return self._placement or (self.index_name, None)
+
+    async def atransform_query(self, vector: list[float]) -> list[float]:
+        """知识库配置了降维/量化时，对查询向量执行与写入时相同的变换"""
+        if self._transform is None:
+            if self.namespace is None:
+                self._transform = (None,)
+            else:
+                self._transform = (await aget_transform(self.namespace, self.knowledge_type),)
+        transform = self._transform[0]
+        return vector if transform is None else transform.apply_query(vector)
+
+    async def _query(self, method: str, **kwargs: Any):
+        """执行查询，知识库还没有写入过数据时collection/tenant不存在，返回None"""
+        client = await get_async_weaviate_client()
+        index_name, weaviate_tenant = await self._resolve()
+        collection = client.collections.get(index_name)
+        try:
+            if weaviate_tenant is None:
+                return await getattr(collection.query, method)(**kwargs)
+            return await getattr(collection.with_tenant(weaviate_tenant).query, method)(**kwargs)
+        except WeaviateQueryError as e:
+            if not await client.collections.exists(index_name):
+                return None
+            if weaviate_tenant is not None and not await collection.tenants.exists(weaviate_tenant):
+                return None
+            raise ValueError(f"Error during query: {e}")
+
+    async def afetch_objects(self, batch_size: int = 500, max_objects: Optional[int] = None) -> list:
+        """
+        按uuid游标分页读取全部对象(含向量)
+        :param batch_size: 每页数量
+        :param max_objects: 读取超过该数量后停止，用于判断是否适合加载到进程内
+        :return: 对象列表，collection/tenant不存在时为空
+        """
+        objects = []
+        after = None
+        while True:
+            result = await self._query("fetch_objects", limit=batch_size, after=after, include_vector=True)
+            if result is None:
+                return objects
+            objects.extend(result.objects)
+            if len(result.objects) < batch_size or (max_objects is not None and len(objects) > max_objects):
+                return objects
+            after = result.objects[-1].uuid
+
+    def _to_document(self, obj) -> Document:
+        properties = dict(obj.properties)
+        text = properties.pop(self.text_key)
+        metadata = {
+            key: value
+            for key, value in obj.metadata.__dict__.items()
+            if value is not None and key not in ("score", "distance")
+        }
+        return Document(page_content=text, metadata={**properties, **metadata})
+
+    async def asimilarity_search_by_vector_with_score(
+            self,
+            vector: list[float],
+            k: int = 4,
+            query: Optional[str] = None,
+            **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """
+        按向量检索
+        :param vector: 查询向量(Embedding模型的原始输出，知识库的变换在这里执行)
+        :param k: 返回数量
+        :param query: 查询文本，用于hybrid中的BM25部分
+        :param kwargs: 透传给collection.query.hybrid的参数
+        :return: [(文档, 分数)]，分数为collection内归一化后的融合分数
+        """
+        kwargs.setdefault("return_metadata", ["score"])
+        vector = await self.atransform_query(vector)
+        result = await self._query("hybrid", query=query, vector=vector, limit=k, **kwargs)
+        if result is None:
+            return []
+        return [(self._to_document(obj), obj.metadata.score) for obj in result.objects]
+
+    async def asimilarity_search_by_vector_with_relevance(
+            self,
+            vector: list[float],
+            k: int = 4,
+            **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """
+        纯向量检索
+        :param vector: 查询向量
+        :param k: 返回数量
+        :param kwargs: 透传给collection.query.near_vector的参数
+        :return: [(文档, 分数)]，分数为余弦相似度(1-余弦距离)，不同collection之间可以直接比较
+        """
+        kwargs.setdefault("return_metadata", ["distance"])
+        vector = await self.atransform_query(vector)
+        result = await self._query("near_vector", near_vector=vector, limit=k, **kwargs)
+        if result is None:
+            return []
+        return [(self._to_document(obj), 1 - obj.metadata.distance) for obj in result.objects]
+
+    async def asimilarity_search_with_score(
+            self,
+            query: str,
+            k: int = 4,
+            **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        vector = await self.embedding.aembed_query(query)
+        return await self.asimilarity_search_by_vector_with_score(vector, k=k, query=query, **kwargs)
+
+
+# 异步适配器创建时不访问Weaviate，与同步实例共用同一个失效广播频道
+async_vector_store_registry = VectorStoreRegistry(
+    factory=lambda tenant, namespace, knowledge_type: AsyncWeaviateVectorStore(
+        index_name=get_collection_name(namespace, knowledge_type),
+        embedding=embedding,
+        namespace=namespace,
+        knowledge_type=knowledge_type,
+    ),
+    ttl=float(os.getenv('VECTOR_STORE_REGISTRY_TTL', 300)),
+    max_size=int(os.getenv('VECTOR_STORE_REGISTRY_MAX_SIZE', 1000)),
+    client=redis_client,
+)
+
+
+def get_async_vector_store(
+        tenant: str,
+        namespace: str,
+        knowledge_type: str
+) -> AsyncWeaviateVectorStore:
+    return async_vector_store_registry.get(tenant, namespace, knowledge_type)
+
+
+def get_async_vector_stores(
+        tenant: str,
+        namespace_list: list,
+        knowledge_type: str = "common"
+) -> list[AsyncWeaviateVectorStore]:
+    """
+    一个机器人学习多个namespace(异步检索)
+    :param tenant: 租户
+    :param namespace_list: 多个namespace
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :return:
+    """
+    return [
+        get_async_vector_store(tenant=tenant, namespace=namespace, knowledge_type=knowledge_type)
+        for namespace in namespace_list
+    ]
+
+
+async def amulti_namespace_search(
+        tenant: str,
+        namespace_list: list,
+        query: str,
+        k: int = 4,
+        knowledge_type: str = "common",
+        vector: Optional[list[float]] = None,
+) -> list[tuple[Document, float]]:
+    """
+    多命名空间全局检索
+    查询只Embedding一次，各collection并发做纯向量检索，按余弦相似度合并出全局top-k，
+    并在metadata中写入全局一致的embedding_rank/embedding_score
+    :param tenant: 租户
+    :param namespace_list: 多个namespace
+    :param query: 查询文本
+    :param k: 全局返回数量
+    :param knowledge_type: 知识类型：1.常规知识 2.工具知识
+    :param vector: 已经计算好的查询向量，为空时对query做Embedding
+    :return: 按分数降序的 [(文档, 分数)]
+    """
+    if not namespace_list:
+        return []
+    if vector is None:
+        vector = await query_embedding_cache.aembed_query(query)
+    stores = get_async_vector_stores(tenant=tenant, namespace_list=namespace_list, knowledge_type=knowledge_type)
+    results = await asyncio.gather(*[
+        store.asimilarity_search_by_vector_with_relevance(vector, k=k)
+        for store in stores
+    ])
+    top_k = heapq.nlargest(
+        k,
+        (item for sublist in results for item in sublist),
+        key=lambda item: item[1],
+    )
+    for rank, (doc, score) in enumerate(top_k):
+        doc.metadata["embedding_rank"] = rank
+        doc.metadata["embedding_score"] = score
+    return top_k
+
+
 if __name__ == '__main__':
     vectorstore = get_vector_store(
         tenant="tenant1",
@@ -12,7 +12,7 @@ def readme():
 
 setup(
     name="ai-native-core",             # PyPI 上的发布名
-    version="0.0.6",              # 版本
+    version="0.0.7",              # 版本
     description="A LLMOps Platform's native core",
     long_description=readme(),
     long_description_content_type="text/markdown",
@@ -32,6 +32,7 @@ setup(
         "redis",
         "tang-yuan-mlops-sdk",
         "python-dotenv",
+        "numpy",
         # 如果有其他依赖，也在此处增加
     ],
     classifiers=[
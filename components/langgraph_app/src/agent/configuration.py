@@ -32,6 +32,16 @@ class RagConfig:
     rerank_threshold: float = 0.4
     is_llm_rerank: bool = True
     namespace_list: list[str] = field(default_factory=lambda: ["namespace1"])
+    # 多命名空间全局检索: 纯向量检索按余弦相似度全局排序，retrieve_top_n为全局数量
+    is_global_retrieve: bool = False
+    # 检索方式: hybrid(BM25+向量融合) / vector(纯向量)，全局检索时固定为纯向量
+    search_mode: str = "hybrid"
+    # hybrid中向量的权重，0为纯BM25，1为纯向量
+    hybrid_alpha: float = 0.75
+    # 融合方式: relative_score / ranked
+    hybrid_fusion_type: str = "relative_score"
+    # 参与BM25的字段，支持 title^2 形式的权重，为空时使用全部文本字段
+    bm25_properties: list[str] = field(default_factory=list)
     is_structured_output: bool = True
 
 
@@ -46,6 +56,18 @@ class ToolConfig:
     is_llm_rerank: bool = True
     max_iterations: int = 3
     namespace_list: list[str] = field(default_factory=lambda: ["namespace1"])
+    # 多命名空间全局检索: 纯向量检索按余弦相似度全局排序，retrieve_top_n为全局数量
+    is_global_retrieve: bool = False
+    # 检索方式: hybrid(BM25+向量融合) / vector(纯向量)，全局检索时固定为纯向量
+    search_mode: str = "hybrid"
+    # hybrid中向量的权重，0为纯BM25，1为纯向量
+    hybrid_alpha: float = 0.75
+    # 融合方式: relative_score / ranked
+    hybrid_fusion_type: str = "relative_score"
+    # 参与BM25的字段，支持 title^2 形式的权重，为空时使用全部文本字段
+    bm25_properties: list[str] = field(default_factory=list)
+    # 使用agent进程内的向量索引检索(纯向量，分数为余弦相似度)，工具变更后自动重新加载
+    is_local_index: bool = False
 
 
 @dataclass(kw_only=True)
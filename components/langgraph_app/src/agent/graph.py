@@ -11,6 +11,7 @@ from agent.rag import get_rag_knowledge_context, rag_prompt_template, RAGAnswer,
 from agent.state import State, OutputState, InputState
 from agent.tool import tool_knowledge_retrieve, tool_knowledge_rerank, tool_knowledge_llm_rerank, get_agent
 from ai_native_core.model import last_model
+from ai_native_core.utils.query_embedding import query_embedding_cache
 
 # from settings import langsmith_token
 #
@@ -32,12 +33,17 @@ async def query_analysis(state: State, config):
     """分析用户的问题"""
     # 这里可以添加一些问题分析的逻辑
     # 比如判断问题的类型,是否需要使用RAG等
-    return {
+    configuration = Configuration.from_runnable_config(config)
+    result = {
         "messages": {
             "role": "human",
             "content": state["question"],
         }
     }
+    # 两个检索分支共用同一个查询向量
+    if configuration.rag_config.is_rag or configuration.tool_config.is_rag:
+        result["question_embedding"] = await query_embedding_cache.aembed_query(state["question"])
+    return result
 
 
 async def generate(state: State, config):
@@ -8,7 +8,8 @@ from agent.configuration import Configuration
 from agent.state import State
 from ai_native_core.model import knowledge_rerank_model
 from ai_native_core.rerank import reranker
-from ai_native_core.utils.vector_store import get_vector_stores
+from ai_native_core.utils.query_embedding import query_embedding_cache
+from ai_native_core.utils.vector_store import amulti_namespace_search, get_async_vector_stores, get_hybrid_kwargs
 
 
 class RAGAnswer(BaseModel):
@@ -78,24 +79,41 @@ async def common_knowledge_retrieve(state: State, config):
     question = state["question"]
     if not configuration.rag_config.is_rag:
         return {"context": []}
-    # TODO:内置的weaviate需要改成async
-    vector_store_list = get_vector_stores(
-        tenant=configuration.sys_config.tenant_id,
-        namespace_list=configuration.rag_config.namespace_list
-    )
-    tasks = [
-        vector_store.asimilarity_search_with_score(
-            question,
-            k=configuration.tool_config.retrieve_top_n
+    question_embedding = state.get("question_embedding") or await query_embedding_cache.aembed_query(question)
+    if configuration.rag_config.is_global_retrieve:
+        retrieved_docs = await amulti_namespace_search(
+            tenant=configuration.sys_config.tenant_id,
+            namespace_list=configuration.rag_config.namespace_list,
+            query=question,
+            k=configuration.rag_config.retrieve_top_n,
+            vector=question_embedding,
         )
-        for vector_store in vector_store_list
-    ]
-    results = await asyncio.gather(*tasks)
-    retrieved_docs = [item for sublist in results for item in sublist]
-    # score to meta data
-    for rank, (doc, score) in enumerate(retrieved_docs):
-        doc.metadata["embedding_rank"] = rank
-        doc.metadata["embedding_score"] = score
+    else:
+        vector_store_list = get_async_vector_stores(
+            tenant=configuration.sys_config.tenant_id,
+            namespace_list=configuration.rag_config.namespace_list
+        )
+        hybrid_kwargs = get_hybrid_kwargs(
+            search_mode=configuration.rag_config.search_mode,
+            alpha=configuration.rag_config.hybrid_alpha,
+            fusion_type=configuration.rag_config.hybrid_fusion_type,
+            bm25_properties=configuration.rag_config.bm25_properties,
+        )
+        tasks = [
+            vector_store.asimilarity_search_by_vector_with_score(
+                question_embedding,
+                k=configuration.rag_config.retrieve_top_n,
+                query=question,
+                **hybrid_kwargs,
+            )
+            for vector_store in vector_store_list
+        ]
+        results = await asyncio.gather(*tasks)
+        retrieved_docs = [item for sublist in results for item in sublist]
+        # score to meta data
+        for rank, (doc, score) in enumerate(retrieved_docs):
+            doc.metadata["embedding_rank"] = rank
+            doc.metadata["embedding_score"] = score
     filtered_docs = [
         doc for doc, score in retrieved_docs if score >= configuration.rag_config.retrieve_threshold
     ]
@@ -21,3 +21,5 @@ class State(InputState, OutputState):
     messages: Annotated[list[AnyMessage], add_messages]
     context: List[Document]
     tool_context: List[Document]
+    # 问题的查询向量，query_analysis中计算一次，常规知识与工具知识检索共用
+    question_embedding: List[float]
@@ -12,7 +12,9 @@ from agent.state import State
 from agent.utils import create_dynamic_tool
 from ai_native_core.model import knowledge_rerank_model, last_model
 from ai_native_core.rerank import reranker
-from ai_native_core.utils.vector_store import get_vector_stores
+from ai_native_core.utils.local_index import local_tool_index
+from ai_native_core.utils.query_embedding import query_embedding_cache
+from ai_native_core.utils.vector_store import amulti_namespace_search, get_async_vector_stores, get_hybrid_kwargs
 
 
 def get_tool_context(context: list) -> str:
@@ -91,25 +93,51 @@ async def tool_knowledge_retrieve(state: State, config):
     question = state["question"]
     if not configuration.tool_config.is_rag:
         return {"tool_context": []}
-    # TODO:内置的weaviate需要改成async
-    vector_store_list = get_vector_stores(
-        tenant=configuration.sys_config.tenant_id,
-        namespace_list=configuration.tool_config.namespace_list,
-        knowledge_type="tool"
-    )
-    tasks = [
-        vector_store.asimilarity_search_with_score(
-            question,
-            k=configuration.tool_config.retrieve_top_n
+    question_embedding = state.get("question_embedding") or await query_embedding_cache.aembed_query(question)
+    if configuration.tool_config.is_local_index:
+        retrieved_docs = await local_tool_index.amulti_namespace_search(
+            tenant=configuration.sys_config.tenant_id,
+            namespace_list=configuration.tool_config.namespace_list,
+            vector=question_embedding,
+            k=configuration.tool_config.retrieve_top_n,
+            is_global=configuration.tool_config.is_global_retrieve,
         )
-        for vector_store in vector_store_list
-    ]
-    results = await asyncio.gather(*tasks)
-    retrieved_docs = [item for sublist in results for item in sublist]
-    # score to meta data
-    for rank, (doc, score) in enumerate(retrieved_docs):
-        doc.metadata["embedding_rank"] = rank
-        doc.metadata["embedding_score"] = score
+    elif configuration.tool_config.is_global_retrieve:
+        retrieved_docs = await amulti_namespace_search(
+            tenant=configuration.sys_config.tenant_id,
+            namespace_list=configuration.tool_config.namespace_list,
+            query=question,
+            k=configuration.tool_config.retrieve_top_n,
+            vector=question_embedding,
+            knowledge_type="tool",
+        )
+    else:
+        vector_store_list = get_async_vector_stores(
+            tenant=configuration.sys_config.tenant_id,
+            namespace_list=configuration.tool_config.namespace_list,
+            knowledge_type="tool"
+        )
+        hybrid_kwargs = get_hybrid_kwargs(
+            search_mode=configuration.tool_config.search_mode,
+            alpha=configuration.tool_config.hybrid_alpha,
+            fusion_type=configuration.tool_config.hybrid_fusion_type,
+            bm25_properties=configuration.tool_config.bm25_properties,
+        )
+        tasks = [
+            vector_store.asimilarity_search_by_vector_with_score(
+                question_embedding,
+                k=configuration.tool_config.retrieve_top_n,
+                query=question,
+                **hybrid_kwargs,
+            )
+            for vector_store in vector_store_list
+        ]
+        results = await asyncio.gather(*tasks)
+        retrieved_docs = [item for sublist in results for item in sublist]
+        # score to meta data
+        for rank, (doc, score) in enumerate(retrieved_docs):
+            doc.metadata["embedding_rank"] = rank
+            doc.metadata["embedding_score"] = score
     filtered_docs = [
         doc for doc, score in retrieved_docs if score >= configuration.tool_config.retrieve_threshold
     ]